@@ -319,3 +319,7 @@ WHERE harga_beli = 0 OR harga_beli IS NULL;
 
 ALTER TABLE produk
 ALTER COLUMN harga_beli SET NOT NULL;
+
+--Perubahan skema berikutnya (constraint stok, trigger katalog, indeks pencarian,
+--kode barang, v_harga_efektif, dst.) diterapkan oleh migrasi aplikasi:
+--    python "Projek FarmTech.py" --migrasi
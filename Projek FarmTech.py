@@ -1,8 +1,17 @@
 import sys
-from datetime import datetime, date
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation
 from getpass import getpass
 import psycopg2
+import psycopg2.pool
 import os
+import re
+import csv
+import tempfile
+import heapq
 
 try:
     from tabulate import tabulate
@@ -27,6 +36,25 @@ except Exception:
     def show_banner():
         print("\n=== FARMTECH ===\n")
 
+try:
+    # opsional, hanya untuk ekspor Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
+
+try:
+    # opsional, hanya untuk impor XLSX
+    import openpyxl
+except Exception:
+    openpyxl = None
+
+try:
+    # opsional, untuk peramalan permintaan & titik pesan ulang
+    import numpy as np
+except Exception:
+    np = None
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -37,17 +65,845 @@ DB_HOST = "localhost"
 DB_NAME = "NamaDB"
 DB_USER = "postgres"
 DB_PASS = "PWDB"
-DB_PORT = 5432 --Default
+DB_PORT = 5432 # Default
+
+# Pool koneksi (dipakai bersama oleh semua menu)
+POOL_MIN = 1            # koneksi yang selalu disiapkan
+POOL_MAX = 5            # batas koneksi terbuka sekaligus
+POOL_TIMEOUT = 10       # detik menunggu koneksi bebas sebelum menyerah
+POOL_CEK_SETELAH = 30   # detik menganggur sebelum koneksi dicek dengan SELECT 1
+POOL_IDLE_MAKS = 600    # detik menganggur sebelum koneksi ditutup / didaur ulang
+
+# OperationalError juga mencakup deadlock & query dibatalkan; yang menentukan
+# koneksi benar-benar putus adalah conn.closed (lihat koneksi_putus)
+KONEKSI_PUTUS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+def koneksi_putus(conn):
+    """True jika koneksi hilang / tidak pernah didapat, bukan sekadar galat query."""
+    return conn is None or conn.closed != 0
+
+POOL = None
+
+def buka_koneksi():
+    return psycopg2.connect(host=DB_HOST,dbname=DB_NAME,user=DB_USER,password=DB_PASS,port=DB_PORT)
 
 def connect_db():
     try:
-        conn = psycopg2.connect(host=DB_HOST,dbname=DB_NAME,user=DB_USER,password=DB_PASS,port=DB_PORT)
+        conn = buka_koneksi()
         print("Berhasil koneksi ke database.")
         return conn
     except Exception as e:
         print("Gagal koneksi ke database.", e)
         return None
 
+class PoolKoneksi:
+    """
+    Pool koneksi sederhana untuk banyak terminal kasir:
+    - minimal/maksimal koneksi terbuka
+    - koneksi yang lama menganggur dicek (SELECT 1) sebelum dipinjamkan
+    - koneksi yang terlalu lama menganggur ditutup (sisa minimal didaur ulang)
+    - peminjaman menunggu paling lama `timeout` detik
+    - koneksi rusak dibuang dan diganti otomatis
+    """
+    def __init__(self, minimal=POOL_MIN, maksimal=POOL_MAX, timeout=POOL_TIMEOUT,
+                 cek_setelah=POOL_CEK_SETELAH, idle_maks=POOL_IDLE_MAKS):
+        self.minimal = minimal
+        self.maksimal = maksimal
+        self.timeout = timeout
+        self.cek_setelah = cek_setelah
+        self.idle_maks = idle_maks
+        self._kond = threading.Condition()
+        self._bebas = []        # [(conn, waktu_kembali)], paling baru di akhir
+        self._terbuka = 0       # koneksi bebas + dipinjam
+        self.statistik = {
+            "checkout": 0,
+            "tunggu_total": 0.0,
+            "tunggu_maks": 0.0,
+            "timeout": 0,
+            "dibuat": 0,
+            "diganti": 0,
+            "didaur_ulang": 0,
+        }
+        for _ in range(minimal):
+            self._bebas.append((self._buat(), time.monotonic()))
+            self._terbuka += 1
+
+    def _buat(self):
+        conn = buka_koneksi()
+        self.statistik["dibuat"] += 1
+        return conn
+
+    def _sehat(self, conn):
+        if conn.closed:
+            return False
+        try:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _tutup(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def ambil(self):
+        """
+        Pinjam satu koneksi. Menunggu jika pool penuh, lempar PoolError jika timeout.
+        """
+        mulai = time.monotonic()
+        batas = mulai + self.timeout
+        with self._kond:
+            while True:
+                if self._bebas:
+                    conn, waktu = self._bebas.pop()
+                    break
+                if self._terbuka < self.maksimal:
+                    conn, waktu = None, None
+                    self._terbuka += 1
+                    break
+                sisa = batas - time.monotonic()
+                if sisa <= 0:
+                    self.statistik["timeout"] += 1
+                    raise psycopg2.pool.PoolError(
+                        f"Tidak ada koneksi bebas dalam {self.timeout} detik.")
+                self._kond.wait(sisa)
+
+            tunggu = time.monotonic() - mulai
+            self.statistik["checkout"] += 1
+            self.statistik["tunggu_total"] += tunggu
+            self.statistik["tunggu_maks"] = max(self.statistik["tunggu_maks"], tunggu)
+
+        # buat / cek koneksi di luar lock supaya peminjam lain tidak ikut menunggu
+        try:
+            if conn is None:
+                return self._buat()
+
+            idle = time.monotonic() - waktu
+            if idle > self.idle_maks:
+                self._tutup(conn)
+                self.statistik["didaur_ulang"] += 1
+                return self._buat()
+            if conn.closed or (idle > self.cek_setelah and not self._sehat(conn)):
+                self._tutup(conn)
+                self.statistik["diganti"] += 1
+                return self._buat()
+            return conn
+        except Exception:
+            with self._kond:
+                self._terbuka -= 1
+                self._kond.notify()
+            raise
+
+    def kembalikan(self, conn, rusak=False):
+        if not rusak and not conn.closed:
+            try:
+                # jangan bawa transaksi yang menggantung ke peminjam berikutnya
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                rusak = True
+
+        with self._kond:
+            if rusak or conn.closed:
+                self._tutup(conn)
+                self._terbuka -= 1
+                self.statistik["diganti"] += 1
+            else:
+                self._bebas.append((conn, time.monotonic()))
+            self._bersihkan_idle()
+            self._kond.notify()
+
+    def _bersihkan_idle(self):
+        # tutup koneksi menganggur yang melebihi batas, sisakan sebanyak `minimal`
+        sekarang = time.monotonic()
+        sisa = []
+        for conn, waktu in self._bebas:
+            if sekarang - waktu > self.idle_maks and self._terbuka > self.minimal:
+                self._tutup(conn)
+                self._terbuka -= 1
+                self.statistik["didaur_ulang"] += 1
+            else:
+                sisa.append((conn, waktu))
+        self._bebas = sisa
+
+    @contextmanager
+    def pinjam(self):
+        """
+        with POOL.pinjam() as (conn, cur): ...
+        Koneksi otomatis dikembalikan; jika putus di tengah jalan, koneksi dibuang.
+        """
+        conn = self.ambil()
+        rusak = False
+        cur = None
+        try:
+            cur = conn.cursor()
+            yield conn, cur
+        except KONEKSI_PUTUS:
+            rusak = koneksi_putus(conn)
+            raise
+        finally:
+            if cur is not None and not cur.closed:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+            self.kembalikan(conn, rusak)
+
+    def info(self):
+        with self._kond:
+            st = dict(self.statistik)
+            st["terbuka"] = self._terbuka
+            st["bebas"] = len(self._bebas)
+            st["dipinjam"] = self._terbuka - len(self._bebas)
+        st["tunggu_rata"] = st["tunggu_total"] / st["checkout"] if st["checkout"] else 0.0
+        return st
+
+    def tutup_semua(self):
+        with self._kond:
+            for conn, _ in self._bebas:
+                self._tutup(conn)
+            self._terbuka -= len(self._bebas)
+            self._bebas = []
+
+def tampilkan_status_pool():
+    if POOL is None:
+        print("Pool koneksi belum aktif.")
+        return
+    st = POOL.info()
+    rows = [
+        ["Koneksi terbuka", f"{st['terbuka']} (maks {POOL.maksimal})"],
+        ["Sedang dipinjam", st["dipinjam"]],
+        ["Bebas", st["bebas"]],
+        ["Jumlah checkout", st["checkout"]],
+        ["Rata-rata tunggu", f"{st['tunggu_rata'] * 1000:.1f} ms"],
+        ["Tunggu terlama", f"{st['tunggu_maks'] * 1000:.1f} ms"],
+        ["Checkout timeout", st["timeout"]],
+        ["Koneksi dibuat", st["dibuat"]],
+        ["Koneksi rusak diganti", st["diganti"]],
+        ["Koneksi didaur ulang", st["didaur_ulang"]],
+    ]
+    print(tabulate(rows, headers=["Item", "Nilai"], tablefmt="grid"))
+
+# -------------------------
+# Migrasi skema
+# -------------------------
+# Statistik penjualan per produk dihitung ulang dari histori; dipakai migrasi 8
+# (isi awal) dan --cek-terjual --perbaiki.
+SQL_ISI_STATISTIK_PENJUALAN = """
+    UPDATE produk p
+    SET terakhir_terjual = x.terakhir, total_terjual = x.total
+    FROM (
+        SELECT p2.produk_id, MAX(tp.tanggal_transaksi) AS terakhir, COALESCE(SUM(dp.qty), 0) AS total
+        FROM produk p2
+        LEFT JOIN detail_penjualan dp ON dp.produk_id = p2.produk_id
+        LEFT JOIN penjualan tp ON tp.penjualan_id = dp.penjualan_id
+        GROUP BY p2.produk_id
+    ) x
+    WHERE p.produk_id = x.produk_id
+    AND (p.terakhir_terjual IS DISTINCT FROM x.terakhir OR p.total_terjual <> x.total);
+
+    DELETE FROM penjualan_produk_harian;
+    INSERT INTO penjualan_produk_harian (tanggal, produk_id, qty)
+    SELECT tp.tanggal_transaksi::date, dp.produk_id, SUM(dp.qty)
+    FROM penjualan tp
+    JOIN detail_penjualan dp ON dp.penjualan_id = tp.penjualan_id
+    GROUP BY 1, 2;
+"""
+
+# Tabel dasar dibuat dari FarmTechFix.sql; semua perubahan skema sesudahnya ada di
+# MIGRASI dengan nomor versi baru; migrasi yang sudah dirilis jangan diubah.
+# Setiap migrasi dijalankan dalam satu transaksi dan dicatat di schema_migrasi.
+MIGRASI = [
+    (0, "Skema aplikasi awal: stok >= 0, notifikasi katalog, indeks pencarian, kode barang, harga efektif", """
+        -- idempoten: database lama sudah punya objek ini dari FarmTechFix.sql dan mungkin
+        -- sudah menjalankan migrasi 4 & 9, jadi fungsi/view hanya dibuat bila belum ada
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conname = 'cek_stok_tidak_minus'
+                             AND conrelid = 'produk'::regclass) THEN
+                ALTER TABLE produk ADD CONSTRAINT cek_stok_tidak_minus CHECK (stok >= 0);
+            END IF;
+
+            IF to_regprocedure('notify_katalog_produk()') IS NULL THEN
+                EXECUTE $f$
+                    CREATE FUNCTION notify_katalog_produk() RETURNS trigger AS $b$
+                    BEGIN
+                        IF TG_OP = 'DELETE' THEN
+                            PERFORM pg_notify('katalog_produk', OLD.produk_id::text);
+                        ELSE
+                            PERFORM pg_notify('katalog_produk', NEW.produk_id::text);
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $b$ LANGUAGE plpgsql
+                $f$;
+            END IF;
+
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS idx_produk_nama_trgm
+                    ON produk USING gin (nama_produk gin_trgm_ops);
+            END IF;
+        END;
+        $$;
+
+        CREATE OR REPLACE TRIGGER trg_produk_katalog
+        AFTER INSERT OR UPDATE OR DELETE ON produk
+        FOR EACH ROW EXECUTE FUNCTION notify_katalog_produk();
+
+        CREATE OR REPLACE TRIGGER trg_barang_tidak_laku_katalog
+        AFTER INSERT OR UPDATE OR DELETE ON barang_tidak_laku
+        FOR EACH ROW EXECUTE FUNCTION notify_katalog_produk();
+
+        -- picker produk & supplier per halaman
+        CREATE INDEX IF NOT EXISTS idx_produk_nama_awalan ON produk (lower(nama_produk) text_pattern_ops);
+        CREATE INDEX IF NOT EXISTS idx_produk_kategori ON produk (lower(kategori));
+        CREATE INDEX IF NOT EXISTS idx_produk_supplier ON produk (supplier_id);
+        CREATE INDEX IF NOT EXISTS idx_supplier_nama_awalan ON supplier (lower(nama_supplier) text_pattern_ops);
+
+        -- kode barang / barcode untuk scan di kasir & restock
+        ALTER TABLE produk ADD COLUMN IF NOT EXISTS kode_barang VARCHAR(50);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_produk_kode_barang ON produk (kode_barang);
+
+        -- satu sumber harga efektif; migrasi 9 menambahkan batas harga beli
+        DO $$
+        BEGIN
+            IF to_regclass('v_harga_efektif') IS NULL THEN
+                CREATE VIEW v_harga_efektif AS
+                SELECT
+                    p.produk_id,
+                    p.harga AS harga_dasar,
+                    COALESCE(b.diskon_otomatis, 0) AS diskon,
+                    p.harga * (100 - COALESCE(b.diskon_otomatis, 0)) / 100 AS harga_akhir
+                FROM produk p
+                LEFT JOIN barang_tidak_laku b ON b.produk_id = p.produk_id;
+            END IF;
+        END;
+        $$;
+    """),
+    (1, "Indeks untuk lookup dan laporan", """
+        -- lookup saat login / transaksi
+        CREATE INDEX IF NOT EXISTS idx_member_no_hp ON member (no_hp);
+        CREATE INDEX IF NOT EXISTS idx_pegawai_user_role ON pegawai (user_role_id);
+        CREATE INDEX IF NOT EXISTS idx_user_role_user ON user_role (user_id);
+        CREATE INDEX IF NOT EXISTS idx_user_role_role ON user_role (role_id);
+
+        -- penjualan & pembelian (laporan periode, cek sebelum hapus, join detail)
+        CREATE INDEX IF NOT EXISTS idx_penjualan_tanggal ON penjualan (tanggal_transaksi);
+        CREATE INDEX IF NOT EXISTS idx_penjualan_member ON penjualan (member_id);
+        CREATE INDEX IF NOT EXISTS idx_penjualan_kasir ON penjualan (kasir_id);
+        CREATE INDEX IF NOT EXISTS idx_detail_penjualan_penjualan ON detail_penjualan (penjualan_id);
+        CREATE INDEX IF NOT EXISTS idx_detail_penjualan_produk ON detail_penjualan (produk_id);
+        CREATE INDEX IF NOT EXISTS idx_pembelian_tanggal ON pembelian (tanggal_pembelian);
+        CREATE INDEX IF NOT EXISTS idx_pembelian_supplier ON pembelian (supplier_id);
+        CREATE INDEX IF NOT EXISTS idx_detail_pembelian_pembelian ON detail_pembelian (pembelian_id);
+        CREATE INDEX IF NOT EXISTS idx_detail_pembelian_produk ON detail_pembelian (produk_id);
+
+        -- servis: daftar servis terbuka hanya menyentuh status Proses/Selesai
+        CREATE INDEX IF NOT EXISTS idx_servis_terbuka ON servis (servis_id)
+            WHERE status_servis IN ('Proses', 'Selesai');
+        CREATE INDEX IF NOT EXISTS idx_servis_teknisi_status ON servis (teknisi_id, status_servis);
+        CREATE INDEX IF NOT EXISTS idx_servis_selesai ON servis (tanggal_selesai)
+            WHERE status_servis IN ('Selesai', 'Diambil');
+        CREATE INDEX IF NOT EXISTS idx_servis_member ON servis (member_id);
+    """),
+    (2, "Waktu transaksi penjualan/pembelian disimpan sebagai TIMESTAMP", """
+        -- aplikasi selalu menyimpan NOW(); kolom DATE membuang jam transaksi
+        ALTER TABLE penjualan ALTER COLUMN tanggal_transaksi TYPE TIMESTAMP;
+        ALTER TABLE pembelian ALTER COLUMN tanggal_pembelian TYPE TIMESTAMP;
+    """),
+    (3, "Ringkasan penjualan & pembelian harian", """
+        CREATE TABLE IF NOT EXISTS ringkasan_penjualan_harian (
+            tanggal DATE NOT NULL,
+            kasir_id INT NOT NULL,
+            is_member BOOLEAN NOT NULL,
+            jumlah_transaksi INT NOT NULL,
+            subtotal BIGINT NOT NULL,
+            ppn BIGINT NOT NULL,
+            diskon BIGINT NOT NULL,
+            pendapatan BIGINT NOT NULL,
+            PRIMARY KEY (tanggal, kasir_id, is_member)
+        );
+        CREATE TABLE IF NOT EXISTS ringkasan_pembelian_harian (
+            tanggal DATE NOT NULL,
+            supplier_id INT NOT NULL,
+            jumlah_pembelian INT NOT NULL,
+            total_pembelian BIGINT NOT NULL,
+            PRIMARY KEY (tanggal, supplier_id)
+        );
+
+        -- dijaga saat tulis: setiap insert/update/delete header ikut mengubah ringkasan
+        CREATE OR REPLACE FUNCTION ringkas_penjualan() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE ringkasan_penjualan_harian
+                SET jumlah_transaksi = jumlah_transaksi - 1,
+                    subtotal = subtotal - OLD.subtotal,
+                    ppn = ppn - OLD.ppn,
+                    diskon = diskon - COALESCE(OLD.diskon, 0),
+                    pendapatan = pendapatan - OLD.total_harga
+                WHERE tanggal = OLD.tanggal_transaksi::date
+                  AND kasir_id = OLD.kasir_id
+                  AND is_member = (OLD.member_id IS NOT NULL);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO ringkasan_penjualan_harian AS r
+                VALUES (NEW.tanggal_transaksi::date, NEW.kasir_id, NEW.member_id IS NOT NULL,
+                        1, NEW.subtotal, NEW.ppn, COALESCE(NEW.diskon, 0), NEW.total_harga)
+                ON CONFLICT (tanggal, kasir_id, is_member) DO UPDATE
+                SET jumlah_transaksi = r.jumlah_transaksi + 1,
+                    subtotal = r.subtotal + EXCLUDED.subtotal,
+                    ppn = r.ppn + EXCLUDED.ppn,
+                    diskon = r.diskon + EXCLUDED.diskon,
+                    pendapatan = r.pendapatan + EXCLUDED.pendapatan;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION ringkas_pembelian() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE ringkasan_pembelian_harian
+                SET jumlah_pembelian = jumlah_pembelian - 1,
+                    total_pembelian = total_pembelian - OLD.total_pembelian
+                WHERE tanggal = OLD.tanggal_pembelian::date
+                  AND supplier_id = OLD.supplier_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO ringkasan_pembelian_harian AS r
+                VALUES (NEW.tanggal_pembelian::date, NEW.supplier_id, 1, NEW.total_pembelian)
+                ON CONFLICT (tanggal, supplier_id) DO UPDATE
+                SET jumlah_pembelian = r.jumlah_pembelian + 1,
+                    total_pembelian = r.total_pembelian + EXCLUDED.total_pembelian;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_ringkas_penjualan ON penjualan;
+        CREATE TRIGGER trg_ringkas_penjualan
+        AFTER INSERT OR UPDATE OR DELETE ON penjualan
+        FOR EACH ROW EXECUTE FUNCTION ringkas_penjualan();
+
+        DROP TRIGGER IF EXISTS trg_ringkas_pembelian ON pembelian;
+        CREATE TRIGGER trg_ringkas_pembelian
+        AFTER INSERT OR UPDATE OR DELETE ON pembelian
+        FOR EACH ROW EXECUTE FUNCTION ringkas_pembelian();
+
+        -- isi awal dari data yang sudah ada
+        TRUNCATE ringkasan_penjualan_harian, ringkasan_pembelian_harian;
+        INSERT INTO ringkasan_penjualan_harian
+        SELECT tanggal_transaksi::date, kasir_id, member_id IS NOT NULL, COUNT(*),
+               SUM(subtotal), SUM(ppn), SUM(COALESCE(diskon, 0)), SUM(total_harga)
+        FROM penjualan
+        GROUP BY 1, 2, 3;
+        INSERT INTO ringkasan_pembelian_harian
+        SELECT tanggal_pembelian::date, supplier_id, COUNT(*), SUM(total_pembelian)
+        FROM pembelian
+        GROUP BY 1, 2;
+    """),
+    (4, "Notifikasi katalog bisa ditahan saat impor massal", """
+        -- impor massal memasang SET LOCAL farmtech.impor_massal = 'on' lalu
+        -- mengirim satu sinyal '*' (muat ulang penuh) alih-alih satu notify per baris
+        CREATE OR REPLACE FUNCTION notify_katalog_produk() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('farmtech.impor_massal', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('katalog_produk', OLD.produk_id::text);
+            ELSE
+                PERFORM pg_notify('katalog_produk', NEW.produk_id::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+    (5, "Buku mutasi stok (append-only) dan snapshot stok harian", """
+        -- tanpa FK ke produk: riwayat tetap ada walau produknya dihapus
+        CREATE TABLE IF NOT EXISTS mutasi_stok (
+            mutasi_id BIGSERIAL PRIMARY KEY,
+            produk_id INT NOT NULL,
+            waktu TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+            jenis VARCHAR(20) NOT NULL
+                CHECK (jenis IN ('saldo_awal', 'penjualan', 'pembelian', 'penyesuaian', 'opname')),
+            perubahan INT NOT NULL,
+            stok_setelah INT NOT NULL,
+            keterangan TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_mutasi_stok_produk_waktu ON mutasi_stok (produk_id, waktu);
+        CREATE INDEX IF NOT EXISTS idx_mutasi_stok_waktu ON mutasi_stok (waktu);
+
+        -- stok tiap produk pada akhir `tanggal` (= sebelum tanggal + 1 pukul 00:00)
+        CREATE TABLE IF NOT EXISTS snapshot_stok (
+            tanggal DATE NOT NULL,
+            produk_id INT NOT NULL,
+            stok INT NOT NULL,
+            PRIMARY KEY (produk_id, tanggal)
+        );
+
+        -- jenis & keterangan diisi aplikasi lewat set_config(..., true) per transaksi;
+        -- perubahan tanpa tanda dicatat sebagai penyesuaian
+        CREATE OR REPLACE FUNCTION catat_mutasi_stok() RETURNS trigger AS $$
+        DECLARE
+            lama INT := CASE WHEN TG_OP = 'INSERT' THEN 0 ELSE COALESCE(OLD.stok, 0) END;
+            jenis TEXT := NULLIF(current_setting('farmtech.jenis_mutasi', true), '');
+        BEGIN
+            IF COALESCE(NEW.stok, 0) = lama THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                jenis := 'saldo_awal';
+            END IF;
+            INSERT INTO mutasi_stok (produk_id, jenis, perubahan, stok_setelah, keterangan)
+            VALUES (NEW.produk_id, COALESCE(jenis, 'penyesuaian'), COALESCE(NEW.stok, 0) - lama,
+                    COALESCE(NEW.stok, 0),
+                    NULLIF(current_setting('farmtech.ket_mutasi', true), ''));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_mutasi_stok ON produk;
+        CREATE TRIGGER trg_mutasi_stok
+        AFTER INSERT OR UPDATE OF stok ON produk
+        FOR EACH ROW EXECUTE FUNCTION catat_mutasi_stok();
+
+        CREATE OR REPLACE FUNCTION tolak_ubah_mutasi() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'mutasi_stok hanya boleh ditambah (append-only)';
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_mutasi_stok_append_only ON mutasi_stok;
+        CREATE TRIGGER trg_mutasi_stok_append_only
+        BEFORE UPDATE OR DELETE ON mutasi_stok
+        FOR EACH ROW EXECUTE FUNCTION tolak_ubah_mutasi();
+
+        -- saldo awal: stok saat buku mutasi mulai dipakai
+        INSERT INTO mutasi_stok (produk_id, jenis, perubahan, stok_setelah, keterangan)
+        SELECT produk_id, 'saldo_awal', stok, stok, 'saldo saat migrasi'
+        FROM produk
+        WHERE stok <> 0
+        AND NOT EXISTS (SELECT 1 FROM mutasi_stok);
+    """),
+    (6, "HPP rata-rata tertimbang per produk dan per baris penjualan", """
+        ALTER TABLE produk ADD COLUMN IF NOT EXISTS hpp_rata NUMERIC(14,2);
+        ALTER TABLE detail_penjualan ADD COLUMN IF NOT EXISTS hpp_satuan NUMERIC(14,2);
+
+        -- isi awal: rata-rata semua pembelian yang tercatat (histori urutan tidak direplay)
+        UPDATE produk p SET hpp_rata = x.rata
+        FROM (SELECT produk_id, SUM(qty * harga_beli)::numeric / NULLIF(SUM(qty), 0) AS rata
+              FROM detail_pembelian GROUP BY produk_id) x
+        WHERE p.produk_id = x.produk_id AND p.hpp_rata IS NULL;
+        UPDATE detail_penjualan dp SET hpp_satuan = COALESCE(p.hpp_rata, p.harga_beli)
+        FROM produk p
+        WHERE p.produk_id = dp.produk_id AND dp.hpp_satuan IS NULL;
+
+        -- setiap baris penjualan membawa HPP produk saat terjual
+        CREATE OR REPLACE FUNCTION isi_hpp_penjualan() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.hpp_satuan IS NULL THEN
+                SELECT COALESCE(hpp_rata, harga_beli) INTO NEW.hpp_satuan
+                FROM produk WHERE produk_id = NEW.produk_id;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_hpp_penjualan ON detail_penjualan;
+        CREATE TRIGGER trg_hpp_penjualan
+        BEFORE INSERT ON detail_penjualan
+        FOR EACH ROW EXECUTE FUNCTION isi_hpp_penjualan();
+    """),
+    (7, "Log eksekusi job terjadwal", """
+        CREATE TABLE IF NOT EXISTS log_job (
+            log_id BIGSERIAL PRIMARY KEY,
+            nama_job VARCHAR(50) NOT NULL,
+            mulai TIMESTAMP NOT NULL,
+            selesai TIMESTAMP NOT NULL,
+            durasi_ms INT NOT NULL,
+            status VARCHAR(10) NOT NULL CHECK (status IN ('sukses', 'gagal')),
+            baris INT,
+            pesan TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_log_job_nama_mulai ON log_job (nama_job, mulai DESC);
+    """),
+    (8, "Tanggal terakhir terjual & penghitung unit terjual per produk", """
+        ALTER TABLE produk ADD COLUMN IF NOT EXISTS terakhir_terjual TIMESTAMP;
+        ALTER TABLE produk ADD COLUMN IF NOT EXISTS total_terjual INT NOT NULL DEFAULT 0;
+
+        -- unit terjual per produk per hari: dasar hitungan bergulir (30/90 hari, ramalan)
+        CREATE TABLE IF NOT EXISTS penjualan_produk_harian (
+            tanggal DATE NOT NULL,
+            produk_id INT NOT NULL,
+            qty INT NOT NULL,
+            PRIMARY KEY (produk_id, tanggal)
+        );
+        CREATE INDEX IF NOT EXISTS idx_penjualan_produk_harian_tanggal
+            ON penjualan_produk_harian (tanggal);
+
+        -- deteksi barang tidak laku cukup range scan di produk
+        CREATE INDEX IF NOT EXISTS idx_produk_terakhir_aktif
+            ON produk ((COALESCE(terakhir_terjual::date, tanggal_input)));
+    """ + SQL_ISI_STATISTIK_PENJUALAN),
+    (9, "Aturan markdown bertingkat menurut umur & kategori, harga minimum = harga beli", """
+        -- kategori NULL = aturan umum; kategori yang punya aturan sendiri
+        -- hanya memakai tingkatannya sendiri
+        CREATE TABLE IF NOT EXISTS aturan_markdown (
+            aturan_id SERIAL PRIMARY KEY,
+            kategori VARCHAR(50),
+            min_hari INT NOT NULL CHECK (min_hari > 0),
+            diskon INT NOT NULL CHECK (diskon BETWEEN 0 AND 90)
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_aturan_markdown_tingkat
+            ON aturan_markdown (COALESCE(kategori, ''), min_hari);
+
+        INSERT INTO aturan_markdown (kategori, min_hari, diskon)
+        SELECT NULL, t.min_hari, t.diskon
+        FROM (VALUES (120, 20), (180, 30), (365, 40), (730, 50)) AS t(min_hari, diskon)
+        WHERE NOT EXISTS (SELECT 1 FROM aturan_markdown);
+
+        -- harga akhir tidak pernah di bawah harga beli (kecuali harga jual sendiri lebih rendah)
+        CREATE OR REPLACE VIEW v_harga_efektif AS
+        SELECT
+            p.produk_id,
+            p.harga AS harga_dasar,
+            COALESCE(b.diskon_otomatis, 0) AS diskon,
+            GREATEST(p.harga * (100 - COALESCE(b.diskon_otomatis, 0)) / 100,
+                     LEAST(p.harga_beli, p.harga)) AS harga_akhir
+        FROM produk p
+        LEFT JOIN barang_tidak_laku b ON b.produk_id = p.produk_id;
+    """),
+    (10, "Keahlian teknisi, estimasi jam servis & notifikasi antrian teknisi", """
+        -- keahlian NULL = teknisi umum, bisa menerima semua jenis servis
+        ALTER TABLE teknisi ADD COLUMN IF NOT EXISTS keahlian VARCHAR(50);
+        ALTER TABLE servis ADD COLUMN IF NOT EXISTS keahlian VARCHAR(50);
+        ALTER TABLE servis ADD COLUMN IF NOT EXISTS estimasi_jam NUMERIC(5,1) NOT NULL DEFAULT 2;
+
+        -- beban teknisi = servis yang masih Proses
+        CREATE INDEX IF NOT EXISTS idx_servis_proses_teknisi ON servis (teknisi_id)
+            INCLUDE (estimasi_jam) WHERE status_servis = 'Proses';
+
+        CREATE OR REPLACE FUNCTION notify_antrian_teknisi() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM pg_notify('antrian_teknisi', OLD.teknisi_id::text);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM pg_notify('antrian_teknisi', NEW.teknisi_id::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_servis_antrian ON servis;
+        CREATE TRIGGER trg_servis_antrian
+        AFTER INSERT OR DELETE OR UPDATE OF status_servis, teknisi_id, estimasi_jam ON servis
+        FOR EACH ROW EXECUTE FUNCTION notify_antrian_teknisi();
+
+        DROP TRIGGER IF EXISTS trg_teknisi_antrian ON teknisi;
+        CREATE TRIGGER trg_teknisi_antrian
+        AFTER INSERT OR UPDATE OR DELETE ON teknisi
+        FOR EACH ROW EXECUTE FUNCTION notify_antrian_teknisi();
+    """),
+    (11, "Indeks parsial papan servis terbuka per teknisi & member", """
+        CREATE INDEX IF NOT EXISTS idx_servis_terbuka_teknisi ON servis (teknisi_id, servis_id)
+            WHERE status_servis IN ('Proses', 'Selesai');
+        CREATE INDEX IF NOT EXISTS idx_servis_terbuka_member ON servis (member_id, servis_id)
+            WHERE status_servis IN ('Proses', 'Selesai');
+    """),
+    (12, "Tanggal diambil servis & indeks analitik turnaround", """
+        ALTER TABLE servis ADD COLUMN IF NOT EXISTS tanggal_diambil DATE;
+
+        -- rentang tanggal_selesai jadi index-only scan untuk statistik turnaround
+        DROP INDEX IF EXISTS idx_servis_selesai;
+        CREATE INDEX idx_servis_selesai ON servis (tanggal_selesai)
+            INCLUDE (tanggal_masuk, tanggal_diambil, teknisi_id, biaya_servis, nama_alat)
+            WHERE status_servis IN ('Selesai', 'Diambil');
+        CREATE INDEX IF NOT EXISTS idx_servis_masuk ON servis (tanggal_masuk);
+    """),
+    (13, "Pencarian teks penuh keluhan & nama alat servis", """
+        -- stemmer bahasa Indonesia jika tersedia di server, selain itu 'simple'
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'farmtech_id') THEN
+                IF EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'indonesian') THEN
+                    CREATE TEXT SEARCH CONFIGURATION farmtech_id (COPY = indonesian);
+                ELSE
+                    CREATE TEXT SEARCH CONFIGURATION farmtech_id (COPY = simple);
+                END IF;
+            END IF;
+        END;
+        $$;
+
+        -- bobot A = nama alat, B = keluhan
+        ALTER TABLE servis ADD COLUMN IF NOT EXISTS cari_tsv tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('farmtech_id'::regconfig, COALESCE(nama_alat, '')), 'A') ||
+                setweight(to_tsvector('farmtech_id'::regconfig, COALESCE(keluhan, '')), 'B')
+            ) STORED;
+        CREATE INDEX IF NOT EXISTS idx_servis_cari ON servis USING gin (cari_tsv);
+    """),
+    (14, "Produk yang punya riwayat mutasi stok tidak bisa dihapus", """
+        -- buku mutasi append-only: menghapus produknya meninggalkan baris yatim.
+        -- NOT VALID: baris yatim lama tetap disimpan sebagai riwayat, yang baru ditolak
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_mutasi_stok_produk') THEN
+                ALTER TABLE mutasi_stok ADD CONSTRAINT fk_mutasi_stok_produk
+                    FOREIGN KEY (produk_id) REFERENCES produk (produk_id) NOT VALID;
+            END IF;
+        END;
+        $$;
+    """),
+]
+
+KUNCI_MIGRASI = 20251  # kunci advisory agar dua terminal tidak migrasi bersamaan
+
+def jalankan_migrasi(conn, verbose=True):
+    """
+    Terapkan migrasi yang belum tercatat di schema_migrasi, urut versi.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrasi (
+            versi INT PRIMARY KEY,
+            deskripsi VARCHAR(255) NOT NULL,
+            diterapkan_pada TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    conn.commit()
+
+    cur.execute("SELECT pg_advisory_lock(%s)", (KUNCI_MIGRASI,))
+    try:
+        cur.execute("SELECT versi FROM schema_migrasi")
+        sudah = {r[0] for r in cur.fetchall()}
+        conn.commit()
+        for versi, deskripsi, sql in sorted(MIGRASI):
+            if versi in sudah:
+                continue
+            try:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrasi (versi, deskripsi) VALUES (%s, %s)",
+                            (versi, deskripsi))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"Migrasi {versi} ({deskripsi}) gagal.")
+                raise
+            if verbose:
+                print(f"Migrasi {versi} diterapkan: {deskripsi}")
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (KUNCI_MIGRASI,))
+        conn.commit()
+        cur.close()
+
+def migrasi_cli():
+    conn = buka_koneksi()
+    jalankan_migrasi(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT versi, deskripsi, diterapkan_pada FROM schema_migrasi ORDER BY versi")
+    print(tabulate(cur.fetchall(), headers=["Versi", "Deskripsi", "Diterapkan"], tablefmt="grid"))
+    conn.close()
+
+# Query yang sering dipakai aplikasi beserta indeks yang harus dipakainya.
+QUERY_PANAS = [
+    ("Cari member via no HP",
+     "SELECT member_id, nama, total_transaksi FROM member WHERE no_hp = %s",
+     ("081223334444",), "idx_member_no_hp"),
+    ("Pegawai dari user_role",
+     "SELECT pegawai_id, nama FROM pegawai WHERE user_role_id = %s",
+     (1,), "idx_pegawai_user_role"),
+    ("Cek produk pernah dijual",
+     "SELECT 1 FROM detail_penjualan WHERE produk_id = %s",
+     (1,), "idx_detail_penjualan_produk"),
+    ("Detail satu transaksi",
+     "SELECT produk_id, qty FROM detail_penjualan WHERE penjualan_id = %s",
+     (1,), "idx_detail_penjualan_penjualan"),
+    ("Cek supplier pernah dipakai pembelian",
+     "SELECT 1 FROM pembelian WHERE supplier_id = %s",
+     (1,), "idx_pembelian_supplier"),
+    ("Servis terbuka",
+     "SELECT servis_id FROM servis WHERE status_servis IN ('Proses', 'Selesai') "
+     "AND servis_id > %s ORDER BY servis_id LIMIT 21",
+     (0,), "idx_servis_terbuka"),
+    ("Papan servis per teknisi",
+     "SELECT servis_id FROM servis WHERE status_servis IN ('Proses', 'Selesai') "
+     "AND teknisi_id = %s AND servis_id > %s ORDER BY servis_id LIMIT 21",
+     (1, 0), "idx_servis_terbuka_teknisi"),
+    ("Papan servis per member",
+     "SELECT servis_id FROM servis WHERE status_servis IN ('Proses', 'Selesai') "
+     "AND member_id = %s AND servis_id > %s ORDER BY servis_id LIMIT 21",
+     (1, 0), "idx_servis_terbuka_member"),
+    ("Teknisi masih punya servis PROSES",
+     "SELECT 1 FROM servis WHERE teknisi_id = %s AND status_servis = 'Proses'",
+     (1,), "idx_servis_proses_teknisi"),
+    ("Penjualan per periode",
+     "SELECT penjualan_id FROM penjualan WHERE tanggal_transaksi >= %s AND tanggal_transaksi < %s",
+     (datetime(2025, 1, 1), datetime(2025, 2, 1)), "idx_penjualan_tanggal"),
+    ("Pembelian per periode",
+     "SELECT pembelian_id FROM pembelian WHERE tanggal_pembelian >= %s AND tanggal_pembelian < %s",
+     (datetime(2025, 1, 1), datetime(2025, 2, 1)), "idx_pembelian_tanggal"),
+    ("Servis selesai per periode",
+     "SELECT servis_id FROM servis WHERE status_servis IN ('Selesai', 'Diambil') "
+     "AND tanggal_selesai >= %s AND tanggal_selesai < %s",
+     (date(2025, 1, 1), date(2025, 2, 1)), "idx_servis_selesai"),
+    ("Servis masuk per periode",
+     "SELECT servis_id FROM servis WHERE tanggal_masuk >= %s AND tanggal_masuk < %s",
+     (date(2025, 1, 1), date(2025, 2, 1)), "idx_servis_masuk"),
+    ("Cari keluhan servis",
+     "SELECT servis_id FROM servis WHERE cari_tsv @@ websearch_to_tsquery('farmtech_id', %s)",
+     ("pompa bocor",), "idx_servis_cari"),
+    ("Deteksi barang tidak laku",
+     "SELECT produk_id FROM produk WHERE COALESCE(terakhir_terjual::date, tanggal_input) <= CURRENT_DATE - 120",
+     (), "idx_produk_terakhir_aktif"),
+]
+
+def _indeks_di_rencana(node):
+    nama = set()
+    if "Index Name" in node:
+        nama.add(node["Index Name"])
+    for anak in node.get("Plans", []):
+        nama |= _indeks_di_rencana(anak)
+    return nama
+
+def cek_indeks_query(cur):
+    """
+    EXPLAIN setiap query panas dan pastikan indeks yang diharapkan dipakai.
+    Seq scan dimatikan sementara agar hasilnya tidak tergantung ukuran tabel uji.
+    Return True jika semua lulus.
+    """
+    hasil = []
+    lulus = True
+    cur.execute("SET LOCAL enable_seqscan = off")
+    for nama, sql, params, indeks in QUERY_PANAS:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            import json
+            plan = json.loads(plan)
+        dipakai = _indeks_di_rencana(plan[0]["Plan"])
+        ok = indeks in dipakai
+        lulus = lulus and ok
+        hasil.append([nama, indeks, ", ".join(sorted(dipakai)) or "-", "OK" if ok else "TIDAK"])
+    cur.connection.rollback()
+    print(tabulate(hasil, headers=["Query", "Indeks Diharapkan", "Indeks Dipakai", "Status"],
+                   tablefmt="grid"))
+    return lulus
+
+def cek_indeks_cli():
+    conn = buka_koneksi()
+    lulus = cek_indeks_query(conn.cursor())
+    conn.close()
+    sys.exit(0 if lulus else 1)
+
 # -------------------------
 # Helpers
 # -------------------------
@@ -69,6 +925,56 @@ def input_int(prompt, default=None):
 def pause():
     input("\nTekan Enter untuk kembali...")
 
+HALAMAN = 20  # baris per halaman daftar
+
+def ambil_halaman(cur, sql, params, kolom_id, setelah_id, batas=None):
+    """
+    Keyset pagination: ambil maksimal `batas` baris dengan kolom_id > setelah_id.
+    `sql` harus sudah memiliki klausa WHERE. Return (rows, ada_halaman_berikutnya).
+    """
+    batas = batas or HALAMAN
+    cur.execute(f"{sql} AND {kolom_id} > %s ORDER BY {kolom_id} LIMIT %s",
+                tuple(params) + (setelah_id, batas + 1))
+    rows = cur.fetchall()
+    return rows[:batas], len(rows) > batas
+
+def tampilkan_per_halaman(cur, sql, params, kolom_id, headers, format_baris,
+                          pesan_kosong, prompt=None):
+    """
+    Tampilkan hasil query satu halaman sekali ambil (n = berikutnya, p = sebelumnya).
+    Kolom pertama tiap baris harus kolom_id.
+    Return (rows halaman terakhir, jawaban) -- jawaban = input selain n/p
+    (kosong jika tanpa prompt).
+    """
+    awal = [0]  # kolom_id terakhir sebelum tiap halaman yang sudah dilihat
+    while True:
+        rows, ada_lagi = ambil_halaman(cur, sql, params, kolom_id, awal[-1])
+        if rows:
+            print(tabulate([format_baris(r) for r in rows], headers=headers, tablefmt="grid"))
+            nav = []
+            if len(awal) > 1:
+                nav.append("p = sebelumnya")
+            if ada_lagi:
+                nav.append("n = berikutnya")
+            print(f"Halaman {len(awal)}" + (f" ({', '.join(nav)})" if nav else ""))
+        else:
+            print(pesan_kosong)
+            nav = []
+
+        if prompt:
+            jawaban = input(f"{prompt}: ").strip()
+        elif nav:
+            jawaban = input("Navigasi (Enter = lanjut): ").strip()
+        else:
+            return rows, ""
+
+        if jawaban.lower() == "n" and ada_lagi:
+            awal.append(rows[-1][0])
+        elif jawaban.lower() == "p" and len(awal) > 1:
+            awal.pop()
+        else:
+            return rows, jawaban
+
 # -------------------------
 # Pengguna / User functions
 # -------------------------
@@ -702,20 +1608,15 @@ def tampilkan_daftar_kasir(cur):
     Menampilkan daftar pegawai dengan role 'Kasir':
     ID | Nama | Username | No HP | Alamat
     """
-    cur.execute("""
+    rows, _ = tampilkan_per_halaman(cur, """
         SELECT p.pegawai_id, p.nama, u.username, p.no_hp, p.alamat
         FROM pegawai p
         JOIN user_role ur ON ur.user_role_id = p.user_role_id
         JOIN users u ON u.user_id = ur.user_id
         JOIN role r ON r.role_id = ur.role_id
         WHERE r.role_name = 'Kasir'
-        ORDER BY p.pegawai_id
-    """)
-    rows = cur.fetchall()
-    if not rows:
-        print("Belum ada kasir terdaftar.")
-        return []
-    print(tabulate(rows, headers=["ID","Nama","Username","No HP","Alamat"], tablefmt="grid"))
+    """, (), "p.pegawai_id", ["ID","Nama","Username","No HP","Alamat"], list,
+        "Belum ada kasir terdaftar.")
     return rows
 
 def tambah_kasir(conn, cur):
@@ -946,18 +1847,12 @@ def kelola_data_kasir(conn, cur, user):
 # Kelola Data Teknisi
 # -------------------------
 def tampilkan_daftar_teknisi(cur):
-    cur.execute("""
-        SELECT teknisi_id, nama, no_hp
+    rows, _ = tampilkan_per_halaman(cur, """
+        SELECT teknisi_id, nama, no_hp, COALESCE(keahlian, '(umum)')
         FROM teknisi
-        ORDER BY teknisi_id
-    """)
-    rows = cur.fetchall()
-
-    if not rows:
-        print("Belum ada teknisi terdaftar.")
-        return []
-
-    print(tabulate(rows, headers=["ID", "Nama", "No HP"], tablefmt="grid"))
+        WHERE TRUE
+    """, (), "teknisi_id", ["ID", "Nama", "No HP", "Keahlian"], list,
+        "Belum ada teknisi terdaftar.")
     return rows
 
 def tambah_teknisi(conn, cur):
@@ -965,6 +1860,7 @@ def tambah_teknisi(conn, cur):
 
     nama = input("Nama teknisi: ").strip()
     no_hp = input("No HP (opsional): ").strip()
+    keahlian = input("Keahlian (mis. Mesin, Pompa, Elektrik; kosongkan = umum): ").strip() or None
 
     if not nama:
         print("Nama wajib diisi.")
@@ -972,9 +1868,9 @@ def tambah_teknisi(conn, cur):
 
     try:
         cur.execute("""
-            INSERT INTO teknisi (nama, no_hp)
-            VALUES (%s, %s)
-        """, (nama, no_hp))
+            INSERT INTO teknisi (nama, no_hp, keahlian)
+            VALUES (%s, %s, %s)
+        """, (nama, no_hp, keahlian))
 
         conn.commit()
         print("Teknisi berhasil ditambahkan.")
@@ -994,7 +1890,7 @@ def ubah_teknisi(conn, cur):
         return
 
     cur.execute("""
-        SELECT nama, no_hp
+        SELECT nama, no_hp, keahlian
         FROM teknisi
         WHERE teknisi_id = %s
     """, (teknisi_id,))
@@ -1004,23 +1900,28 @@ def ubah_teknisi(conn, cur):
         print("Teknisi tidak ditemukan.")
         return
 
-    nama_lama, no_hp_lama = old
+    nama_lama, no_hp_lama, keahlian_lama = old
 
     print("\nKosongkan input jika ingin mempertahankan nilai lama.")
     nama_baru = input(f"Nama ({nama_lama}): ").strip()
     no_hp_baru = input(f"No HP ({no_hp_lama}): ").strip()
+    keahlian_baru = input(f"Keahlian ({keahlian_lama or 'umum'}, '-' = jadikan umum): ").strip()
 
     if nama_baru == "":
         nama_baru = nama_lama
     if no_hp_baru == "":
         no_hp_baru = no_hp_lama
+    if keahlian_baru == "":
+        keahlian_baru = keahlian_lama
+    elif keahlian_baru == "-":
+        keahlian_baru = None
 
     try:
         cur.execute("""
             UPDATE teknisi
-            SET nama = %s, no_hp = %s
+            SET nama = %s, no_hp = %s, keahlian = %s
             WHERE teknisi_id = %s
-        """, (nama_baru, no_hp_baru, teknisi_id))
+        """, (nama_baru, no_hp_baru, keahlian_baru, teknisi_id))
 
         conn.commit()
         print("Data teknisi berhasil diperbarui.")
@@ -1098,16 +1999,198 @@ def kelola_teknisi(conn, cur, user):
             print("Pilihan tidak valid.")
             pause()
 
+# -------------------------
+# Cache katalog produk
+# -------------------------
+# produk_id -> {"id", "nama", "kategori", "harga", "stok", "diskon", "kode", "harga_akhir"}
+# Dimuat penuh sekali, lalu hanya produk yang berubah yang diambil ulang
+# berdasarkan NOTIFY 'katalog_produk' dari trigger di tabel produk & barang_tidak_laku.
+KATALOG = {}
+KATALOG_KODE = {}   # kode_barang -> produk_id (lookup scan barcode)
+_katalog_lock = threading.Lock()
+_katalog_listener = None
+
+# harga dasar, diskon aktif dan harga akhir selalu dari v_harga_efektif
+SQL_KATALOG = """
+    SELECT p.produk_id, p.nama_produk, p.kategori, h.harga_dasar, p.stok, h.diskon,
+           p.kode_barang, h.harga_akhir
+    FROM produk p
+    JOIN v_harga_efektif h ON h.produk_id = p.produk_id
+"""
+
+def _buang_dari_katalog(produk_id):
+    lama = KATALOG.pop(produk_id, None)
+    if lama and lama["kode"]:
+        KATALOG_KODE.pop(lama["kode"], None)
+
+def _isi_katalog(rows):
+    for r in rows:
+        _buang_dari_katalog(r[0])
+        KATALOG[r[0]] = {"id": r[0], "nama": r[1], "kategori": r[2],
+                         "harga": r[3], "stok": r[4], "diskon": r[5], "kode": r[6],
+                         "harga_akhir": r[7]}
+        if r[6]:
+            KATALOG_KODE[r[6]] = r[0]
+
+def _buka_listener_katalog():
+    try:
+        listener = buka_koneksi()
+        listener.autocommit = True
+        listener.cursor().execute("LISTEN katalog_produk")
+        return listener
+    except Exception:
+        return None
+
+def katalog_segarkan(cur):
+    """
+    Pastikan KATALOG sesuai database.
+    Muat penuh hanya saat pertama kali (atau listener putus / ada sinyal '*'),
+    selebihnya ambil ulang produk yang dikabarkan berubah saja.
+    """
+    global _katalog_listener
+    with _katalog_lock:
+        ids = None
+        if _katalog_listener is not None:
+            try:
+                _katalog_listener.poll()
+                ids = {n.payload for n in _katalog_listener.notifies}
+                _katalog_listener.notifies.clear()
+            except KONEKSI_PUTUS:
+                _katalog_listener = None
+
+        if _katalog_listener is None or "*" in ids:
+            # LISTEN dulu baru muat penuh supaya tidak ada perubahan yang terlewat
+            if _katalog_listener is None:
+                _katalog_listener = _buka_listener_katalog()
+            cur.execute(SQL_KATALOG)
+            KATALOG.clear()
+            KATALOG_KODE.clear()
+            _isi_katalog(cur.fetchall())
+            return
+
+        if ids:
+            ids = [int(i) for i in ids]
+            cur.execute(SQL_KATALOG + " WHERE p.produk_id = ANY(%s)", (ids,))
+            rows = cur.fetchall()
+            ada = {r[0] for r in rows}
+            for pid in ids:
+                if pid not in ada:
+                    _buang_dari_katalog(pid)
+            _isi_katalog(rows)
+
+def katalog_produk(cur):
+    """List produk dari cache, urut produk_id."""
+    katalog_segarkan(cur)
+    return [KATALOG[pid] for pid in sorted(KATALOG)]
+
+def katalog_get(cur, produk_id):
+    katalog_segarkan(cur)
+    return KATALOG.get(produk_id)
+
+def katalog_by_kode(cur, kode):
+    katalog_segarkan(cur)
+    return KATALOG.get(KATALOG_KODE.get(kode))
+
+def baca_scan(prompt="Scan"):
+    """
+    Baca aliran input scanner barcode: satu kode per baris,
+    'qty*kode' untuk jumlah lebih dari satu, baris kosong = selesai.
+    Menghasilkan (kode, qty).
+    """
+    while True:
+        teks = input(f"{prompt}: ").strip()
+        if not teks:
+            return
+        qty = 1
+        if "*" in teks:
+            depan, belakang = teks.split("*", 1)
+            if depan.strip().isdigit():
+                qty, teks = int(depan), belakang.strip()
+        if qty <= 0:
+            print("Jumlah tidak valid.")
+            continue
+        yield teks, qty
+
 # -------------------------
 #Manajemen produk
 # -------------------------
+def sql_cari_produk(teks):
+    """
+    Susun query pencarian produk dari teks:
+      "cangkul"            -> potongan nama (indeks trigram), < 3 huruf -> awalan nama
+      "k:Irigasi"          -> kategori
+      "s:3" / "s:Agro"     -> supplier (ID atau awalan nama)
+    Contoh: "pompa k:Mesin Pertanian s:2"
+    """
+    kata, kategori, supplier = "", None, None
+    for bagian in re.split(r"\s+(?=[ks]:)", teks.strip()):
+        if bagian.startswith("k:"):
+            kategori = bagian[2:].strip()
+        elif bagian.startswith("s:"):
+            supplier = bagian[2:].strip()
+        else:
+            kata = bagian.strip()
+
+    sql = """
+        SELECT p.produk_id, p.nama_produk, p.kategori, s.nama_supplier, p.harga, p.stok
+        FROM produk p
+        JOIN supplier s ON s.supplier_id = p.supplier_id
+        WHERE TRUE
+    """
+    params = []
+    if kata:
+        pola = kata.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        if len(kata) >= 3:
+            sql += " AND p.nama_produk ILIKE %s"
+            params.append(f"%{pola}%")
+        else:
+            sql += " AND lower(p.nama_produk) LIKE %s"
+            params.append(f"{pola}%")
+    if kategori:
+        sql += " AND lower(p.kategori) = lower(%s)"
+        params.append(kategori)
+    if supplier:
+        if supplier.isdigit():
+            sql += " AND p.supplier_id = %s"
+            params.append(int(supplier))
+        else:
+            sql += " AND lower(s.nama_supplier) LIKE %s"
+            params.append(supplier.lower() + "%")
+    return sql, params
+
+def _baris_produk(r):
+    return [r[0], r[1], r[2], r[3], format_rp(r[4]), r[5]]
+
+HEADER_PRODUK = ["ID", "Nama", "Kategori", "Supplier", "Harga", "Stok"]
+
 def list_produk(cur):
-    cur.execute("SELECT produk_id, nama_produk, kategori, harga, stok FROM produk ORDER BY produk_id")
-    rows = cur.fetchall()
-    print(tabulate([[r[0], r[1], r[2], format_rp(r[3]), r[4]] for r in rows],
-                   headers=["ID","Nama","Kategori","Harga","Stok"], tablefmt="grid"))
+    teks = input("Cari produk (nama, k:kategori, s:supplier; Enter = semua): ")
+    sql, params = sql_cari_produk(teks)
+    rows, _ = tampilkan_per_halaman(cur, sql, params, "p.produk_id", HEADER_PRODUK,
+                                    _baris_produk, "Produk tidak ditemukan.")
     return rows
 
+def pilih_produk(cur, prompt="Masukkan ID produk"):
+    """
+    Picker produk: cari lalu pilih dari hasil per halaman.
+    Return produk_id atau None jika dikosongkan.
+    """
+    while True:
+        teks = input("\nCari produk (nama, k:kategori, s:supplier; Enter = semua): ")
+        sql, params = sql_cari_produk(teks)
+        _, jawaban = tampilkan_per_halaman(
+            cur, sql, params, "p.produk_id", HEADER_PRODUK, _baris_produk,
+            "Produk tidak ditemukan.", f"{prompt} (c = cari lagi)"
+        )
+        if jawaban == "":
+            return None
+        if jawaban.lower() == "c":
+            continue
+        try:
+            return int(jawaban)
+        except ValueError:
+            print("Input tidak valid.")
+
 def tambah_produk(conn, cur):
     print("\n=== TAMBAH PRODUK BARU ===")
 
@@ -1116,6 +2199,7 @@ def tambah_produk(conn, cur):
     harga = input_int("Harga jual: ")
     stok = input_int("Stok awal: ")
     harga_beli = input_int("Harga beli: ")
+    kode = input("Kode barang / barcode (opsional): ").strip() or None
 
     if not nama:
         print("Nama produk wajib diisi.")
@@ -1132,6 +2216,11 @@ def tambah_produk(conn, cur):
     if harga < harga_beli:
         print("Harga jual tidak boleh lebih rendah dari harga beli!")
         return
+    if kode:
+        cur.execute("SELECT 1 FROM produk WHERE kode_barang = %s", (kode,))
+        if cur.fetchone():
+            print("Kode barang sudah dipakai produk lain.")
+            return
 
     # Pilih supplier
     print("\nPilih Supplier:")
@@ -1149,9 +2238,9 @@ def tambah_produk(conn, cur):
 
     try:
         cur.execute("""
-            INSERT INTO produk (supplier_id, nama_produk, kategori, harga, harga_beli, stok, tanggal_input)
-VALUES (%s, %s, %s, %s, %s, %s, CURRENT_DATE)
-        """, (supplier_id, nama, kategori, harga, harga_beli, stok))
+            INSERT INTO produk (supplier_id, nama_produk, kategori, harga, harga_beli, stok, tanggal_input, kode_barang)
+VALUES (%s, %s, %s, %s, %s, %s, CURRENT_DATE, %s)
+        """, (supplier_id, nama, kategori, harga, harga_beli, stok, kode))
 
         conn.commit()
         print("Produk berhasil ditambahkan.")
@@ -1162,18 +2251,14 @@ VALUES (%s, %s, %s, %s, %s, %s, CURRENT_DATE)
 def ubah_produk(conn, cur):
     print("\n=== UBAH PRODUK ===")
 
-    rows = list_produk(cur)
-    if not rows:
-        return
-
-    produk_id = input_int("Masukkan ID Produk yang akan diubah: ")
+    produk_id = pilih_produk(cur, "Masukkan ID Produk yang akan diubah")
     if not produk_id:
         print("ID tidak valid.")
         return
 
     # Ambil data lama termasuk harga_beli
     cur.execute("""
-        SELECT nama_produk, kategori, harga, harga_beli, stok, supplier_id
+        SELECT nama_produk, kategori, harga, harga_beli, stok, supplier_id, kode_barang
         FROM produk
         WHERE produk_id = %s
     """, (produk_id,))
@@ -1183,7 +2268,7 @@ def ubah_produk(conn, cur):
         print("Produk tidak ditemukan.")
         return
 
-    nama_lama, kategori_lama, harga_lama, harga_beli_lama, stok_lama, supplier_lama = old
+    nama_lama, kategori_lama, harga_lama, harga_beli_lama, stok_lama, supplier_lama, kode_lama = old
 
     print("\nKosongkan jika ingin tetap.")
     nama_baru = input(f"Nama ({nama_lama}): ").strip()
@@ -1192,6 +2277,11 @@ def ubah_produk(conn, cur):
     harga_baru = input_int(f"Harga jual ({harga_lama}): ", default=harga_lama)
     harga_beli_baru = input_int(f"Harga beli ({harga_beli_lama}): ", default=harga_beli_lama)
     stok_baru = input_int(f"Stok ({stok_lama}): ", default=stok_lama)
+    kode_baru = input(f"Kode barang ({kode_lama or 'tidak ada'}, '-' = hapus kode): ").strip()
+    if kode_baru == "":
+        kode_baru = kode_lama
+    elif kode_baru == "-":
+        kode_baru = None
 
     # === Validasi harga wajib bernilai positif ===
     if harga_baru is None or harga_baru <= 0:
@@ -1209,6 +2299,19 @@ def ubah_produk(conn, cur):
     if stok_baru is None or stok_baru < 0:
         print("Stok tidak valid.")
         return
+    alasan = None
+    if stok_baru != stok_lama:
+        alasan = input("Alasan penyesuaian stok: ").strip()
+        if not alasan:
+            print("Perubahan stok wajib disertai alasan.")
+            return
+
+    if kode_baru != kode_lama:
+        cur.execute("SELECT 1 FROM produk WHERE kode_barang = %s AND produk_id != %s",
+                    (kode_baru, produk_id))
+        if cur.fetchone():
+            print("Kode barang sudah dipakai produk lain.")
+            return
 
     # Supplier tetap atau ganti?
     print("\nSupplier sekarang:", supplier_lama)
@@ -1231,16 +2334,21 @@ def ubah_produk(conn, cur):
         kategori_baru = kategori_lama
 
     try:
+        # stok diubah sebagai selisih, supaya penjualan yang terjadi sejak
+        # data dibaca tidak tertimpa; tercatat di buku mutasi sebagai penyesuaian
+        tandai_mutasi(cur, "penyesuaian", alasan)
         cur.execute("""
             UPDATE produk
             SET nama_produk = %s,
                 kategori = %s,
                 harga = %s,
                 harga_beli = %s,
-                stok = %s,
-                supplier_id = %s
+                stok = stok + %s,
+                supplier_id = %s,
+                kode_barang = %s
             WHERE produk_id = %s
-        """, (nama_baru, kategori_baru, harga_baru, harga_beli_baru, stok_baru, supplier_baru, produk_id))
+        """, (nama_baru, kategori_baru, harga_baru, harga_beli_baru, stok_baru - stok_lama,
+              supplier_baru, kode_baru, produk_id))
 
         conn.commit()
         print("Produk berhasil diperbarui.")
@@ -1251,11 +2359,7 @@ def ubah_produk(conn, cur):
 def hapus_produk(conn, cur):
     print("\n=== HAPUS PRODUK ===")
 
-    rows = list_produk(cur)
-    if not rows:
-        return
-
-    produk_id = input_int("Masukkan ID Produk: ")
+    produk_id = pilih_produk(cur, "Masukkan ID Produk")
     if not produk_id:
         print("ID tidak valid.")
         return
@@ -1276,6 +2380,11 @@ def hapus_produk(conn, cur):
         print("Tidak bisa menghapus produk yang terdaftar sebagai barang tidak laku.")
         return
 
+    cur.execute("SELECT 1 FROM mutasi_stok WHERE produk_id = %s LIMIT 1", (produk_id,))
+    if cur.fetchone():
+        print("Tidak bisa menghapus produk yang sudah punya riwayat stok.")
+        return
+
     konfirm = input("Yakin ingin menghapus produk ini? (y/n): ").lower()
     if konfirm != "y":
         print("Dibatalkan.")
@@ -1298,7 +2407,9 @@ def kelola_produk(conn, cur, user):
         print("2. Tambah produk")
         print("3. Ubah produk")
         print("4. Hapus produk")
-        print("5. Kembali")
+        print("5. Stok opname")
+        print("6. Riwayat & stok pada tanggal")
+        print("7. Kembali")
 
         pilih = input("Pilih: ").strip()
         clear_screen()
@@ -1320,19 +2431,255 @@ def kelola_produk(conn, cur, user):
             pause()
 
         elif pilih == "5":
+            stok_opname(conn, cur)
+            pause()
+
+        elif pilih == "6":
+            riwayat_stok(cur)
+            pause()
+
+        elif pilih == "7":
             break
 
         else:
             print("Pilihan tidak valid.")
             pause()
 
+# -------------------------
+# Mutasi & snapshot stok
+# -------------------------
+JENIS_MUTASI = ["saldo_awal", "penjualan", "pembelian", "penyesuaian", "opname"]
+
+def tandai_mutasi(cur, jenis, keterangan=None):
+    """
+    Beri tahu trigger buku mutasi jenis perubahan stok di transaksi ini.
+    Berlaku sampai commit/rollback.
+    """
+    cur.execute("SELECT set_config('farmtech.jenis_mutasi', %s, true), "
+                "set_config('farmtech.ket_mutasi', %s, true)", (jenis, keterangan or ""))
+
+SQL_STOK_PADA = """
+    -- snapshot terakhir sebelum titik waktu + mutasi sesudahnya (delta terbatas)
+    SELECT p.produk_id, p.nama_produk,
+           COALESCE(sn.stok, 0) + COALESCE((
+               SELECT SUM(m.perubahan) FROM mutasi_stok m
+               WHERE m.produk_id = p.produk_id
+               AND m.waktu >= COALESCE(sn.tanggal + 1, '-infinity'::timestamp)
+               AND m.waktu < %(waktu)s
+           ), 0) AS stok
+    FROM produk p
+    LEFT JOIN LATERAL (
+        SELECT s.tanggal, s.stok FROM snapshot_stok s
+        WHERE s.produk_id = p.produk_id AND s.tanggal + 1 <= %(waktu)s
+        ORDER BY s.tanggal DESC
+        LIMIT 1
+    ) sn ON true
+"""
+
+def stok_pada(cur, waktu, produk_ids=None):
+    """Stok per produk pada titik waktu `waktu`. Return list (produk_id, nama, stok)."""
+    sql = SQL_STOK_PADA
+    if produk_ids is not None:
+        sql += " WHERE p.produk_id = ANY(%(ids)s)"
+    cur.execute(sql + " ORDER BY p.produk_id", {"waktu": waktu, "ids": produk_ids})
+    return cur.fetchall()
+
+# mutasi_stok.waktu dicap saat baris ditulis, bukan saat commit: transaksi yang
+# melewati tengah malam dan baru commit sesudah job 00:10 tidak ikut di snapshot
+# kemarin. Karena itu snapshot beberapa hari sebelumnya selalu dihitung ulang.
+SNAPSHOT_HITUNG_ULANG = 1   # hari
+
+def buat_snapshot_stok(cur, tanggal=None):
+    """
+    Simpan stok akhir hari `tanggal` (default kemarin) untuk semua produk,
+    dihitung dari snapshot sebelumnya + mutasi sejak itu. Snapshot
+    SNAPSHOT_HITUNG_ULANG hari sebelumnya ikut dihitung ulang. Tidak commit.
+    """
+    tanggal = tanggal or date.today() - timedelta(days=1)
+    mulai = tanggal - timedelta(days=SNAPSHOT_HITUNG_ULANG)
+    # dihapus dulu: SQL_STOK_PADA memakai snapshot hari itu sendiri bila masih ada
+    cur.execute("DELETE FROM snapshot_stok WHERE tanggal BETWEEN %s AND %s", (mulai, tanggal))
+    for i in range(SNAPSHOT_HITUNG_ULANG + 1):
+        tgl = mulai + timedelta(days=i)
+        cur.execute("""
+            INSERT INTO snapshot_stok (tanggal, produk_id, stok)
+            SELECT %(tgl)s, x.produk_id, x.stok
+            FROM (""" + SQL_STOK_PADA + """) x
+            ON CONFLICT (produk_id, tanggal) DO UPDATE SET stok = EXCLUDED.stok
+        """, {"tgl": tgl, "waktu": datetime.combine(tgl + timedelta(days=1), datetime.min.time())})
+    return cur.rowcount
+
+def cek_konsistensi_stok(cur):
+    """
+    produk.stok adalah cache dari buku mutasi. Return list
+    (produk_id, nama, stok_cache, stok_buku) untuk produk yang tidak cocok.
+    """
+    cur.execute("""
+        SELECT p.produk_id, p.nama_produk, p.stok, x.stok
+        FROM produk p
+        JOIN (""" + SQL_STOK_PADA + """) x ON x.produk_id = p.produk_id
+        WHERE p.stok <> x.stok
+        ORDER BY p.produk_id
+    """, {"waktu": datetime.max})
+    return cur.fetchall()
+
+def riwayat_stok(cur):
+    print("\n=== RIWAYAT & STOK PADA TANGGAL ===")
+    pid = pilih_produk(cur, "ID produk")
+    if pid is None:
+        return
+    tgl = input_tanggal("Stok per akhir tanggal (dd-mm-yyyy, default hari ini): ", date.today())
+    if not tgl:
+        print("Tanggal tidak valid.")
+        return
+    batas = datetime.combine(tgl + timedelta(days=1), datetime.min.time())
+    hasil = stok_pada(cur, batas, [pid])
+    if not hasil:
+        print("Produk tidak ditemukan.")
+        return
+    print(colored(f"\nStok {hasil[0][1]} pada akhir {tgl.strftime('%d-%m-%Y')}: {hasil[0][2]}", "cyan"))
+
+    cur.execute("""
+        SELECT waktu, jenis, perubahan, stok_setelah, keterangan
+        FROM mutasi_stok
+        WHERE produk_id = %s AND waktu < %s
+        ORDER BY waktu DESC, mutasi_id DESC
+        LIMIT %s
+    """, (pid, batas, HALAMAN))
+    rows = cur.fetchall()
+    if rows:
+        print(f"\n{len(rows)} mutasi terakhir sampai tanggal tersebut:")
+        print(tabulate([[r[0].strftime("%d-%m-%Y %H:%M"), r[1], f"{r[2]:+d}", r[3], r[4] or "-"]
+                        for r in rows],
+                       headers=["Waktu", "Jenis", "Perubahan", "Stok", "Keterangan"], tablefmt="grid"))
+
+def stok_opname(conn, cur):
+    """
+    Catat hasil hitung fisik. Selisih terhadap stok sistem dibukukan sebagai 'opname'.
+    """
+    print("\n=== STOK OPNAME ===")
+    hitung = {}
+    while True:
+        pid = pilih_produk(cur, "ID produk (enter selesai)")
+        if pid is None:
+            break
+        fisik = input_int("Jumlah fisik: ")
+        if fisik is None or fisik < 0:
+            print("Jumlah tidak valid.")
+            continue
+        hitung[pid] = fisik
+
+    if not hitung:
+        print("Tidak ada data opname.")
+        return
+    keterangan = input("Keterangan (mis. opname akhir bulan): ").strip() or "stok opname"
+
+    try:
+        tandai_mutasi(cur, "opname", keterangan)
+        cur.execute("""
+            UPDATE produk p
+            SET stok = x.fisik
+            FROM unnest(%s::int[], %s::int[]) AS x(produk_id, fisik)
+            WHERE p.produk_id = x.produk_id
+            RETURNING p.produk_id, p.nama_produk, x.fisik
+        """, (list(hitung), list(hitung.values())))
+        rows = cur.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("Gagal menyimpan opname:", e)
+        return
+    print(tabulate([[r[0], r[1], r[2]] for r in rows], headers=["ID", "Produk", "Stok Fisik"],
+                   tablefmt="grid"))
+    print(colored(f"Opname {len(rows)} produk tersimpan.", "green"))
+
+def snapshot_stok_cli():
+    """python "Projek FarmTech.py" --snapshot-stok [yyyy-mm-dd]  (default kemarin)"""
+    tanggal = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else None
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    try:
+        n = buat_snapshot_stok(cur, tanggal)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Snapshot stok {n} produk disimpan.")
+
+def cek_statistik_penjualan(cur):
+    """
+    Bandingkan terakhir_terjual / total_terjual / penjualan_produk_harian dengan histori.
+    Return list (produk_id, nama, kolom, tersimpan, histori) yang berbeda.
+    """
+    cur.execute("""
+        WITH histori AS (
+            SELECT p.produk_id, MAX(tp.tanggal_transaksi) AS terakhir, COALESCE(SUM(dp.qty), 0) AS total
+            FROM produk p
+            LEFT JOIN detail_penjualan dp ON dp.produk_id = p.produk_id
+            LEFT JOIN penjualan tp ON tp.penjualan_id = dp.penjualan_id
+            GROUP BY p.produk_id
+        ),
+        harian AS (
+            SELECT produk_id, SUM(qty) AS total FROM penjualan_produk_harian GROUP BY produk_id
+        )
+        SELECT p.produk_id, p.nama_produk, 'terakhir_terjual', p.terakhir_terjual::text, h.terakhir::text
+        FROM produk p JOIN histori h USING (produk_id)
+        WHERE p.terakhir_terjual IS DISTINCT FROM h.terakhir
+        UNION ALL
+        SELECT p.produk_id, p.nama_produk, 'total_terjual', p.total_terjual::text, h.total::text
+        FROM produk p JOIN histori h USING (produk_id)
+        WHERE p.total_terjual <> h.total
+        UNION ALL
+        SELECT p.produk_id, p.nama_produk, 'penjualan_produk_harian',
+               COALESCE(x.total, 0)::text, h.total::text
+        FROM produk p JOIN histori h USING (produk_id)
+        LEFT JOIN harian x USING (produk_id)
+        WHERE COALESCE(x.total, 0) <> h.total
+        ORDER BY 1, 3
+    """)
+    return cur.fetchall()
+
+def cek_terjual_cli():
+    """python "Projek FarmTech.py" --cek-terjual [--perbaiki]"""
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    try:
+        salah = cek_statistik_penjualan(cur)
+        if not salah:
+            print("LULUS: statistik penjualan per produk cocok dengan histori.")
+            return
+        print(tabulate(salah, headers=["ID", "Produk", "Kolom", "Tersimpan", "Histori"], tablefmt="grid"))
+        print(f"{len(salah)} selisih ditemukan.")
+        if "--perbaiki" in sys.argv:
+            cur.execute(SQL_ISI_STATISTIK_PENJUALAN)
+            conn.commit()
+            print("Statistik dihitung ulang dari histori.")
+        else:
+            sys.exit(1)
+    finally:
+        conn.close()
+
+def cek_stok_cli():
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    salah = cek_konsistensi_stok(cur)
+    conn.close()
+    if not salah:
+        print("LULUS: produk.stok cocok dengan buku mutasi untuk semua produk.")
+        return
+    print(tabulate(salah, headers=["ID", "Produk", "Stok (cache)", "Stok (buku)"], tablefmt="grid"))
+    print(f"{len(salah)} produk tidak cocok.")
+    sys.exit(1)
+
 #--------------------------
 #Manajemen Supplier
 #--------------------------
 def list_supplier(cur):
-    cur.execute("SELECT supplier_id, nama_supplier, alamat, no_hp FROM supplier ORDER BY supplier_id")
-    rows = cur.fetchall()
-    print(tabulate(rows, headers=["ID","Supplier","Alamat","No HP"], tablefmt="grid"))
+    rows, _ = tampilkan_per_halaman(cur, """
+        SELECT supplier_id, nama_supplier, alamat, no_hp
+        FROM supplier
+        WHERE TRUE
+    """, (), "supplier_id", ["ID","Supplier","Alamat","No HP"], list,
+        "Belum ada supplier.")
     return rows
 
 def tambah_supplier(conn, cur):
@@ -1515,11 +2862,63 @@ def increment_member_tx(conn, cur, member_id):
 # -------------------------
 # Penjualan
 # -------------------------
-def get_produk(cur, produk_id):
-    cur.execute("SELECT produk_id, nama_produk, harga, stok FROM produk WHERE produk_id = %s", (produk_id,))
-    return cur.fetchone()
-
 PPN_RATE = 0.12
+def item_keranjang(prod, qty):
+    """Baris keranjang dari entri katalog; harga memakai harga akhir (setelah markdown)."""
+    return {
+        "produk_id": prod["id"],
+        "nama": prod["nama"],
+        "harga": prod["harga_akhir"],
+        "qty": qty,
+        "harga_asli": prod["harga"]
+    }
+
+def cek_harga(cur):
+    """
+    Cek harga cepat dari cache: scan barcode atau ketik ID produk.
+    """
+    print("\n=== CEK HARGA ===")
+    for kode, _ in baca_scan("Scan barcode / ID produk (Enter = selesai)"):
+        prod = katalog_by_kode(cur, kode)
+        if not prod and kode.isdigit():
+            prod = katalog_get(cur, int(kode))
+        if not prod:
+            print(f"Produk {kode} tidak ditemukan.")
+            continue
+        print(tabulate([[prod["id"], prod["nama"], format_rp(prod["harga"]),
+                         f"{prod['diskon']}%", format_rp(prod["harga_akhir"]), prod["stok"]]],
+                       headers=["ID", "Produk", "Harga Dasar", "Markdown", "Harga Akhir", "Stok"],
+                       tablefmt="grid"))
+
+def scan_keranjang_penjualan(cur):
+    """
+    Isi keranjang dari scanner barcode. Kode dicari di cache katalog (O(1)),
+    scan berulang untuk produk yang sama digabung menjadi satu baris.
+    """
+    print("Mode scan: scan barcode (atau qty*kode), Enter kosong untuk selesai.")
+    cart = []
+    baris = {}   # produk_id -> item keranjang
+    for kode, qty in baca_scan():
+        prod = katalog_by_kode(cur, kode)
+        if not prod:
+            print(f"Kode {kode} tidak dikenal.")
+            continue
+
+        it = baris.get(prod["id"])
+        jumlah = qty + (it["qty"] if it else 0)
+        if prod["stok"] < jumlah:
+            print(f"Stok {prod['nama']} tidak cukup (stok: {prod['stok']}).")
+            continue
+
+        if it:
+            it["qty"] = jumlah
+        else:
+            it = item_keranjang(prod, jumlah)
+            baris[prod["id"]] = it
+            cart.append(it)
+        print(f"  {it['nama']} x{it['qty']} = {format_rp(it['harga'] * it['qty'])}")
+    return cart
+
 def transaksi_penjualan(conn, cur, pegawai):
     print("\n=== TRANSAKSI PENJUALAN ===")
 
@@ -1537,140 +2936,432 @@ def transaksi_penjualan(conn, cur, pegawai):
 
     # --- KERANJANG ---
     cart = []
-    while True:
-        list_produk(cur)
-        pid = input_int("Masukkan ID produk (enter untuk selesai): ")
-        if pid is None:
-            break
+    if input("Mode scan barcode? (y/n): ").lower() == "y":
+        cart = scan_keranjang_penjualan(cur)
+    else:
+        while True:
+            pid = pilih_produk(cur, "Masukkan ID produk (enter untuk selesai)")
+            if pid is None:
+                break
 
-        prod = get_produk(cur, pid)   # (id, nama, harga, stok)
-        if not prod:
-            print("Produk tidak ditemukan.")
-            continue
+            prod = katalog_get(cur, pid)
+            if not prod:
+                print("Produk tidak ditemukan.")
+                continue
 
-        qty = input_int("Jumlah: ")
-        if qty is None or qty <= 0:
-            print("Jumlah tidak valid.")
-            continue
+            qty = input_int("Jumlah: ")
+            if qty is None or qty <= 0:
+                print("Jumlah tidak valid.")
+                continue
 
-        if prod[3] < qty:
-            print(f"Stok tidak cukup (stok: {prod[3]}).")
-            continue
+            if prod["stok"] < qty:
+                print(f"Stok tidak cukup (stok: {prod['stok']}).")
+                continue
 
-        # --- CEK DISKON BARANG TIDAK LAKU ---
-        cur.execute("""
-            SELECT diskon_otomatis 
-            FROM barang_tidak_laku 
-            WHERE produk_id = %s
-        """, (prod[0],))
-        d = cur.fetchone()
+            # --- DISKON BARANG TIDAK LAKU (sudah ada di cache harga) ---
+            if prod["diskon"]:
+                print(
+                    f"Produk ini termasuk TIDAK LAKU (diskon {prod['diskon']}%). "
+                    f"Harga: {format_rp(prod['harga'])} → {format_rp(prod['harga_akhir'])}"
+                )
 
-        harga_asli = prod[2]
+            # Masukkan ke keranjang
+            cart.append(item_keranjang(prod, qty))
 
-        if d:
-            diskon_persen = d[0]
-            harga_setelah_diskon = int(harga_asli * (1 - (diskon_persen / 100)))
-            print(
-                f"Produk ini termasuk TIDAK LAKU (diskon {diskon_persen}%). "
-                f"Harga: {format_rp(harga_asli)} → {format_rp(harga_setelah_diskon)}"
-            )
-            harga_dipakai = harga_setelah_diskon
-        else:
-            harga_dipakai = harga_asli
-
-        # Masukkan ke keranjang
-        cart.append({
-            "produk_id": prod[0],
-            "nama": prod[1],
-            "harga": harga_dipakai,
-            "qty": qty,
-            "harga_asli": harga_asli
-        })
-
-        if input("Tambah produk lain? (y/n): ").lower() != "y":
-            break
+            if input("Tambah produk lain? (y/n): ").lower() != "y":
+                break
 
     if not cart:
         print("Transaksi dibatalkan (keranjang kosong).")
         return
 
-    # --- TAMPILKAN KERANJANG ---
-    table = []
-    subtotal = 0
-    for it in cart:
-        sub = it["harga"] * it["qty"]
-        subtotal += sub
-        table.append([
-            it["produk_id"],
-            it["nama"],
-            format_rp(it["harga"]),
-            it["qty"],
-            format_rp(sub)
-        ])
+    while True:
+        # --- TAMPILKAN KERANJANG ---
+        table = []
+        subtotal = 0
+        for it in cart:
+            sub = it["harga"] * it["qty"]
+            subtotal += sub
+            table.append([
+                it["produk_id"],
+                it["nama"],
+                format_rp(it["harga"]),
+                it["qty"],
+                format_rp(sub)
+            ])
+
+        print(tabulate(table, headers=["ID", "Produk", "Harga", "Qty", "Subtotal"], tablefmt="grid"))
+
+        # --- HITUNG PPN ---
+        ppn = int(subtotal * PPN_RATE)
+
+        # --- DISKON MEMBER (tiap kelipatan 10 transaksi) ---
+        diskon_rate = 0.0
+        if member_id:
+            cur.execute("SELECT total_transaksi FROM member WHERE member_id = %s", (member_id,))
+            tt = cur.fetchone()[0] or 0
+            if tt > 0 and tt % 10 == 0:
+                diskon_rate = 0.10
+
+        diskon_member = int(subtotal * diskon_rate)
+
+        total = subtotal + ppn - diskon_member
+
+        print(f"\nSubtotal: {format_rp(subtotal)}")
+        print(f"PPN (12%): {format_rp(ppn)}")
+        print(f"Diskon member: {format_rp(diskon_member)}")
+        print(f"TOTAL: {format_rp(total)}")
+
+        if input("Simpan transaksi? (y/n): ").lower() != "y":
+            print("Transaksi dibatalkan.")
+            return
 
-    print(tabulate(table, headers=["ID", "Produk", "Harga", "Qty", "Subtotal"], tablefmt="grid"))
+        try:
+            penjualan_id, kurang = simpan_penjualan(
+                conn, cur, pegawai["pegawai_id"], member_id, cart,
+                subtotal, ppn, diskon_member, total
+            )
+        except Exception as e:
+            conn.rollback()
+            print("Gagal menyimpan transaksi:", e)
+            return
 
-    # --- HITUNG PPN ---
-    ppn = int(subtotal * PPN_RATE)
+        if penjualan_id:
+            print(f"Transaksi tersimpan (ID = {penjualan_id}).")
+            return
 
-    # --- DISKON MEMBER (tiap kelipatan 10 transaksi) ---
-    diskon_rate = 0.0
-    if member_id:
-        cur.execute("SELECT total_transaksi FROM member WHERE member_id = %s", (member_id,))
-        tt = cur.fetchone()[0] or 0
-        if tt > 0 and tt % 10 == 0:
-            diskon_rate = 0.10
+        # --- STOK SUDAH DIAMBIL KASIR LAIN ---
+        print("\nStok tidak cukup saat transaksi disimpan:")
+        print(tabulate(
+            [[pid, diminta, stok] for pid, diminta, stok in kurang],
+            headers=["ID", "Diminta", "Stok Tersedia"], tablefmt="grid"
+        ))
+        gagal = {pid for pid, _, _ in kurang}
+        cart = [it for it in cart if it["produk_id"] not in gagal]
+        if not cart:
+            print("Transaksi dibatalkan (keranjang kosong).")
+            return
+        print("Produk di atas dikeluarkan dari keranjang.\n")
+
+SQL_SIMPAN_PENJUALAN = """
+    WITH baris AS (
+        SELECT b.produk_id, b.qty, b.harga, b.urut
+        FROM unnest(%(produk)s::int[], %(qty)s::int[], %(harga)s::int[])
+             WITH ORDINALITY AS b(produk_id, qty, harga, urut)
+    ),
+    header AS (
+        INSERT INTO penjualan
+        (kasir_id, member_id, tanggal_transaksi, subtotal, ppn, diskon, total_harga)
+        VALUES (%(kasir)s, %(member)s, NOW(), %(subtotal)s, %(ppn)s, %(diskon)s, %(total)s)
+        RETURNING penjualan_id
+    ),
+    detail AS (
+        INSERT INTO detail_penjualan (penjualan_id, produk_id, qty, harga_saat_penjualan)
+        SELECT h.penjualan_id, b.produk_id, b.qty, b.harga
+        FROM header h CROSS JOIN baris b
+        ORDER BY b.urut
+    ),
+    kurangi_stok AS (
+        UPDATE produk p
+        SET stok = p.stok - x.qty,
+            terakhir_terjual = NOW(),
+            total_terjual = p.total_terjual + x.qty
+        FROM (SELECT produk_id, SUM(qty) AS qty FROM baris GROUP BY produk_id) x
+        WHERE p.produk_id = x.produk_id
+          AND p.stok >= x.qty
+    ),
+    harian AS (
+        INSERT INTO penjualan_produk_harian AS h (tanggal, produk_id, qty)
+        SELECT CURRENT_DATE, produk_id, SUM(qty) FROM baris GROUP BY produk_id
+        ON CONFLICT (produk_id, tanggal) DO UPDATE SET qty = h.qty + EXCLUDED.qty
+    ),
+    hapus_tidak_laku AS (
+        -- produk tidak laku yang terjual keluar dari daftar
+        DELETE FROM barang_tidak_laku
+        WHERE produk_id IN (SELECT produk_id FROM baris)
+    ),
+    tambah_tx_member AS (
+        UPDATE member
+        SET total_transaksi = total_transaksi + 1
+        WHERE member_id = %(member)s
+    )
+    SELECT penjualan_id FROM header
+"""
+
+def kunci_stok(cur, cart):
+    """
+    Kunci baris produk di keranjang (urut produk_id agar tidak deadlock antar kasir)
+    lalu cek stok. Return list (produk_id, diminta, stok) untuk produk yang kurang.
+    """
+    diminta = {}
+    for it in cart:
+        diminta[it["produk_id"]] = diminta.get(it["produk_id"], 0) + it["qty"]
 
-    diskon_member = int(subtotal * diskon_rate)
+    cur.execute("""
+        SELECT produk_id, stok
+        FROM produk
+        WHERE produk_id = ANY(%s)
+        ORDER BY produk_id
+        FOR UPDATE
+    """, (list(diminta),))
+    stok = dict(cur.fetchall())
 
-    total = subtotal + ppn - diskon_member
+    return [(pid, qty, stok.get(pid, 0)) for pid, qty in sorted(diminta.items())
+            if stok.get(pid, 0) < qty]
 
-    print(f"\nSubtotal: {format_rp(subtotal)}")
-    print(f"PPN (12%): {format_rp(ppn)}")
-    print(f"Diskon member: {format_rp(diskon_member)}")
-    print(f"TOTAL: {format_rp(total)}")
+def simpan_penjualan(conn, cur, kasir_id, member_id, cart, subtotal, ppn, diskon, total):
+    """
+    Simpan header, semua detail, pengurangan stok, pembersihan barang tidak laku
+    dan total transaksi member dalam SATU statement + satu commit,
+    berapa pun jumlah baris keranjang.
 
-    if input("Simpan transaksi? (y/n): ").lower() != "y":
-        print("Transaksi dibatalkan.")
-        return
+    Stok baru dikunci saat commit (kunci_stok). Jika ada produk yang stoknya
+    sudah tidak cukup, tidak ada yang disimpan dan hasilnya (None, kurang).
+    """
+    kurang = kunci_stok(cur, cart)
+    if kurang:
+        conn.rollback()
+        return None, kurang
+
+    tandai_mutasi(cur, "penjualan")
+    cur.execute(SQL_SIMPAN_PENJUALAN, {
+        "produk": [it["produk_id"] for it in cart],
+        "qty": [it["qty"] for it in cart],
+        "harga": [it["harga"] for it in cart],
+        "kasir": kasir_id,
+        "member": member_id,
+        "subtotal": subtotal,
+        "ppn": ppn,
+        "diskon": diskon,
+        "total": total,
+    })
+    penjualan_id = cur.fetchone()[0]
+    conn.commit()
+    return penjualan_id, []
 
-    # --- SIMPAN HEADER TRANSAKSI ---
+def _simpan_penjualan_per_baris(cur, kasir_id, member_id, cart, subtotal, ppn, diskon, total):
+    # Jalur lama (3 query per baris + update member), hanya untuk pembanding benchmark.
     cur.execute("""
-        INSERT INTO penjualan 
+        INSERT INTO penjualan
         (kasir_id, member_id, tanggal_transaksi, subtotal, ppn, diskon, total_harga)
         VALUES (%s,%s,NOW(),%s,%s,%s,%s)
         RETURNING penjualan_id
-    """, (pegawai["pegawai_id"], member_id, subtotal, ppn, diskon_member, total))
+    """, (kasir_id, member_id, subtotal, ppn, diskon, total))
     penjualan_id = cur.fetchone()[0]
-
-    # --- SIMPAN DETAIL + UPDATE STOK ---
     for it in cart:
         cur.execute("""
             INSERT INTO detail_penjualan (penjualan_id, produk_id, qty, harga_saat_penjualan)
             VALUES (%s,%s,%s,%s)
         """, (penjualan_id, it["produk_id"], it["qty"], it["harga"]))
+        cur.execute("UPDATE produk SET stok = stok - %s WHERE produk_id = %s",
+                    (it["qty"], it["produk_id"]))
+        cur.execute("DELETE FROM barang_tidak_laku WHERE produk_id = %s", (it["produk_id"],))
+    if member_id:
+        cur.execute("UPDATE member SET total_transaksi = total_transaksi + 1 WHERE member_id = %s",
+                    (member_id,))
+    return penjualan_id
 
-        cur.execute(
-            "UPDATE produk SET stok = stok - %s WHERE produk_id = %s",
-            (it["qty"], it["produk_id"])
-        )
-
-        # --- PRODUK TIDAK LAKU TERJUAL → HAPUS DARI TABEL ---
-        cur.execute(
-            "DELETE FROM barang_tidak_laku WHERE produk_id = %s",
-            (it["produk_id"],)
-        )
+def benchmark_checkout(ukuran=(1, 5, 10, 30, 60), ulang=20):
+    """
+    Bandingkan latensi simpan transaksi jalur lama (per baris) vs jalur batch.
+    Setiap percobaan di-rollback sehingga data tidak berubah.
+    """
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    cur.execute("SELECT pegawai_id FROM pegawai ORDER BY pegawai_id LIMIT 1")
+    kasir = cur.fetchone()
+    cur.execute("SELECT produk_id, harga FROM produk ORDER BY produk_id")
+    produk = cur.fetchall()
+    cur.execute("SELECT member_id FROM member ORDER BY member_id LIMIT 1")
+    member = cur.fetchone()
+    conn.rollback()
+    if not kasir or not produk:
+        print("Butuh minimal satu pegawai dan satu produk untuk benchmark.")
+        conn.close()
+        return
 
-    # Update total transaksi member
-    if member_id:
-        increment_member_tx(conn, cur, member_id)
+    member_id = member[0] if member else None
+    hasil = []
+    for n in ukuran:
+        cart = [{"produk_id": produk[i % len(produk)][0], "qty": 1,
+                 "harga": produk[i % len(produk)][1]} for i in range(n)]
+        subtotal = sum(it["harga"] for it in cart)
+        args = (kasir[0], member_id, cart, subtotal, 0, 0, subtotal)
+
+        waktu = {}
+        for nama, fn in (("per_baris", _simpan_penjualan_per_baris), ("batch", None)):
+            total_ms = 0.0
+            for _ in range(ulang):
+                mulai = time.perf_counter()
+                if fn:
+                    fn(cur, *args)
+                else:
+                    cur.execute(SQL_SIMPAN_PENJUALAN, {
+                        "produk": [it["produk_id"] for it in cart],
+                        "qty": [it["qty"] for it in cart],
+                        "harga": [it["harga"] for it in cart],
+                        "kasir": args[0], "member": args[1], "subtotal": args[3],
+                        "ppn": args[4], "diskon": args[5], "total": args[6],
+                    })
+                    cur.fetchone()
+                total_ms += (time.perf_counter() - mulai) * 1000
+                conn.rollback()
+            waktu[nama] = total_ms / ulang
+
+        hasil.append([n, 3 * n + 2, 1, f"{waktu['per_baris']:.2f}", f"{waktu['batch']:.2f}",
+                      f"{waktu['per_baris'] / waktu['batch']:.1f}x"])
 
-    conn.commit()
-    print(f"Transaksi tersimpan (ID = {penjualan_id}).")
+    conn.close()
+    print(tabulate(hasil, headers=["Baris", "Query lama", "Query batch",
+                                   "Lama (ms)", "Batch (ms)", "Percepatan"], tablefmt="grid"))
 
 # -------------------------
 # Pembelian / Restock
 # -------------------------
+def scan_item_restock(cur):
+    """
+    Isi daftar restock dari scanner barcode. Scan berulang digabung per produk,
+    harga beli memakai harga beli terakhir produk.
+    Return list (produk_id, qty, harga_beli).
+    """
+    print("Mode scan: scan barcode (atau qty*kode), Enter kosong untuk selesai.")
+    jumlah = {}
+    for kode, qty in baca_scan():
+        prod = katalog_by_kode(cur, kode)
+        if not prod:
+            print(f"Kode {kode} tidak dikenal.")
+            continue
+        jumlah[prod["id"]] = jumlah.get(prod["id"], 0) + qty
+        print(f"  {prod['nama']} x{jumlah[prod['id']]}")
+
+    if not jumlah:
+        return []
+
+    cur.execute("""
+        SELECT produk_id, nama_produk, harga_beli
+        FROM produk
+        WHERE produk_id = ANY(%s)
+        ORDER BY produk_id
+    """, (list(jumlah),))
+    rows = cur.fetchall()
+    print(tabulate([[r[0], r[1], jumlah[r[0]], format_rp(r[2])] for r in rows],
+                   headers=["ID", "Produk", "Qty", "Harga Beli"], tablefmt="grid"))
+    return [(r[0], jumlah[r[0]], r[2]) for r in rows]
+
+SQL_SIMPAN_PEMBELIAN = """
+    WITH baris AS (
+        SELECT * FROM unnest(%(produk)s::int[], %(qty)s::int[], %(harga_beli)s::int[])
+            AS b(produk_id, qty, harga_beli)
+    ),
+    header AS (
+        INSERT INTO pembelian (supplier_id, tanggal_pembelian, total_pembelian)
+        SELECT %(supplier_id)s, NOW(), SUM(qty * harga_beli) FROM baris
+        RETURNING pembelian_id, total_pembelian
+    ),
+    detail AS (
+        INSERT INTO detail_pembelian (pembelian_id, produk_id, qty, harga_beli)
+        SELECT h.pembelian_id, b.produk_id, b.qty, b.harga_beli
+        FROM header h, baris b
+    ),
+    -- satu UPDATE per produk; produk yang muncul beberapa kali di faktur
+    -- memakai rata-rata tertimbang harga belinya
+    per_produk AS (
+        SELECT produk_id, SUM(qty) AS qty, SUM(qty * harga_beli) AS nilai,
+               ROUND(SUM(qty * harga_beli)::numeric / SUM(qty))::int AS harga_beli
+        FROM baris
+        GROUP BY produk_id
+    ),
+    stok AS (
+        -- HPP rata-rata bergerak: (stok lama x HPP lama + nilai beli) / stok baru
+        UPDATE produk p
+        SET stok = p.stok + x.qty,
+            harga_beli = x.harga_beli,   -- harga beli terbaru
+            hpp_rata = ROUND((GREATEST(p.stok, 0) * COALESCE(p.hpp_rata, p.harga_beli) + x.nilai)
+                             / (GREATEST(p.stok, 0) + x.qty), 2)
+        FROM per_produk x
+        WHERE p.produk_id = x.produk_id
+    )
+    SELECT pembelian_id, total_pembelian FROM header
+"""
+
+def simpan_pembelian(cur, supplier_id, items):
+    """
+    Header, semua detail, stok dan harga beli dalam satu statement.
+    items: list (produk_id, qty, harga_beli). Tidak commit.
+    Return (pembelian_id, total).
+    """
+    tandai_mutasi(cur, "pembelian")
+    cur.execute(SQL_SIMPAN_PEMBELIAN, {
+        "supplier_id": supplier_id,
+        "produk": [i[0] for i in items],
+        "qty": [i[1] for i in items],
+        "harga_beli": [i[2] for i in items],
+    })
+    return cur.fetchone()
+
+def baca_faktur_restock(cur, berkas):
+    """
+    Baca faktur supplier (CSV/XLSX: kode_barang / nama_produk / produk_id, qty, harga_beli).
+    Baris yang harga belinya melebihi harga jual ditandai sekaligus, lalu
+    diputuskan bersama: naikkan harga jual semuanya atau lewati baris tersebut.
+    Return list (produk_id, qty, harga_beli), atau None jika dibatalkan.
+    Transaksi dibiarkan terbuka (staging + kenaikan harga) untuk disimpan pemanggil.
+    """
+    spec = IMPOR_DATA["faktur"]
+    total, ditolak = muat_impor(cur, "faktur", berkas)
+    print(f"\n{total} baris faktur dibaca, {ditolak} ditolak.")
+    if ditolak:
+        tampilkan_tolak(cur)
+        keluar = _berkas_tolak(berkas)
+        simpan_tolak(cur, keluar)
+        print(f"Baris yang ditolak disimpan di {keluar}")
+        if input("Lanjutkan tanpa baris yang ditolak? (y/n): ").lower() != "y":
+            return None
+
+    # kunci join lewat _angka: baris yang ditolak bisa ikut dievaluasi sebelum filter impor_tolak
+    cur.execute(f"""
+        SELECT s.baris, p.produk_id, p.nama_produk, {_angka('s.qty')}, {_angka('s.harga_beli')}, p.harga
+        FROM impor_stg s
+        JOIN produk p ON p.produk_id = {_angka('s.produk_id')}
+        WHERE NOT EXISTS (SELECT 1 FROM impor_tolak t WHERE t.baris = s.baris)
+        ORDER BY s.baris
+    """)
+    rows = cur.fetchall()
+    if not rows:
+        print(f"Tidak ada baris {spec['judul'].lower()} yang valid.")
+        return None
+
+    rugi = [r for r in rows if r[4] > r[5]]
+    if rugi:
+        print(colored(f"\n{len(rugi)} baris: harga beli lebih tinggi dari harga jual saat ini!", "yellow"))
+        print(tabulate([[r[0], r[1], r[2], format_rp(r[4]), format_rp(r[5])] for r in rugi],
+                       headers=["Baris", "ID", "Produk", "Harga Beli", "Harga Jual"], tablefmt="grid"))
+        print("1. Naikkan harga jual semua produk ini (harga beli + margin)")
+        print("2. Lewati baris-baris ini")
+        print("3. Batal")
+        pilih = input("Pilih: ").strip()
+        if pilih == "1":
+            margin = input_int("Margin (%) di atas harga beli (default 25): ", default=25)
+            if margin is None or margin < 0:
+                print("Margin tidak valid.")
+                return None
+            cur.execute("""
+                UPDATE produk p
+                SET harga = GREATEST(p.harga, CEIL(x.harga_beli * (100 + %s) / 100.0)::int)
+                FROM (SELECT produk_id, MAX(harga_beli) AS harga_beli
+                      FROM unnest(%s::int[], %s::int[]) AS u(produk_id, harga_beli)
+                      GROUP BY produk_id) x
+                WHERE p.produk_id = x.produk_id
+            """, (margin, [r[1] for r in rugi], [r[4] for r in rugi]))
+            print(f"Harga jual {cur.rowcount} produk dinaikkan.")
+        elif pilih == "2":
+            lewati = {r[0] for r in rugi}
+            rows = [r for r in rows if r[0] not in lewati]
+        else:
+            return None
+
+    return [(r[1], r[3], r[4]) for r in rows]
+
 def restock_pembelian(conn, cur):
     print("\n=== RESTOCK / PEMBELIAN ===")
     list_supplier(cur)
@@ -1686,153 +3377,384 @@ def restock_pembelian(conn, cur):
         return
 
     items = []
+    print("Sumber item: 1. Input manual  2. Scan barcode  3. Berkas faktur supplier (CSV/XLSX)")
+    sumber = input("Pilih (default 1): ").strip() or "1"
+    if sumber == "2":
+        items = scan_item_restock(cur)
+    elif sumber == "3":
+        berkas = input("Path berkas faktur: ").strip().strip('"')
+        if not os.path.isfile(berkas):
+            print("Berkas tidak ditemukan.")
+            return
+        try:
+            items = baca_faktur_restock(cur, berkas)
+        except Exception as e:
+            conn.rollback()
+            print("Gagal membaca faktur:", e)
+            return
+        if items is None:
+            conn.rollback()
+            print("Restock dibatalkan.")
+            return
+    else:
+        while True:
+            pid = pilih_produk(cur, "ID produk (enter batal)")
+            if pid is None:
+                break
 
-    while True:
-        list_produk(cur)
-        pid = input_int("ID produk (enter batal): ")
-        if pid is None:
-            break
-
-        # Ambil data produk
-        cur.execute("SELECT produk_id, nama_produk, harga, harga_beli FROM produk WHERE produk_id = %s", (pid,))
-        p = cur.fetchone()
-        if not p:
-            print("Produk tidak ada.")
-            continue
-
-        produk_id, nama_produk, harga_jual, harga_beli_lama = p
+            # Ambil data produk
+            cur.execute("SELECT produk_id, nama_produk, harga, harga_beli FROM produk WHERE produk_id = %s", (pid,))
+            p = cur.fetchone()
+            if not p:
+                print("Produk tidak ada.")
+                continue
 
-        qty = input_int("Jumlah beli: ")
-        if qty is None or qty <= 0:
-            print("Jumlah tidak valid.")
-            continue
+            produk_id, nama_produk, harga_jual, harga_beli_lama = p
 
-        # Input harga beli baru
-        harga_beli_baru = input_int(f"Harga beli per unit (default {harga_beli_lama}): ", default=harga_beli_lama)
+            qty = input_int("Jumlah beli: ")
+            if qty is None or qty <= 0:
+                print("Jumlah tidak valid.")
+                continue
 
-        # Validasi harga jual >= harga beli
-        # Harga beli wajib positif
-        if harga_beli_baru is None or harga_beli_baru <= 0:
-            print("Harga beli tidak valid.")
-            continue
+            # Input harga beli baru
+            harga_beli_baru = input_int(f"Harga beli per unit (default {harga_beli_lama}): ", default=harga_beli_lama)
 
-        # Jika harga beli lebih tinggi dari harga jual → bukan batal, tapi pembeli harus menaikkan harga jual
-        if harga_beli_baru > harga_jual:
-            print("\n Harga beli BARU lebih tinggi dari harga jual saat ini!")
-            print(f"- Harga jual saat ini : {harga_jual}")
-            print(f"- Harga beli baru    : {harga_beli_baru}")
-
-            konfirm = input("Naikkan harga jual agar tidak rugi? (y/n): ").lower()
-            if konfirm == "y":
-                harga_jual_baru = input_int("Masukkan harga jual baru: ")
-                if harga_jual_baru is None or harga_jual_baru <= 0:
-                    print("Harga jual tidak valid. Item dibatalkan.")
-                    continue
+            # Validasi harga jual >= harga beli
+            # Harga beli wajib positif
+            if harga_beli_baru is None or harga_beli_baru <= 0:
+                print("Harga beli tidak valid.")
+                continue
 
-                if harga_jual_baru < harga_beli_baru:
-                    print("Harga jual tidak boleh lebih rendah dari harga beli! Item dibatalkan.")
+            # Jika harga beli lebih tinggi dari harga jual → bukan batal, tapi pembeli harus menaikkan harga jual
+            if harga_beli_baru > harga_jual:
+                print("\n Harga beli BARU lebih tinggi dari harga jual saat ini!")
+                print(f"- Harga jual saat ini : {harga_jual}")
+                print(f"- Harga beli baru    : {harga_beli_baru}")
+
+                konfirm = input("Naikkan harga jual agar tidak rugi? (y/n): ").lower()
+                if konfirm == "y":
+                    harga_jual_baru = input_int("Masukkan harga jual baru: ")
+                    if harga_jual_baru is None or harga_jual_baru <= 0:
+                        print("Harga jual tidak valid. Item dibatalkan.")
+                        continue
+
+                    if harga_jual_baru < harga_beli_baru:
+                        print("Harga jual tidak boleh lebih rendah dari harga beli! Item dibatalkan.")
+                        continue
+
+                    # Update harga jual produk
+                    cur.execute("""
+                        UPDATE produk 
+                        SET harga = %s
+                        WHERE produk_id = %s
+                        """, (harga_jual_baru, produk_id))
+
+                    harga_jual = harga_jual_baru  # update variabel untuk dipakai
+                else:
+                    print("Item dibatalkan.")
                     continue
 
-                # Update harga jual produk
-                cur.execute("""
-                    UPDATE produk 
-                    SET harga = %s
-                    WHERE produk_id = %s
-                    """, (harga_jual_baru, produk_id))
+            # Simpan ke data keranjang pembelian
+            items.append((pid, qty, harga_beli_baru))
 
-                harga_jual = harga_jual_baru  # update variabel untuk dipakai
-            else:
-                print("Item dibatalkan.")
-                continue
-
-        # Simpan ke data keranjang pembelian
-        items.append((pid, qty, harga_beli_baru))
-
-        if input("Tambah barang lagi? (y/n): ").lower() != "y":
-            break
+            if input("Tambah barang lagi? (y/n): ").lower() != "y":
+                break
 
     if not items:
+        conn.rollback()
         print("Tidak ada item. Batal.")
         return
 
-    # Hitung total pembelian
-    total = sum(q * h for (_, q, h) in items)
-
-    #  Insert header pembelian
-    cur.execute("""
-        INSERT INTO pembelian (supplier_id, tanggal_pembelian, total_pembelian)
-        VALUES (%s, NOW(), %s) RETURNING pembelian_id
-    """, (sid, total))
-    pembelian_id = cur.fetchone()[0]
-
-    # insert per item + update stok + update harga beli produk
-    for pid, qty, harga_beli_baru in items:
+    try:
+        pembelian_id, total = simpan_pembelian(cur, sid, items)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("Gagal menyimpan pembelian:", e)
+        return
 
-        # detail pembelian
-        cur.execute("""
-            INSERT INTO detail_pembelian (pembelian_id, produk_id, qty, harga_beli)
-            VALUES (%s, %s, %s, %s)
-        """, (pembelian_id, pid, qty, harga_beli_baru))
+    print(f"Pembelian tersimpan (ID = {pembelian_id}), {len(items)} baris, Total = {format_rp(total)}")
 
-        # update stok
-        cur.execute("""
-            UPDATE produk 
-            SET stok = stok + %s,
-                harga_beli = %s   -- update harga beli terbaru
-            WHERE produk_id = %s
-        """, (qty, harga_beli_baru, pid))
+# -------------------------
+# Antrian teknisi
+# -------------------------
+# teknisi_id -> {"id", "nama", "keahlian", "jumlah", "jam", "versi"}
+# Beban = servis berstatus Proses (jumlah & total estimasi jam). Tiap teknisi
+# punya entri (jam, jumlah, teknisi_id, versi) di heap keahliannya (None = umum)
+# dan di heap "*" (semua teknisi). Entri lama tidak dicari-cari untuk dihapus:
+# versinya kalah dan dibuang begitu naik ke puncak heap.
+# Disinkronkan lewat NOTIFY 'antrian_teknisi' dari trigger servis & teknisi.
+ANTRIAN_TEKNISI = {}
+_heap_teknisi = {}
+_antrian_lock = threading.Lock()
+_antrian_listener = None
+
+ESTIMASI_JAM_DEFAULT = 2
+
+SQL_BEBAN_TEKNISI = """
+    SELECT t.teknisi_id, t.nama, t.keahlian,
+           COUNT(s.servis_id), COALESCE(SUM(s.estimasi_jam), 0)
+    FROM teknisi t
+    LEFT JOIN servis s ON s.teknisi_id = t.teknisi_id AND s.status_servis = 'Proses'
+"""
+
+def _kunci_keahlian(keahlian):
+    return keahlian.strip().lower() if keahlian and keahlian.strip() else None
+
+def _pasang_teknisi(r):
+    lama = ANTRIAN_TEKNISI.get(r[0])
+    t = {"id": r[0], "nama": r[1], "keahlian": r[2], "jumlah": r[3], "jam": float(r[4]),
+         "versi": lama["versi"] + 1 if lama else 0}
+    ANTRIAN_TEKNISI[r[0]] = t
+    entri = (t["jam"], t["jumlah"], t["id"], t["versi"])
+    for kunci in (_kunci_keahlian(t["keahlian"]), "*"):
+        heapq.heappush(_heap_teknisi.setdefault(kunci, []), entri)
+
+def _entri_basi(entri):
+    t = ANTRIAN_TEKNISI.get(entri[2])
+    return t is None or t["versi"] != entri[3]
+
+def _rapikan_heap():
+    # entri basi menumpuk kalau banyak perubahan; bangun ulang sesekali
+    for kunci, heap in list(_heap_teknisi.items()):
+        if len(heap) > 4 * len(ANTRIAN_TEKNISI) + 16:
+            heap[:] = [e for e in heap if not _entri_basi(e)]
+            heapq.heapify(heap)
+
+def _buka_listener_antrian():
+    try:
+        listener = buka_koneksi()
+        listener.autocommit = True
+        listener.cursor().execute("LISTEN antrian_teknisi")
+        return listener
+    except Exception:
+        return None
 
-    conn.commit()
+def antrian_segarkan(cur):
+    """
+    Pastikan ANTRIAN_TEKNISI sesuai database, pola sama dengan katalog_segarkan:
+    muat penuh sekali, lalu hanya teknisi yang dikabarkan berubah.
+    """
+    global _antrian_listener
+    with _antrian_lock:
+        ids = None
+        if _antrian_listener is not None:
+            try:
+                _antrian_listener.poll()
+                ids = {n.payload for n in _antrian_listener.notifies}
+                _antrian_listener.notifies.clear()
+            except KONEKSI_PUTUS:
+                _antrian_listener = None
+
+        if _antrian_listener is None:
+            _antrian_listener = _buka_listener_antrian()
+            cur.execute(SQL_BEBAN_TEKNISI + " GROUP BY t.teknisi_id")
+            ANTRIAN_TEKNISI.clear()
+            _heap_teknisi.clear()
+            for r in cur.fetchall():
+                _pasang_teknisi(r)
+            return
 
-    print(f"Pembelian tersimpan (ID = {pembelian_id}), Total = {format_rp(total)}")
+        if ids:
+            ids = [int(i) for i in ids]
+            cur.execute(SQL_BEBAN_TEKNISI + " WHERE t.teknisi_id = ANY(%s) GROUP BY t.teknisi_id", (ids,))
+            rows = cur.fetchall()
+            ada = {r[0] for r in rows}
+            for tid in ids:
+                if tid not in ada:
+                    ANTRIAN_TEKNISI.pop(tid, None)
+            for r in rows:
+                _pasang_teknisi(r)
+            _rapikan_heap()
+
+def _puncak_heap(kunci):
+    heap = _heap_teknisi.get(kunci)
+    while heap and _entri_basi(heap[0]):
+        heapq.heappop(heap)
+    return heap[0] if heap else None
+
+def saran_teknisi(cur, keahlian=None):
+    """
+    Teknisi dengan beban (estimasi jam Proses) paling ringan yang bisa
+    menangani `keahlian`: spesialisnya atau teknisi umum. None jika tidak ada.
+    """
+    antrian_segarkan(cur)
+    kunci = _kunci_keahlian(keahlian)
+    with _antrian_lock:
+        if kunci is None:
+            calon = [_puncak_heap("*")]
+        else:
+            calon = [_puncak_heap(kunci), _puncak_heap(None)]
+        calon = [c for c in calon if c]
+        if not calon:
+            return None
+        return ANTRIAN_TEKNISI[min(calon)[2]]
+
+def daftar_antrian_teknisi(cur, keahlian=None):
+    """Teknisi yang memenuhi syarat, urut beban teringan."""
+    antrian_segarkan(cur)
+    kunci = _kunci_keahlian(keahlian)
+    return sorted(
+        (t for t in ANTRIAN_TEKNISI.values()
+         if kunci is None or _kunci_keahlian(t["keahlian"]) in (kunci, None)),
+        key=lambda t: (t["jam"], t["jumlah"], t["id"])
+    )
+
+def benchmark_antrian_teknisi(jumlah_saran=10_000):
+    """Bandingkan saran teknisi dari heap dengan query ORDER BY beban ke database."""
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    antrian_segarkan(cur)
+    keahlian = [None] + sorted({t["keahlian"] for t in ANTRIAN_TEKNISI.values() if t["keahlian"]})
+
+    t0 = time.perf_counter()
+    for i in range(jumlah_saran):
+        saran_teknisi(cur, keahlian[i % len(keahlian)])
+    heap_ms = (time.perf_counter() - t0) * 1000
+
+    n_sql = max(1, jumlah_saran // 10)
+    t0 = time.perf_counter()
+    for i in range(n_sql):
+        k = keahlian[i % len(keahlian)]
+        cur.execute(SQL_BEBAN_TEKNISI + """
+            WHERE %s IS NULL OR lower(t.keahlian) = lower(%s) OR t.keahlian IS NULL
+            GROUP BY t.teknisi_id
+            ORDER BY 5, 4, 1 LIMIT 1
+        """, (k, k))
+        cur.fetchone()
+    sql_ms = (time.perf_counter() - t0) * 1000 * jumlah_saran / n_sql
+    conn.close()
+    print(f"{len(ANTRIAN_TEKNISI)} teknisi, {jumlah_saran:,} saran")
+    print(f"Heap  : {heap_ms:8.1f} ms ({heap_ms * 1000 / jumlah_saran:.1f} us/saran)")
+    print(f"Query : {sql_ms:8.1f} ms (perkiraan dari {n_sql:,} query)")
 
 # -------------------------
 # Servis
 # -------------------------
-def list_servis_belum_selesai(cur):
+# Papan servis terbuka: hanya status Proses/Selesai (indeks parsial idx_servis_terbuka*),
+# per halaman dengan keyset pada servis_id. Riwayat 'Diambil' tidak pernah disentuh.
+SQL_PAPAN_SERVIS = """
+    SELECT
+        s.servis_id,
+        COALESCE(m.nama, '-'),
+        s.nama_alat,
+        t.nama AS teknisi,
+        s.status_servis,
+        s.tanggal_masuk,
+        s.estimasi_jam
+    FROM servis s
+    LEFT JOIN member m ON m.member_id = s.member_id
+    LEFT JOIN teknisi t ON t.teknisi_id = s.teknisi_id
+    WHERE s.status_servis IN ('Proses', 'Selesai')
+"""
+
+def papan_servis_baru():
+    """State papan: filter aktif, awal tiap halaman yang sudah dilihat, baris halaman ini."""
+    return {"teknisi_id": None, "member_id": None, "min_umur": None,
+            "label": "semua", "awal": [0], "baris": None, "ada_lagi": False}
+
+def _sql_papan(papan):
+    sql, params = SQL_PAPAN_SERVIS, []
+    if papan["teknisi_id"]:
+        sql += " AND s.teknisi_id = %s"
+        params.append(papan["teknisi_id"])
+    if papan["member_id"]:
+        sql += " AND s.member_id = %s"
+        params.append(papan["member_id"])
+    if papan["min_umur"]:
+        sql += " AND s.tanggal_masuk <= CURRENT_DATE - %s"
+        params.append(papan["min_umur"])
+    return sql, params
+
+def muat_halaman_papan(cur, papan):
+    sql, params = _sql_papan(papan)
+    rows, papan["ada_lagi"] = ambil_halaman(cur, sql, params, "s.servis_id", papan["awal"][-1])
+    papan["baris"] = {r[0]: r for r in rows}
+
+def segarkan_baris_papan(cur, papan, servis_ids):
     """
-    Menampilkan daftar servis yang masih PROSES atau SELESAI (belum diambil).
+    Setelah status berubah, ambil ulang hanya baris yang diubah (via primary key):
+    diganti jika masih terbuka & lolos filter, dibuang dari halaman jika tidak.
     """
-    cur.execute("""
-        SELECT 
-            s.servis_id,
-            COALESCE(m.nama, '-'),
-            s.nama_alat,
-            t.nama AS teknisi,
-            s.status_servis,
-            s.tanggal_masuk
-        FROM servis s
-        LEFT JOIN member m ON m.member_id = s.member_id
-        LEFT JOIN teknisi t ON t.teknisi_id = s.teknisi_id
-        WHERE s.status_servis IN ('Proses', 'Selesai')
-        ORDER BY s.servis_id;
-    """)
+    sql, params = _sql_papan(papan)
+    cur.execute(sql + " AND s.servis_id = ANY(%s)", tuple(params) + (list(servis_ids),))
+    baru = {r[0]: r for r in cur.fetchall()}
+    for sid in servis_ids:
+        if sid in baru:
+            papan["baris"][sid] = baru[sid]
+        else:
+            papan["baris"].pop(sid, None)
 
-    rows = cur.fetchall()
+def tampilkan_papan_servis(cur, papan):
+    if papan["baris"] is None:
+        muat_halaman_papan(cur, papan)
 
-    if not rows:
+    print(f"\n=== PAPAN SERVIS TERBUKA ({papan['label']}) ===")
+    if not papan["baris"]:
         print("Tidak ada servis yang masih PROSES atau SELESAI.")
-        return []
-
-    tabel = []
-    for r in rows:
-        tabel.append([
-            r[0],                      # ID servis
-            r[1],                      # Nama member
-            r[2],                      # Nama alat
-            r[3],                      # Teknisi
-            r[4],                      # Status
-            r[5].strftime("%d-%m-%Y")  # Tanggal masuk
-        ])
-
-    print("\n=== DAFTAR SERVIS BELUM SELESAI ===")
-    print(tabulate(
-        tabel,
-        headers=["ID", "Member", "Alat", "Teknisi", "Status", "Tgl Masuk"],
-        tablefmt="grid"
-    ))
-
-    return rows
+    else:
+        hari_ini = date.today()
+        tabel = []
+        for sid in sorted(papan["baris"]):
+            r = papan["baris"][sid]
+            tabel.append([
+                r[0],                           # ID servis
+                r[1],                           # Nama member
+                r[2],                           # Nama alat
+                r[3],                           # Teknisi
+                r[4],                           # Status
+                r[5].strftime("%d-%m-%Y"),      # Tanggal masuk
+                (hari_ini - r[5]).days,         # Umur (hari)
+                f"{r[6]:g}"                     # Estimasi jam
+            ])
+        print(tabulate(
+            tabel,
+            headers=["ID", "Member", "Alat", "Teknisi", "Status", "Tgl Masuk", "Umur", "Est. Jam"],
+            tablefmt="grid"
+        ))
+    nav = []
+    if len(papan["awal"]) > 1:
+        nav.append("p = sebelumnya")
+    if papan["ada_lagi"]:
+        nav.append("n = berikutnya")
+    print(f"Halaman {len(papan['awal'])}" + (f" ({', '.join(nav)})" if nav else ""))
+
+def navigasi_papan(cur, papan, jawaban):
+    """Proses n/p/f. Return True jika jawaban sudah ditangani."""
+    jawaban = jawaban.lower()
+    if jawaban == "n" and papan["ada_lagi"] and papan["baris"]:
+        papan["awal"].append(max(papan["baris"]))
+    elif jawaban == "p" and len(papan["awal"]) > 1:
+        papan["awal"].pop()
+    elif jawaban == "f":
+        filter_papan(cur, papan)
+    else:
+        return False
+    papan["baris"] = None
+    return True
+
+def filter_papan(cur, papan):
+    print("Filter (kosongkan untuk tanpa filter)")
+    teknisi_id = input_int("ID teknisi: ")
+    phone = input("No HP member: ").strip()
+    min_umur = input_int("Minimal umur servis (hari): ")
+
+    member = find_member_by_phone(cur, phone) if phone else None
+    if phone and not member:
+        print("Member tidak ditemukan, filter member diabaikan.")
+
+    papan.update(papan_servis_baru())
+    papan["teknisi_id"] = teknisi_id
+    papan["member_id"] = member[0] if member else None
+    papan["min_umur"] = min_umur if min_umur and min_umur > 0 else None
+    label = []
+    if teknisi_id:
+        label.append(f"teknisi {teknisi_id}")
+    if member:
+        label.append(f"member {member[1]}")
+    if papan["min_umur"]:
+        label.append(f">= {papan['min_umur']} hari")
+    papan["label"] = ", ".join(label) or "semua"
 
 def input_servis(conn, cur, pegawai):
     print("\n=== INPUT SERVIS BARU ===")
@@ -1849,59 +3771,76 @@ def input_servis(conn, cur, pegawai):
             if input("Member tidak ditemukan. Daftar baru? (y/n): ").lower() == "y":
                 member_id = add_member(conn, cur)
 
-    # --- Pilih Teknisi ---
-    cur.execute("SELECT teknisi_id, nama, no_hp FROM teknisi ORDER BY teknisi_id")
-    techs = cur.fetchall()
-    if not techs:
+    # --- Detail Servis ---
+    nama_alat = input("Nama alat/mesin: ").strip()
+    keluhan = input("Keluhan kerusakan: ").strip()
+
+    if nama_alat and keluhan:
+        serupa = servis_serupa(cur, nama_alat, keluhan)
+        if serupa:
+            print("\nRiwayat servis serupa:")
+            tampilkan_hasil_cari(serupa)
+
+    antrian_segarkan(cur)
+    if not ANTRIAN_TEKNISI:
         print("Belum ada teknisi terdaftar. Hubungi admin.")
         return
+    ada_keahlian = sorted({t["keahlian"] for t in ANTRIAN_TEKNISI.values() if t["keahlian"]})
+    if ada_keahlian:
+        print("Keahlian teknisi:", ", ".join(ada_keahlian))
+    keahlian = input("Keahlian yang dibutuhkan (Enter = bebas): ").strip() or None
+    # estimasi_jam NUMERIC(5,1): boleh pecahan, mis. 1.5 atau 1,5
+    teks = input(f"Estimasi jam pengerjaan (Enter = {ESTIMASI_JAM_DEFAULT}): ").strip()
+    try:
+        estimasi = Decimal(teks.replace(",", ".")) if teks else Decimal(ESTIMASI_JAM_DEFAULT)
+        estimasi = estimasi.quantize(Decimal("0.1"))
+    except InvalidOperation:
+        estimasi = None
+    if estimasi is None or estimasi.is_nan() or not 0 < estimasi < 10000:
+        print("Estimasi tidak valid.")
+        return
 
-    print(tabulate(techs, headers=["ID", "Nama", "No HP"], tablefmt="grid"))
-    teknisi_id = input_int("Pilih ID teknisi: ")
-    if not teknisi_id:
-        print("Teknisi tidak valid.")
+    # --- Pilih Teknisi: beban teringan yang memenuhi syarat ---
+    calon = daftar_antrian_teknisi(cur, keahlian)
+    saran = saran_teknisi(cur, keahlian)
+    if not saran:
+        print(f"Tidak ada teknisi dengan keahlian '{keahlian}' maupun teknisi umum.")
         return
 
-    # --- Detail Servis ---
-    nama_alat = input("Nama alat/mesin: ").strip()
-    keluhan = input("Keluhan kerusakan: ").strip()
+    print(tabulate(
+        [[t["id"], t["nama"], t["keahlian"] or "(umum)", t["jumlah"], f"{t['jam']:g}"] for t in calon],
+        headers=["ID", "Nama", "Keahlian", "Servis Proses", "Estimasi Jam"], tablefmt="grid"
+    ))
+    print(f"Saran: {saran['nama']} (ID {saran['id']}), beban {saran['jam']:g} jam")
+    teknisi_id = input_int("Pilih ID teknisi (Enter = saran): ", saran["id"])
+    if teknisi_id not in {t["id"] for t in calon}:
+        print("Teknisi tidak valid.")
+        return
 
     # biaya_servis = NULL dulu, status = PROSES
     cur.execute("""
         INSERT INTO servis (
             member_id, kasir_id, teknisi_id, nama_alat, keluhan,
-            biaya_servis, status_servis, tanggal_masuk
+            biaya_servis, status_servis, tanggal_masuk, keahlian, estimasi_jam
         )
-        VALUES (%s, %s, %s, %s, %s, NULL, 'Proses', NOW())
+        VALUES (%s, %s, %s, %s, %s, NULL, 'Proses', NOW(), %s, %s)
         RETURNING servis_id
-    """, (member_id, pegawai["pegawai_id"], teknisi_id, nama_alat, keluhan))
+    """, (member_id, pegawai["pegawai_id"], teknisi_id, nama_alat, keluhan, keahlian, estimasi))
 
     servis_id = cur.fetchone()[0]
     conn.commit()
 
     print(f"Servis berhasil didaftarkan. ID = {servis_id}. Status = PROSES")
 
-def update_status_servis(conn, cur):
-    print("\n=== UPDATE STATUS SERVIS ===")
-
-    # Tampilkan dahulu daftar servis yang bisa diupdate
-    rows = list_servis_belum_selesai(cur)
-    if not rows:
-        return
-
-    # Input ID servis
-    servis_id = input_int("\nMasukkan ID Servis yang akan diupdate: ")
-    if not servis_id:
-        print("ID tidak valid.")
-        return
-
+def ubah_status_servis(conn, cur, servis_id):
+    """Maju satu status (Proses -> Selesai -> Diambil). Return True jika berubah."""
     # Ambil status servis
     cur.execute("SELECT status_servis FROM servis WHERE servis_id = %s", (servis_id,))
     row = cur.fetchone()
 
     if not row:
         print("Servis tidak ditemukan!")
-        return
+        return False
 
     status = row[0]
 
@@ -1913,7 +3852,7 @@ def update_status_servis(conn, cur):
         biaya = input_int("Masukkan biaya servis: ")
         if biaya is None:
             print("Biaya tidak valid.")
-            return
+            return False
 
         cur.execute("""
             UPDATE servis
@@ -1933,7 +3872,8 @@ def update_status_servis(conn, cur):
 
         cur.execute("""
             UPDATE servis
-            SET status_servis = 'Diambil'
+            SET status_servis = 'Diambil',
+                tanggal_diambil = CURRENT_DATE
             WHERE servis_id = %s
         """, (servis_id,))
 
@@ -1942,6 +3882,206 @@ def update_status_servis(conn, cur):
 
     else:
         print("Servis sudah DIAMBIL dan tidak dapat diubah lagi.")
+        return False
+    return True
+
+# status tujuan -> (status asal, kolom yang di-set); m.biaya = biaya per ID (boleh NULL).
+# Biaya hanya ditetapkan saat masuk Selesai; biaya yang sudah disepakati tidak diubah saat diambil.
+TRANSISI_SERVIS = {
+    "Selesai": ("Proses", """
+        biaya_servis = COALESCE(m.biaya, s.biaya_servis),
+        tanggal_selesai = CURRENT_DATE
+    """),
+    "Diambil": ("Selesai", "tanggal_diambil = CURRENT_DATE"),
+}
+
+def transisi_servis(cur, tujuan, servis_ids, biaya=None):
+    """
+    Satu UPDATE untuk semua servis_ids yang statusnya sesuai status asal `tujuan`.
+    Return {servis_id: status sebelum} untuk setiap ID yang diminta
+    (None = tidak ditemukan) dan set ID yang berubah. Tidak commit.
+    """
+    asal, set_kolom = TRANSISI_SERVIS[tujuan]
+    biaya = biaya or {}
+    ids = list(servis_ids)
+    cur.execute(f"""
+        WITH masuk AS (
+            SELECT * FROM unnest(%s::int[], %s::int[]) AS m(servis_id, biaya)
+        ),
+        ubah AS (
+            UPDATE servis s
+            SET status_servis = %s, {set_kolom}
+            FROM masuk m
+            WHERE s.servis_id = m.servis_id AND s.status_servis = %s
+            RETURNING s.servis_id
+        )
+        -- snapshot sebelum UPDATE: status lama tiap ID
+        SELECT m.servis_id, s.status_servis, u.servis_id IS NOT NULL
+        FROM masuk m
+        LEFT JOIN servis s ON s.servis_id = m.servis_id
+        LEFT JOIN ubah u ON u.servis_id = m.servis_id
+    """, (ids, [biaya.get(i) for i in ids], tujuan, asal))
+    status, berubah = {}, set()
+    for sid, lama, ok in cur.fetchall():
+        status[sid] = lama
+        if ok:
+            berubah.add(sid)
+    return status, berubah
+
+def majukan_servis_massal(cur, servis_ids, biaya=None, tujuan=None):
+    """
+    Majukan banyak servis sekaligus. tujuan None = tiap ID maju satu langkah
+    (Selesai -> Diambil dulu, lalu Proses -> Selesai, jadi tidak ada yang lompat dua).
+    Return list [servis_id, status lama, status baru/None, keterangan]. Tidak commit.
+    """
+    ids = list(dict.fromkeys(servis_ids))
+    hasil = {}
+    sisa = ids
+    for t in (["Diambil", "Selesai"] if tujuan is None else [tujuan]):
+        status, berubah = transisi_servis(cur, t, sisa, biaya if t == "Selesai" else None)
+        for sid in sisa:
+            if sid in berubah:
+                hasil[sid] = [sid, status[sid], t, "OK"]
+            elif sid not in hasil:
+                lama = status[sid]
+                ket = ("tidak ditemukan" if lama is None
+                       else "sudah diambil" if lama == "Diambil"
+                       else f"status {lama}, bukan {TRANSISI_SERVIS[t][0]}")
+                hasil[sid] = [sid, lama or "-", None, ket]
+        sisa = [sid for sid in sisa if sid not in berubah]
+    return [hasil[sid] for sid in ids]
+
+RENTANG_ID_MAKS = 1000  # ID per rentang 'a-b', mencegah salah ketik jadi jutaan ID
+
+def parse_daftar_id(teks):
+    """
+    '1, 4, 10-15' -> [1, 4, 10, 11, ..., 15].
+    ValueError (menyebut bagian yang salah) jika format atau rentang tidak valid.
+    """
+    ids = []
+    for bagian in re.split(r"[\s,;]+", teks.strip()):
+        if not bagian:
+            continue
+        try:
+            if "-" in bagian:
+                a, b = (int(x) for x in bagian.split("-", 1))
+            else:
+                a = b = int(bagian)
+        except ValueError:
+            raise ValueError(f"'{bagian}' bukan ID atau rentang ID")
+        if b < a or b - a >= RENTANG_ID_MAKS:
+            raise ValueError(f"rentang '{bagian}' tidak valid (maks. {RENTANG_ID_MAKS} ID)")
+        ids.extend(range(a, b + 1))
+    return ids
+
+def baca_biaya_servis(cur, berkas):
+    """Biaya per servis dari CSV/XLSX (servis_id, biaya_servis) lewat staging impor."""
+    total, ditolak = muat_impor(cur, "biaya_servis", berkas)
+    print(f"{total} baris biaya dibaca, {ditolak} ditolak.")
+    if ditolak:
+        tampilkan_tolak(cur)
+    cur.execute("""
+        SELECT servis_id::int, biaya_servis::int FROM impor_stg s
+        WHERE NOT EXISTS (SELECT 1 FROM impor_tolak t WHERE t.baris = s.baris)
+    """)
+    return dict(cur.fetchall())
+
+def isi_biaya_grid(cur, servis_ids):
+    """Isi cepat biaya untuk servis yang masih Proses; Enter = kosong, '.' = berhenti."""
+    cur.execute("""
+        SELECT servis_id, nama_alat, biaya_servis FROM servis
+        WHERE servis_id = ANY(%s) AND status_servis = 'Proses'
+        ORDER BY servis_id
+    """, (list(servis_ids),))
+    biaya = {}
+    for sid, alat, lama in cur.fetchall():
+        teks = input(f"  #{sid} {alat[:30]:<30} biaya"
+                     + (f" ({format_rp(lama)})" if lama else "") + ": ").strip()
+        if teks == ".":
+            break
+        if teks.isdigit():
+            biaya[sid] = int(teks)
+        elif teks:
+            print("  Diabaikan (bukan angka).")
+    return biaya
+
+def update_status_massal(conn, cur, servis_ids=None):
+    print("\n=== UPDATE STATUS SERVIS MASSAL ===")
+    if servis_ids is None:
+        try:
+            servis_ids = parse_daftar_id(input("ID servis (mis. 3, 7, 10-15): "))
+        except ValueError as e:
+            print("Format ID tidak valid:", e)
+            return set()
+    if not servis_ids:
+        print("Tidak ada ID servis.")
+        return set()
+
+    print("1. Maju satu langkah (Proses -> Selesai, Selesai -> Diambil)")
+    print("2. Hanya tandai SELESAI")
+    print("3. Hanya tandai DIAMBIL")
+    tujuan = {"1": None, "2": "Selesai", "3": "Diambil"}.get(input("Pilih: ").strip(), "x")
+    if tujuan == "x":
+        print("Pilihan tidak valid.")
+        return set()
+
+    biaya = {}
+    if tujuan != "Diambil":
+        print("Biaya servis: 1. Isi cepat per servis  2. Dari berkas CSV/XLSX  3. Tanpa biaya")
+        sumber = input("Pilih: ").strip()
+        try:
+            if sumber == "1":
+                biaya = isi_biaya_grid(cur, servis_ids)
+            elif sumber == "2":
+                biaya = baca_biaya_servis(cur, input("Path berkas: ").strip())
+        except (OSError, ValueError, RuntimeError, psycopg2.Error) as e:
+            conn.rollback()
+            print("Gagal membaca biaya:", e)
+            return set()
+
+    try:
+        hasil = majukan_servis_massal(cur, servis_ids, biaya, tujuan)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("Gagal update status:", e)
+        return set()
+
+    print(tabulate([[r[0], r[1], r[2] or "-", r[3]] for r in hasil],
+                   headers=["ID", "Status Lama", "Status Baru", "Keterangan"], tablefmt="grid"))
+    berubah = {r[0] for r in hasil if r[2]}
+    print(f"{len(berubah)} dari {len(hasil)} servis diperbarui.")
+    return berubah
+
+def update_status_servis(conn, cur):
+    print("\n=== UPDATE STATUS SERVIS ===")
+    papan = papan_servis_baru()
+
+    while True:
+        tampilkan_papan_servis(cur, papan)
+        jawaban = input("\nID Servis yang akan diupdate (n/p = halaman, f = filter, "
+                        "m = massal sesuai filter, Enter = selesai): ").strip()
+        if not jawaban:
+            return
+        if navigasi_papan(cur, papan, jawaban):
+            continue
+        if jawaban.lower() == "m":
+            sql, params = _sql_papan(papan)
+            cur.execute(f"SELECT servis_id FROM ({sql}) x ORDER BY servis_id", params)
+            ids = [r[0] for r in cur.fetchall()]
+            print(f"{len(ids)} servis terbuka sesuai filter ({papan['label']}).")
+            berubah = update_status_massal(conn, cur, ids) if ids else set()
+            segarkan_baris_papan(cur, papan, berubah & set(papan["baris"]))
+            continue
+
+        try:
+            servis_id = int(jawaban)
+        except ValueError:
+            print("ID tidak valid.")
+            continue
+
+        if ubah_status_servis(conn, cur, servis_id) and servis_id in papan["baris"]:
+            segarkan_baris_papan(cur, papan, [servis_id])
 
 # menu transaksi servis
 def transaksi_servis(conn, cur, pegawai):
@@ -1949,7 +4089,9 @@ def transaksi_servis(conn, cur, pegawai):
         print("\n=== MENU SERVIS ===")
         print("1. Input Servis Baru")
         print("2. Update Status Servis")
-        print("3. Kembali")
+        print("3. Update Status Massal")
+        print("4. Cari Riwayat Keluhan")
+        print("5. Kembali")
         pilihan = input("Pilih menu: ")
         clear_screen()
         if pilihan == "1":
@@ -1957,287 +4099,2129 @@ def transaksi_servis(conn, cur, pegawai):
         elif pilihan == "2":
             update_status_servis(conn, cur)
         elif pilihan == "3":
+            update_status_massal(conn, cur)
+        elif pilihan == "4":
+            cari_riwayat_keluhan(cur)
+        elif pilihan == "5":
             clear_screen()
             break
         else:
             print("Pilihan tidak valid!")
 
+# -------------------------
+# Periode laporan
+# -------------------------
+# Semua laporan memakai rentang setengah terbuka [mulai, akhir) pada kolom apa adanya
+# (tanpa DATE()/date_trunc di kolom) supaya indeks tanggal bisa dipakai.
+JENIS_PERIODE = ["hari", "minggu", "bulan", "kuartal", "tahun"]
+
+def rentang_periode(jenis, acuan):
+    """
+    Rentang [mulai, akhir) untuk periode `jenis` yang memuat tanggal `acuan`.
+    """
+    if jenis == "hari":
+        mulai = acuan
+        akhir = acuan + timedelta(days=1)
+        label = acuan.strftime("%d-%m-%Y")
+    elif jenis == "minggu":
+        mulai = acuan - timedelta(days=acuan.weekday())
+        akhir = mulai + timedelta(days=7)
+        label = f"{mulai.strftime('%d-%m-%Y')} s/d {(akhir - timedelta(days=1)).strftime('%d-%m-%Y')}"
+    elif jenis == "bulan":
+        mulai = date(acuan.year, acuan.month, 1)
+        akhir = date(acuan.year + 1, 1, 1) if acuan.month == 12 else date(acuan.year, acuan.month + 1, 1)
+        label = f"{acuan.month}-{acuan.year}"
+    elif jenis == "kuartal":
+        q = (acuan.month - 1) // 3
+        mulai = date(acuan.year, q * 3 + 1, 1)
+        akhir = date(acuan.year + 1, 1, 1) if q == 3 else date(acuan.year, q * 3 + 4, 1)
+        label = f"Q{q + 1}-{acuan.year}"
+    elif jenis == "tahun":
+        mulai = date(acuan.year, 1, 1)
+        akhir = date(acuan.year + 1, 1, 1)
+        label = str(acuan.year)
+    else:
+        raise ValueError(f"Jenis periode tidak dikenal: {jenis}")
+    return datetime.combine(mulai, datetime.min.time()), datetime.combine(akhir, datetime.min.time()), label
+
+def input_tanggal(prompt, default=None):
+    s = input(prompt).strip()
+    if s == "" and default is not None:
+        return default
+    try:
+        return datetime.strptime(s, "%d-%m-%Y").date()
+    except ValueError:
+        return None
+
+def input_periode():
+    """
+    Tanya periode laporan. Return (mulai, akhir, label) atau None jika input salah.
+    """
+    print("Periode: 1. Hari  2. Minggu  3. Bulan  4. Kuartal  5. Tahun  6. Rentang tanggal")
+    pilih = input("Pilih periode (default 3): ").strip() or "3"
+    hari_ini = date.today()
+    try:
+        if pilih == "1":
+            tgl = input_tanggal("Tanggal (dd-mm-yyyy, default hari ini): ", hari_ini)
+            return rentang_periode("hari", tgl) if tgl else None
+        if pilih == "2":
+            tgl = input_tanggal("Tanggal dalam minggu (dd-mm-yyyy, default hari ini): ", hari_ini)
+            return rentang_periode("minggu", tgl) if tgl else None
+        if pilih == "3":
+            tahun = input("Masukkan tahun (default tahun ini): ").strip()
+            bulan = input("Masukkan bulan (1-12, default bulan ini): ").strip()
+            tahun = int(tahun) if tahun else hari_ini.year
+            bulan = int(bulan) if bulan else hari_ini.month
+            return rentang_periode("bulan", date(tahun, bulan, 1))
+        if pilih == "4":
+            tahun = input("Masukkan tahun (default tahun ini): ").strip()
+            kuartal = input("Masukkan kuartal (1-4, default kuartal ini): ").strip()
+            tahun = int(tahun) if tahun else hari_ini.year
+            kuartal = int(kuartal) if kuartal else (hari_ini.month - 1) // 3 + 1
+            return rentang_periode("kuartal", date(tahun, kuartal * 3 - 2, 1))
+        if pilih == "5":
+            tahun = input("Masukkan tahun (default tahun ini): ").strip()
+            return rentang_periode("tahun", date(int(tahun) if tahun else hari_ini.year, 1, 1))
+        if pilih == "6":
+            awal = input_tanggal("Dari tanggal (dd-mm-yyyy): ")
+            sampai = input_tanggal("Sampai tanggal (dd-mm-yyyy): ")
+            if not awal or not sampai or sampai < awal:
+                return None
+            return (datetime.combine(awal, datetime.min.time()),
+                    datetime.combine(sampai + timedelta(days=1), datetime.min.time()),
+                    f"{awal.strftime('%d-%m-%Y')} s/d {sampai.strftime('%d-%m-%Y')}")
+    except ValueError:
+        return None
+    return None
+
+def _waktu_terbaik(fungsi, n=3):
+    """Jalankan fungsi() n kali. Return (waktu tercepat dalam ms, hasil terakhir)."""
+    terbaik, hasil = None, None
+    for _ in range(n):
+        t0 = time.perf_counter()
+        hasil = fungsi()
+        ms = (time.perf_counter() - t0) * 1000
+        terbaik = ms if terbaik is None else min(terbaik, ms)
+    return terbaik, hasil
+
+def _rollback_dan_analyze(conn, *tabel):
+    """
+    Batalkan data sintetis benchmark. reltuples/relpages dari ANALYZE di dalam
+    transaksi tidak ikut di-rollback, jadi statistik dihitung ulang dari data asli.
+    """
+    conn.rollback()
+    cur = conn.cursor()
+    for nama in tabel:
+        cur.execute(f"ANALYZE {nama}")
+    conn.commit()
+    cur.close()
+
+def benchmark_periode(jumlah_baris=2_000_000):
+    """
+    Bandingkan filter DATE(kolom) vs rentang pada kolom apa adanya
+    di tabel sementara berisi jutaan transaksi (tabel asli tidak disentuh).
+    """
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    print(f"Menyiapkan {jumlah_baris:,} baris penjualan sintetis...")
+    cur.execute("""
+        CREATE TEMP TABLE bench_penjualan AS
+        SELECT g AS penjualan_id,
+               TIMESTAMP '2023-01-01' + (g * INTERVAL '1 second' * (94608000.0 / %s)) AS tanggal_transaksi,
+               (random() * 1000000)::int AS total_harga
+        FROM generate_series(1, %s) g
+    """, (jumlah_baris, jumlah_baris))
+    cur.execute("CREATE INDEX ON bench_penjualan (tanggal_transaksi)")
+    cur.execute("ANALYZE bench_penjualan")
+
+    hasil = []
+    acuan = date(2024, 5, 15)
+    for jenis in ["hari", "minggu", "bulan", "kuartal"]:
+        mulai, akhir, label = rentang_periode(jenis, acuan)
+        waktu = {}
+        for nama, sql in (
+            ("DATE()", """SELECT COUNT(*), SUM(total_harga) FROM bench_penjualan
+                          WHERE DATE(tanggal_transaksi) >= %s AND DATE(tanggal_transaksi) < %s"""),
+            ("rentang", """SELECT COUNT(*), SUM(total_harga) FROM bench_penjualan
+                           WHERE tanggal_transaksi >= %s AND tanggal_transaksi < %s"""),
+        ):
+            waktu[nama], _ = _waktu_terbaik(
+                lambda: (cur.execute(sql, (mulai, akhir)), cur.fetchone()))
+        hasil.append([jenis, label, f"{waktu['DATE()']:.1f}", f"{waktu['rentang']:.1f}",
+                      f"{waktu['DATE()'] / max(waktu['rentang'], 0.001):.0f}x"])
+
+    conn.rollback()
+    conn.close()
+    print(tabulate(hasil, headers=["Periode", "Label", "DATE() (ms)", "Rentang (ms)", "Percepatan"],
+                   tablefmt="grid"))
+
+# -------------------------
+# Laporan streaming (server-side cursor)
+# -------------------------
+ITERSIZE = 2000   # baris per round-trip dari server-side cursor
+
+@contextmanager
+def kursor_aliran(cur, nama, itersize=None):
+    """
+    Named (server-side) cursor pada koneksi yang sama dengan `cur`.
+    Baris diambil per `itersize`, jadi memori klien tetap datar
+    berapa pun banyaknya hasil query.
+    """
+    aliran = cur.connection.cursor(name=nama)
+    aliran.itersize = itersize or ITERSIZE
+    try:
+        yield aliran
+    finally:
+        aliran.close()
+
+def _garis_tabel(lebar):
+    return "+" + "+".join("-" * (w + 2) for w in lebar) + "+"
+
+def _baris_tabel(sel, lebar, kanan):
+    isi = []
+    for teks, w, ka in zip(sel, lebar, kanan):
+        teks = str(teks)
+        if len(teks) > w:
+            teks = teks[:w - 1] + "~"
+        isi.append(" " + (teks.rjust(w) if ka else teks.ljust(w)) + " ")
+    return "|" + "|".join(isi) + "|"
+
+def cetak_aliran(rows, kolom, format_baris):
+    """
+    Cetak tabel baris demi baris tanpa menampung semua baris.
+    kolom: list (judul, lebar, rata_kanan). format_baris(r) -> list sel.
+    Lebar kolom tetap karena tabulate butuh seluruh data untuk menghitungnya.
+    Mengembalikan jumlah baris tercetak; tanpa baris tidak mencetak apa pun.
+    """
+    judul = [k[0] for k in kolom]
+    lebar = [max(k[1], len(k[0])) for k in kolom]
+    kanan = [k[2] for k in kolom]
+    garis = _garis_tabel(lebar)
+    tulis = sys.stdout.write
+
+    n = 0
+    for r in rows:
+        if n == 0:
+            # judul baru dicetak setelah baris pertama datang
+            tulis(garis + "\n" + _baris_tabel(judul, lebar, [False] * len(kolom)) + "\n")
+            tulis(garis.replace("-", "=") + "\n")
+        tulis(_baris_tabel(format_baris(r), lebar, kanan) + "\n")
+        n += 1
+    if n:
+        tulis(garis + "\n")
+    sys.stdout.flush()
+    return n
+
+# -------------------------
+# Ringkasan harian
+# -------------------------
+def rekap_ringkasan_harian(conn, mulai=None, akhir=None):
+    """
+    Job penyusul: hitung ulang ringkasan harian dari data mentah untuk
+    rentang tanggal [mulai, akhir) (default: semua). Dipakai untuk perbaikan
+    jika ringkasan pernah tidak sinkron; transaksi normal sudah dijaga trigger.
+    """
+    cur = conn.cursor()
+    mulai = mulai or date(1900, 1, 1)
+    akhir = akhir or date(9999, 1, 1)
+    try:
+        cur.execute("LOCK TABLE penjualan, pembelian IN SHARE MODE")
+        cur.execute("DELETE FROM ringkasan_penjualan_harian WHERE tanggal >= %s AND tanggal < %s",
+                    (mulai, akhir))
+        cur.execute("""
+            INSERT INTO ringkasan_penjualan_harian
+            SELECT tanggal_transaksi::date, kasir_id, member_id IS NOT NULL, COUNT(*),
+                   SUM(subtotal), SUM(ppn), SUM(COALESCE(diskon, 0)), SUM(total_harga)
+            FROM penjualan
+            WHERE tanggal_transaksi >= %s AND tanggal_transaksi < %s
+            GROUP BY 1, 2, 3
+        """, (mulai, akhir))
+        cur.execute("DELETE FROM ringkasan_pembelian_harian WHERE tanggal >= %s AND tanggal < %s",
+                    (mulai, akhir))
+        cur.execute("""
+            INSERT INTO ringkasan_pembelian_harian
+            SELECT tanggal_pembelian::date, supplier_id, COUNT(*), SUM(total_pembelian)
+            FROM pembelian
+            WHERE tanggal_pembelian >= %s AND tanggal_pembelian < %s
+            GROUP BY 1, 2
+        """, (mulai, akhir))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def rekap_ringkasan_cli():
+    conn = buka_koneksi()
+    mulai = time.perf_counter()
+    rekap_ringkasan_harian(conn)
+    conn.close()
+    print(f"Ringkasan harian disusun ulang dalam {time.perf_counter() - mulai:.2f} detik.")
+
 # -------------------------
 # Laporan penjualan
 # -------------------------
 def laporan_penjualan(cur):
     # Input periode
     print("\n=== LAPORAN PENJUALAN ===")
-    tahun = input("Masukkan tahun (default tahun ini): ").strip()
-    bulan = input("Masukkan bulan (1-12, default bulan ini): ").strip()
-
-    tahun = int(tahun) if tahun else datetime.now().year
-    bulan = int(bulan) if bulan else datetime.now().month
-
-    # Range bulan
-    start = date(tahun, bulan, 1)
-    if bulan == 12:
-        end = date(tahun + 1, 1, 1)
-    else:
-        end = date(tahun, bulan + 1, 1)
+    periode = input_periode()
+    if not periode:
+        print("Periode tidak valid.")
+        return
+    start, end, label = periode
 
-    # Query
+    # Ringkasan per hari: O(jumlah hari), bukan O(jumlah transaksi)
     cur.execute("""
-        SELECT tp.penjualan_id, tp.tanggal_transaksi, tp.total_harga, m.nama
-        FROM penjualan tp
-        LEFT JOIN member m ON tp.member_id = m.member_id
-        WHERE DATE(tp.tanggal_transaksi) >= %s
-        AND DATE(tp.tanggal_transaksi) < %s
-        ORDER BY tp.tanggal_transaksi
+        SELECT tanggal, SUM(jumlah_transaksi), SUM(subtotal), SUM(ppn),
+               SUM(diskon), SUM(pendapatan)
+        FROM ringkasan_penjualan_harian
+        WHERE tanggal >= %s AND tanggal < %s
+        GROUP BY tanggal
+        HAVING SUM(jumlah_transaksi) > 0
+        ORDER BY tanggal
     """, (start, end))
+    harian = cur.fetchall()
 
-    rows = cur.fetchall()
+    print(colored(f"\n=== LAPORAN PENJUALAN PERIODE {label} ===", "cyan"))
 
-    print(colored(f"\n=== LAPORAN PENJUALAN PERIODE {bulan}-{tahun} ===", "cyan"))
-
-    if not rows:
+    if not harian:
         print(colored("Tidak ada transaksi pada periode ini.", "yellow"))
         return
 
-    # Format tampilan
-    tabel = []
-    for r in rows:
-        tanggal = r[1].strftime("%d-%m-%Y %H:%M")
-        tabel.append([
-            r[0],
-            tanggal,
-            format_rp(r[2]),
-            r[3] if r[3] else "-"
-        ])
+    print(tabulate(
+        [[r[0].strftime("%d-%m-%Y"), r[1], format_rp(r[2]), format_rp(r[3]),
+          format_rp(r[4]), format_rp(r[5])] for r in harian],
+        headers=["Tanggal", "Transaksi", "Subtotal", "PPN", "Diskon", "Pendapatan"],
+        tablefmt="grid"
+    ))
+    total = sum(r[5] for r in harian)
+    print(colored("\nTotal pendapatan: " + format_rp(total), "green"))
 
-    print(tabulate(tabel, headers=["ID", "Tanggal", "Total", "Member"], tablefmt="grid"))
+    if input("\nTampilkan rincian per transaksi? (y/n): ").lower() != "y":
+        return
+
+    # Rincian di-stream dari server; total dihitung sambil jalan
+    jumlah = {"total": 0}
+
+    def format_baris(r):
+        jumlah["total"] += r[2] or 0
+        return [r[0], r[1].strftime("%d-%m-%Y %H:%M"), format_rp(r[2]), r[3] or "-"]
+
+    with kursor_aliran(cur, "rincian_penjualan") as aliran:
+        aliran.execute("""
+            SELECT tp.penjualan_id, tp.tanggal_transaksi, tp.total_harga, m.nama
+            FROM penjualan tp
+            LEFT JOIN member m ON tp.member_id = m.member_id
+            WHERE tp.tanggal_transaksi >= %s
+            AND tp.tanggal_transaksi < %s
+            ORDER BY tp.tanggal_transaksi
+        """, (start, end))
+        n = cetak_aliran(
+            aliran,
+            [("ID", 8, True), ("Tanggal", 16, False), ("Total", 16, True), ("Member", 25, False)],
+            format_baris
+        )
+
+    print(f"{n} transaksi, total {format_rp(jumlah['total'])}")
 
-    total = sum((r[2] or 0) for r in rows)
-    print(colored("\nTotal pendapatan: " + format_rp(total), "green"))
 # -------------------------
 # LAPORAN SERVIS (OWNER)
 # -------------------------
+# Kategori alat = kata pertama nama_alat ("Pompa Air 2 Inch" -> "Pompa").
+KATEGORI_ALAT = "initcap(split_part(btrim(nama_alat), ' ', 1))"
+
+# Turnaround = tanggal_selesai - tanggal_masuk, tunggu ambil = tanggal_diambil - tanggal_selesai
+# (hanya servis yang tercatat tanggal diambilnya). Semua dari rentang tanggal_selesai.
+# Berangkat dari teknisi agar teknisi tanpa servis selesai tetap tampil dengan 0.
+SQL_TURNAROUND_SERVIS = f"""
+    SELECT
+        GROUPING(t.teknisi_id) = 0 AS per_teknisi,
+        COALESCE(t.nama, '-'),
+        s.kategori,
+        COUNT(s.tanggal_selesai),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY s.tanggal_selesai - s.tanggal_masuk),
+        percentile_cont(0.9) WITHIN GROUP (ORDER BY s.tanggal_selesai - s.tanggal_masuk),
+        percentile_cont(0.99) WITHIN GROUP (ORDER BY s.tanggal_selesai - s.tanggal_masuk),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY s.tanggal_diambil - s.tanggal_selesai),
+        percentile_cont(0.9) WITHIN GROUP (ORDER BY s.tanggal_diambil - s.tanggal_selesai),
+        COALESCE(SUM(s.biaya_servis), 0)
+    FROM (
+        SELECT teknisi_id, tanggal_masuk, tanggal_selesai, tanggal_diambil, biaya_servis,
+               {KATEGORI_ALAT} AS kategori
+        FROM servis
+        WHERE status_servis IN ('Selesai', 'Diambil')
+        AND tanggal_selesai >= %(mulai)s
+        AND tanggal_selesai < %(akhir)s
+    ) s
+    FULL JOIN teknisi t ON t.teknisi_id = s.teknisi_id
+    GROUP BY GROUPING SETS ((t.teknisi_id, t.nama), (s.kategori), ())
+    -- baris teknisi tanpa servis hanya berarti untuk kelompok per teknisi
+    HAVING GROUPING(t.teknisi_id) = 0 OR COUNT(s.tanggal_selesai) > 0
+    ORDER BY GROUPING(t.teknisi_id), GROUPING(s.kategori), COUNT(s.tanggal_selesai) DESC, t.nama
+"""
+
+# batas kelompok umur backlog (hari): 0-2, 3-7, 8-14, 15-30, > 30
+UMUR_BACKLOG = [3, 8, 15, 31]
+
+# Umur servis terbuka: Proses dihitung dari tanggal masuk, Selesai dari tanggal selesai
+# (lama menunggu diambil). Hanya menyentuh idx_servis_terbuka.
+SQL_UMUR_BACKLOG = """
+    SELECT status_servis, width_bucket(umur, %(batas)s::int[]) AS kelompok, COUNT(*), MAX(umur)
+    FROM (
+        SELECT status_servis,
+               CURRENT_DATE - CASE WHEN status_servis = 'Selesai'
+                                   THEN COALESCE(tanggal_selesai, tanggal_masuk)
+                                   ELSE tanggal_masuk END AS umur
+        FROM servis
+        WHERE status_servis IN ('Proses', 'Selesai')
+    ) s
+    GROUP BY status_servis, kelompok
+"""
+
+SQL_TREN_SERVIS = """
+    WITH masuk AS (
+        SELECT date_trunc(%(unit)s, tanggal_masuk)::date AS t, COUNT(*) AS n
+        FROM servis
+        WHERE tanggal_masuk >= %(mulai)s AND tanggal_masuk < %(akhir)s
+        GROUP BY 1
+    ),
+    selesai AS (
+        SELECT date_trunc(%(unit)s, tanggal_selesai)::date AS t, COUNT(*) AS n,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY tanggal_selesai - tanggal_masuk) AS p50
+        FROM servis
+        WHERE status_servis IN ('Selesai', 'Diambil')
+        AND tanggal_selesai >= %(mulai)s AND tanggal_selesai < %(akhir)s
+        GROUP BY 1
+    ),
+    sumbu AS (
+        -- periode berjalan berhenti di hari ini, bukan di akhir periode
+        SELECT generate_series(date_trunc(%(unit)s, %(mulai)s::date),
+                               LEAST(%(akhir)s::date, CURRENT_DATE + 1) - 1,
+                               ('1 ' || %(unit)s)::interval)::date AS t
+    )
+    SELECT x.t, COALESCE(m.n, 0), COALESCE(s.n, 0), s.p50,
+           AVG(COALESCE(s.n, 0)) OVER (ORDER BY x.t ROWS BETWEEN 3 PRECEDING AND CURRENT ROW),
+           SUM(COALESCE(m.n, 0) - COALESCE(s.n, 0)) OVER (ORDER BY x.t)
+    FROM sumbu x
+    LEFT JOIN masuk m ON m.t = x.t
+    LEFT JOIN selesai s ON s.t = x.t
+    ORDER BY x.t
+"""
+
+def unit_tren(mulai, akhir):
+    """Satuan tren: harian s/d sebulan, mingguan s/d setengah tahun, selebihnya bulanan."""
+    hari = (akhir - mulai).days
+    return "day" if hari <= 31 else "week" if hari <= 186 else "month"
+
+def _hari(x):
+    return "-" if x is None else f"{x:.1f}"
+
 def laporan_servis(cur):
     print("\n=== LAPORAN SERVIS PER PERIODE ===")
 
-    tahun = input("Masukkan tahun (default tahun ini): ").strip()
-    bulan = input("Masukkan bulan (1-12, default bulan ini): ").strip()
+    periode = input_periode()
+    if not periode:
+        print("Periode tidak valid.")
+        return
+    start, end, label = periode
+    params = {"mulai": start, "akhir": end}
 
-    tahun = int(tahun) if tahun else datetime.now().year
-    bulan = int(bulan) if bulan else datetime.now().month
+    cur.execute(SQL_TURNAROUND_SERVIS, params)
+    rows_raw = cur.fetchall()
 
-    start = date(tahun, bulan, 1)
-    end = date(tahun + 1, 1, 1) if bulan == 12 else date(tahun, bulan + 1, 1)
+    print(colored(f"\n=== LAPORAN SERVIS PERIODE {label} ===", "cyan"))
 
-    # Ambil data asli untuk hitungan
+    total = [r for r in rows_raw if not r[0] and r[2] is None]
+    if not total or total[0][3] == 0:
+        print("Tidak ada servis yang selesai pada periode ini.")
+    else:
+        headers = ["Jumlah", "p50", "p90", "p99", "Tunggu Ambil p50", "Tunggu Ambil p90", "Pendapatan"]
+
+        def baris(r):
+            return [r[3], _hari(r[4]), _hari(r[5]), _hari(r[6]), _hari(r[7]), _hari(r[8]), format_rp(r[9])]
+
+        print("\nTurnaround (hari) per teknisi:")
+        print(tabulate([[r[1]] + baris(r) for r in rows_raw if r[0]],
+                       headers=["Teknisi"] + headers, tablefmt="grid"))
+        print("\nTurnaround (hari) per kategori alat:")
+        print(tabulate([[r[2]] + baris(r) for r in rows_raw if not r[0] and r[2] is not None],
+                       headers=["Kategori"] + headers, tablefmt="grid"))
+        t = total[0]
+        print(f"Semua servis: {t[3]} selesai, turnaround p50 {_hari(t[4])} / p90 {_hari(t[5])} / "
+              f"p99 {_hari(t[6])} hari")
+        print(colored("\nTotal Pendapatan Servis: " + format_rp(t[9]), "green"))
+
+    # --- Umur backlog (servis terbuka saat ini) ---
+    cur.execute(SQL_UMUR_BACKLOG, {"batas": UMUR_BACKLOG})
+    sebaran = {}
+    for status, kelompok, n, maks in cur.fetchall():
+        sebaran.setdefault(status, [0] * (len(UMUR_BACKLOG) + 1) + [0])
+        sebaran[status][kelompok] = n
+        sebaran[status][-1] = max(sebaran[status][-1], maks)
+    judul = [f"{a}-{b - 1} hr" for a, b in zip([0] + UMUR_BACKLOG, UMUR_BACKLOG)]
+    judul.append(f"> {UMUR_BACKLOG[-1] - 1} hr")
+    print("\nUmur servis terbuka saat ini:")
+    if sebaran:
+        nama = {"Proses": "Proses (sejak masuk)", "Selesai": "Belum diambil (sejak selesai)"}
+        print(tabulate([[nama[st]] + v[:-1] + [v[:-1] and sum(v[:-1]), v[-1]]
+                        for st, v in sorted(sebaran.items())],
+                       headers=["Status"] + judul + ["Total", "Tertua (hr)"], tablefmt="grid"))
+    else:
+        print("Tidak ada servis terbuka.")
+
+    # --- Tren throughput ---
+    unit = unit_tren(start, end)
+    cur.execute(SQL_TREN_SERVIS, dict(params, unit=unit))
+    tren = cur.fetchall()
+    fmt = {"day": "%d-%m-%Y", "week": "%d-%m-%Y", "month": "%m-%Y"}[unit]
+    print(f"\nTren throughput per {({'day': 'hari', 'week': 'minggu', 'month': 'bulan'})[unit]}:")
+    print(tabulate([[r[0].strftime(fmt), r[1], r[2], _hari(r[3]), f"{r[4]:.1f}", r[5]] for r in tren],
+                   headers=["Mulai", "Masuk", "Selesai", "Turnaround p50",
+                            "Rata2 Selesai (4 periode)", "Selisih Kumulatif"],
+                   tablefmt="grid"))
+
+def benchmark_laporan_servis(tahun=5, per_hari=40):
+    """
+    Waktu query laporan servis di atas riwayat sintetis bertahun-tahun
+    (dalam transaksi yang di-rollback).
+    """
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(teknisi_id), MAX(teknisi_id) FROM teknisi")
+    t_min, t_max = cur.fetchone()
+    cur.execute("SELECT MIN(pegawai_id) FROM pegawai")
+    kasir = cur.fetchone()[0]
+    jumlah = tahun * 365 * per_hari
+    print(f"Menyiapkan {jumlah:,} servis sintetis ({tahun} tahun)...")
     cur.execute("""
-        SELECT 
-            t.teknisi_id,
-            t.nama,
-            COUNT(s.servis_id) AS jumlah_servis,
-            COALESCE(SUM(s.biaya_servis), 0) AS total_pendapatan
-        FROM teknisi t
-        LEFT JOIN servis s 
-            ON s.teknisi_id = t.teknisi_id
-            AND s.status_servis IN ('Selesai', 'Diambil')
-            AND DATE(s.tanggal_selesai) >= %s
-            AND DATE(s.tanggal_selesai) < %s
-        GROUP BY t.teknisi_id, t.nama
-        ORDER BY t.teknisi_id
-    """, (start, end))
+        INSERT INTO servis (kasir_id, teknisi_id, nama_alat, keluhan, biaya_servis, status_servis,
+                            tanggal_masuk, tanggal_selesai, tanggal_diambil)
+        SELECT %(kasir)s, %(t_min)s + g %% (%(t_max)s - %(t_min)s + 1),
+               (ARRAY['Pompa Air', 'Sprayer Elektrik', 'Traktor Mini', 'Mesin Giling'])[1 + g %% 4],
+               'bench', 50000, 'Diambil', m, m + d, m + d + (g %% 9)
+        FROM generate_series(1, %(n)s) g,
+             LATERAL (SELECT CURRENT_DATE - 30 - (g / %(per_hari)s) AS m,
+                             (random() * random() * 20)::int AS d) x
+    """, {"kasir": kasir, "t_min": t_min, "t_max": t_max, "n": jumlah, "per_hari": per_hari})
+    cur.execute("ANALYZE servis")
+
+    hasil = []
+    for jenis in ["bulan", "kuartal", "tahun"]:
+        mulai, akhir, label = rentang_periode(jenis, date.today() - timedelta(days=400))
+        params = {"mulai": mulai, "akhir": akhir}
+        waktu = []
+        for nama, sql, p in (("Turnaround", SQL_TURNAROUND_SERVIS, params),
+                             ("Umur backlog", SQL_UMUR_BACKLOG, {"batas": UMUR_BACKLOG}),
+                             ("Tren", SQL_TREN_SERVIS, dict(params, unit=unit_tren(mulai, akhir)))):
+            terbaik, _ = _waktu_terbaik(lambda: (cur.execute(sql, p), cur.fetchall()))
+            waktu.append(f"{terbaik:.1f}")
+        hasil.append([jenis, label] + waktu)
+
+    _rollback_dan_analyze(conn, "servis")
+    conn.close()
+    print(tabulate(hasil, headers=["Periode", "Rentang", "Turnaround (ms)", "Umur backlog (ms)", "Tren (ms)"],
+                   tablefmt="grid"))
 
-    rows_raw = cur.fetchall()
+# -------------------------
+# Pencarian keluhan servis
+# -------------------------
+# servis.cari_tsv (kolom generated, indeks GIN idx_servis_cari) memakai konfigurasi
+# farmtech_id: stemmer Indonesia ("bocoran" -> "bocor") atau 'simple' bila tidak ada.
+# Kata umum berikut dibuang dari laporan istilah (stemmer Indonesia tidak punya stopword).
+STOPWORD_KELUHAN = ("dan yang di ke dari tidak tak ada sudah agak sering saat jika kalau "
+                    "dengan untuk pada itu ini juga bisa mau terlalu kurang sangat lagi "
+                    "masih jadi kadang waktu atau sama buat kok nya sejak setelah sesudah terus")
+HASIL_CARI = 20
+ISTILAH_PER_KATEGORI = 5
+
+# {q} = ekspresi tsquery, {syarat} = filter tambahan.
+# Peringkat hanya dihitung untuk KANDIDAT_CARI tiket cocok terbaru (kata umum bisa cocok
+# dengan separuh tabel), potongan teks disorot hanya untuk hasil yang ditampilkan.
+KANDIDAT_CARI = 500
+
+SQL_CARI_KELUHAN = """
+    SELECT c.servis_id, c.tanggal_masuk, c.nama_alat,
+           ts_headline('farmtech_id', c.keluhan, c.q,
+                       'StartSel=[, StopSel=], MaxWords=12, MinWords=4'),
+           t.nama, c.status_servis, c.biaya_servis
+    FROM (
+        SELECT k.*, ts_rank_cd(k.cari_tsv, k.q) AS skor
+        FROM (
+            SELECT s.servis_id, s.tanggal_masuk, s.nama_alat, s.keluhan, s.status_servis,
+                   s.biaya_servis, s.teknisi_id, s.cari_tsv, q
+            FROM servis s
+            CROSS JOIN {q} AS cari(q)
+            WHERE s.cari_tsv @@ q {syarat}
+            ORDER BY s.servis_id DESC
+            LIMIT %(kandidat)s
+        ) k
+        ORDER BY skor DESC, k.servis_id DESC
+        LIMIT %(batas)s
+    ) c
+    LEFT JOIN teknisi t ON t.teknisi_id = c.teknisi_id
+    ORDER BY c.skor DESC, c.servis_id DESC
+"""
+
+# jenis alat (kata pertama, bobot A) AND salah satu kata keluhan; kata dasar dikutip apa adanya
+TSQUERY_SERUPA = """
+    (SELECT
+        (SELECT COALESCE(string_agg(quote_literal(l) || ':A', ' & '), '')::tsquery
+         FROM unnest(tsvector_to_array(
+             to_tsvector('farmtech_id', split_part(btrim(%(alat)s), ' ', 1)))) l)
+        &&
+        (SELECT COALESCE(string_agg(quote_literal(l), ' | '), '')::tsquery
+         FROM unnest(tsvector_to_array(to_tsvector('farmtech_id', %(teks)s))) l))
+"""
+
+SQL_ISTILAH_KELUHAN = f"""
+    WITH istilah AS (
+        SELECT {KATEGORI_ALAT} AS kategori, u.lexeme, COUNT(*) AS jumlah
+        FROM servis s
+        CROSS JOIN unnest(s.cari_tsv) AS u(lexeme, positions, weights)
+        WHERE s.tanggal_masuk >= %(mulai)s AND s.tanggal_masuk < %(akhir)s
+        AND 'B' = ANY(u.weights)
+        AND u.lexeme <> ALL(tsvector_to_array(to_tsvector('farmtech_id', %(stopword)s)))
+        AND u.lexeme !~ '^[0-9]+$'
+        GROUP BY 1, 2
+    ),
+    per_kategori AS (
+        SELECT {KATEGORI_ALAT} AS kategori, COUNT(*) AS servis
+        FROM servis
+        WHERE tanggal_masuk >= %(mulai)s AND tanggal_masuk < %(akhir)s
+        GROUP BY 1
+    )
+    SELECT kategori, lexeme, jumlah, servis, peringkat
+    FROM (
+        SELECT i.kategori, i.lexeme, i.jumlah, k.servis,
+               ROW_NUMBER() OVER (PARTITION BY i.kategori ORDER BY i.jumlah DESC, i.lexeme) AS peringkat
+        FROM istilah i
+        JOIN per_kategori k ON k.kategori = i.kategori
+    ) x
+    WHERE peringkat <= %(per_kategori)s
+    ORDER BY servis DESC, kategori, peringkat
+"""
+
+def cari_keluhan(cur, teks, batas=HASIL_CARI):
+    """
+    Cari riwayat servis dari keluhan/nama alat. Sintaks websearch:
+    kata biasa = semua harus ada, "frasa persis", or, -kata untuk mengecualikan.
+    """
+    sql = SQL_CARI_KELUHAN.format(q="websearch_to_tsquery('farmtech_id', %(teks)s)", syarat="")
+    cur.execute(sql, {"teks": teks, "batas": batas, "kandidat": KANDIDAT_CARI})
+    return cur.fetchall()
+
+def servis_serupa(cur, nama_alat, keluhan, batas=5):
+    """Servis selesai dengan jenis alat sama yang keluhannya memuat salah satu kata keluhan ini."""
+    sql = SQL_CARI_KELUHAN.format(
+        q=TSQUERY_SERUPA,
+        syarat=f"AND s.status_servis IN ('Selesai', 'Diambil') "
+               f"AND {KATEGORI_ALAT.replace('nama_alat', 's.nama_alat')} "
+               f"= initcap(split_part(btrim(%(alat)s), ' ', 1))"
+    )
+    cur.execute(sql, {"teks": keluhan, "alat": nama_alat, "batas": batas, "kandidat": KANDIDAT_CARI})
+    return cur.fetchall()
+
+def tampilkan_hasil_cari(rows):
+    print(tabulate(
+        [[r[0], r[1].strftime("%d-%m-%Y"), r[2], r[3], r[4] or "-", r[5],
+          format_rp(r[6]) if r[6] is not None else "-"] for r in rows],
+        headers=["ID", "Tgl Masuk", "Alat", "Keluhan", "Teknisi", "Status", "Biaya"],
+        tablefmt="grid", maxcolwidths=[None, None, 24, 48, None, None, None]
+    ))
 
-    print(colored(f"\n=== LAPORAN SERVIS PERIODE {bulan}-{tahun} ===", "cyan"))
+def cari_riwayat_keluhan(cur):
+    print("\n=== CARI RIWAYAT KELUHAN SERVIS ===")
+    print('Contoh: pompa bocor  |  "tidak menyala" sprayer  |  mesin or motor -baterai')
+    while True:
+        teks = input("\nKata kunci (Enter = kembali): ").strip()
+        if not teks:
+            return
+        t0 = time.perf_counter()
+        rows = cari_keluhan(cur, teks)
+        ms = (time.perf_counter() - t0) * 1000
+        if not rows:
+            print(f"Tidak ada servis yang cocok ({ms:.1f} ms).")
+            continue
+        tampilkan_hasil_cari(rows)
+        print(f"{len(rows)} hasil teratas ({ms:.1f} ms)")
+
+def laporan_istilah_keluhan(cur):
+    print("\n=== ISTILAH KELUHAN TERBANYAK PER JENIS ALAT ===")
+
+    periode = input_periode()
+    if not periode:
+        print("Periode tidak valid.")
+        return
+    start, end, label = periode
 
-    if not rows_raw:
-        print("Tidak ada data servis.")
+    cur.execute(SQL_ISTILAH_KELUHAN, {"mulai": start, "akhir": end, "stopword": STOPWORD_KELUHAN,
+                                      "per_kategori": ISTILAH_PER_KATEGORI})
+    rows = cur.fetchall()
+
+    print(colored(f"\n=== ISTILAH KELUHAN PERIODE {label} ===", "cyan"))
+    if not rows:
+        print("Tidak ada servis pada periode ini.")
         return
 
     tabel = []
-    for r in rows_raw:
+    for kategori, istilah, jumlah, servis, peringkat in rows:
         tabel.append([
-            r[0],                   # ID teknisi
-            r[1],                   # nama teknisi
-            r[2],                   # jumlah servis
-            format_rp(r[3])         # format pendapatan
+            kategori if peringkat == 1 else "",
+            servis if peringkat == 1 else "",
+            istilah,
+            jumlah,
+            f"{jumlah * 100 / servis:.0f}%"
         ])
-
-    print(tabulate(
-        tabel,
-        headers=["ID Teknisi", "Nama Teknisi", "Jumlah Servis", "Pendapatan"],
-        tablefmt="grid"
-    ))
-
-    # hitung total pendapatan dengan data asli
-    total_semua = sum(r[3] for r in rows_raw)
-
-    print(colored("\nTotal Pendapatan Servis: " + format_rp(total_semua), "green"))
+    print(tabulate(tabel, headers=["Jenis Alat", "Servis", "Istilah", "Muncul", "% Servis"],
+                   tablefmt="grid"))
+    print("Istilah berupa kata dasar hasil stemming (mis. 'bocor' mencakup 'bocoran').")
+
+def benchmark_cari_keluhan(jumlah=100_000):
+    """Waktu pencarian keluhan di atas tiket servis sintetis (transaksi di-rollback)."""
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    cur.execute("SELECT (SELECT MIN(teknisi_id) FROM teknisi), (SELECT MIN(pegawai_id) FROM pegawai)")
+    teknisi_id, kasir = cur.fetchone()
+    print(f"Menyiapkan {jumlah:,} servis sintetis...")
+    cur.execute("""
+        INSERT INTO servis (kasir_id, teknisi_id, nama_alat, keluhan, status_servis,
+                            tanggal_masuk, tanggal_selesai)
+        SELECT %s, %s,
+               (ARRAY['Pompa Air 2 Inch', 'Sprayer Elektrik 16L', 'Traktor Mini',
+                      'Mesin Giling Padi', 'Mesin Potong Rumput'])[1 + g %% 5],
+               (ARRAY['bocor di selang', 'mesin panas berlebih', 'tidak mau menyala',
+                      'baterai cepat habis', 'rantai longgar', 'pisau tumpul',
+                      'suara kasar saat dinyalakan', 'oli merembes', 'tarikan lemah'])[1 + g %% 9]
+               || ' ' || (ARRAY['sejak kemarin', 'setelah hujan', 'kadang-kadang', 'terus menerus',
+                                'sesudah dipakai lama', ''])[1 + (g / 9) %% 6]
+               || CASE WHEN g %% 997 = 0 THEN ' karburator tersumbat' ELSE '' END,
+               'Diambil', CURRENT_DATE - (g %% 1500), CURRENT_DATE - (g %% 1500) + 2
+        FROM generate_series(1, %s) g
+    """, (kasir, teknisi_id, jumlah))
+    cur.execute("ANALYZE servis")
+
+    hasil = []
+    for nama, fungsi in (("karburator", lambda: cari_keluhan(cur, "karburator")),
+                         ("pompa bocor", lambda: cari_keluhan(cur, "pompa bocor")),
+                         ('"tidak mau menyala"', lambda: cari_keluhan(cur, '"tidak mau menyala"')),
+                         ("mesin or pisau -padi", lambda: cari_keluhan(cur, "mesin or pisau -padi")),
+                         ("serupa: Pompa Air / bocor oli",
+                          lambda: servis_serupa(cur, "Pompa Air", "bocor oli", 5))):
+        terbaik, rows = _waktu_terbaik(fungsi)
+        hasil.append([nama, len(rows), f"{terbaik:.1f}"])
+
+    t0 = time.perf_counter()
+    mulai, akhir, _ = rentang_periode("tahun", date.today())
+    cur.execute(SQL_ISTILAH_KELUHAN, {"mulai": mulai, "akhir": akhir, "stopword": STOPWORD_KELUHAN,
+                                      "per_kategori": ISTILAH_PER_KATEGORI})
+    cur.fetchall()
+    istilah_ms = (time.perf_counter() - t0) * 1000
+
+    _rollback_dan_analyze(conn, "servis")
+    conn.close()
+    print(tabulate(hasil, headers=["Pencarian", "Ditampilkan", "Waktu (ms)"], tablefmt="grid"))
+    print(f"Laporan istilah keluhan setahun: {istilah_ms:.1f} ms")
 
 # -------------------------
 # LAPORAN BARANG TIDAK LAKU
 # -------------------------
-def laporan_barang_tidak_laku(cur):
-    print("\n=== LAPORAN BARANG TIDAK LAKU ===")
-
-    # ======================================================
-    # UPDATE OTOMATIS BARANG TIDAK LAKU (LOGIKA GABUNGAN)
-    # ======================================================
-    cur.execute("""
-        WITH last_sale AS (
-            SELECT
-                p.produk_id,
-                p.nama_produk,
-                p.tanggal_input,
-                MAX(DATE(tp.tanggal_transaksi)) AS terakhir_jual
-            FROM produk p
-            LEFT JOIN detail_penjualan dp ON dp.produk_id = p.produk_id
-            LEFT JOIN penjualan tp ON tp.penjualan_id = dp.penjualan_id
-            GROUP BY p.produk_id
-        ),
-        to_update AS (
-            SELECT
-                ls.produk_id,
-                COALESCE(ls.terakhir_jual, ls.tanggal_input) AS tanggal_acuan
-            FROM last_sale ls
-            WHERE COALESCE(ls.terakhir_jual, ls.tanggal_input) 
-                  <= CURRENT_DATE - INTERVAL '120 days'
-        )
+SQL_REFRESH_MARKDOWN = """
+    WITH kandidat AS (
+        -- range scan idx_produk_terakhir_aktif dari tingkat termuda
+        SELECT produk_id, kategori,
+               COALESCE(terakhir_terjual::date, tanggal_input) AS acuan,
+               CURRENT_DATE - COALESCE(terakhir_terjual::date, tanggal_input) AS umur
+        FROM produk
+        WHERE COALESCE(terakhir_terjual::date, tanggal_input)
+              <= CURRENT_DATE - (SELECT COALESCE(MIN(min_hari), 120) FROM aturan_markdown)
+    ),
+    -- kategori dicocokkan tanpa membedakan huruf besar/kecil
+    kategori_khusus AS (
+        SELECT DISTINCT lower(kategori) AS kategori FROM aturan_markdown WHERE kategori IS NOT NULL
+    ),
+    tingkat AS (
+        -- tiap tingkat berlaku sampai min_hari tingkat berikutnya
+        SELECT COALESCE(lower(kategori), '') AS kunci, min_hari, diskon,
+               LEAD(min_hari) OVER (PARTITION BY lower(kategori) ORDER BY min_hari) AS maks_hari
+        FROM aturan_markdown
+    ),
+    hasil AS (
+        SELECT k.produk_id, k.acuan, t.diskon
+        FROM kandidat k
+        LEFT JOIN kategori_khusus kk ON kk.kategori = lower(k.kategori)
+        JOIN tingkat t ON t.kunci = COALESCE(kk.kategori, '')
+        WHERE k.umur >= t.min_hari
+        AND (t.maks_hari IS NULL OR k.umur < t.maks_hari)
+    ),
+    berubah AS (
+        -- hanya baris yang berubah, supaya cache kasir tidak dikabari sia-sia
+        SELECT h.* FROM hasil h
+        LEFT JOIN barang_tidak_laku b ON b.produk_id = h.produk_id
+        WHERE b.produk_id IS NULL
+        OR b.diskon_otomatis IS DISTINCT FROM h.diskon
+        OR b.terakhir_terjual IS DISTINCT FROM h.acuan
+    ),
+    simpan AS (
         INSERT INTO barang_tidak_laku (produk_id, terakhir_terjual, diskon_otomatis)
-        SELECT produk_id, tanggal_acuan, 20
-        FROM to_update
-        ON CONFLICT (produk_id)
-        DO UPDATE SET
+        SELECT produk_id, acuan, diskon FROM berubah
+        ON CONFLICT (produk_id) DO UPDATE SET
             terakhir_terjual = EXCLUDED.terakhir_terjual,
-            diskon_otomatis = EXCLUDED.diskon_otomatis;
-    """)
+            diskon_otomatis = EXCLUDED.diskon_otomatis
+        RETURNING produk_id
+    ),
+    buang AS (
+        -- tidak lagi masuk tingkat mana pun (aturan diubah)
+        DELETE FROM barang_tidak_laku b
+        WHERE NOT EXISTS (SELECT 1 FROM hasil h WHERE h.produk_id = b.produk_id)
+        RETURNING produk_id
+    )
+    SELECT (SELECT COUNT(*) FROM simpan) + (SELECT COUNT(*) FROM buang)
+"""
+
+def refresh_barang_tidak_laku(cur):
+    """
+    Job terjadwal: hitung markdown barang tidak laku menurut aturan_markdown
+    (tingkat umur, aturan per kategori) dalam satu statement. Harga akhir
+    dibatasi harga beli di v_harga_efektif; perubahan diteruskan ke cache
+    katalog kasir lewat trigger notify. Tidak commit. Return jumlah baris berubah.
+    """
+    cur.execute(SQL_REFRESH_MARKDOWN)
+    return cur.fetchone()[0]
 
+def kelola_aturan_markdown(conn, cur):
+    while True:
+        print("\n=== ATURAN MARKDOWN ===")
+        cur.execute("""
+            SELECT aturan_id, COALESCE(kategori, '(semua)'), min_hari, diskon
+            FROM aturan_markdown
+            ORDER BY kategori NULLS FIRST, min_hari
+        """)
+        print(tabulate(cur.fetchall(), headers=["ID", "Kategori", "Min. Hari Tidak Laku", "Diskon %"],
+                       tablefmt="grid"))
+        print("Kategori dengan aturan sendiri tidak memakai aturan (semua).")
+        print("Harga setelah diskon tidak pernah di bawah harga beli.")
+        print("1. Tambah/ubah tingkat  2. Hapus tingkat  3. Terapkan sekarang  4. Kembali")
+        pilih = input("Pilih: ").strip()
 
-    # ======================================================
-    # TAMPILKAN LAPORAN
-    # ======================================================
+        if pilih == "1":
+            kategori = input("Kategori (Enter = semua): ").strip() or None
+            if kategori:
+                # simpan dengan ejaan kategori produk; kategori yang tidak ada ditolak
+                cur.execute("SELECT DISTINCT kategori FROM produk WHERE kategori IS NOT NULL ORDER BY 1")
+                ada = [r[0] for r in cur.fetchall()]
+                cocok = [k for k in ada if k.lower() == kategori.lower()]
+                if not cocok:
+                    print("Kategori tidak ditemukan. Pilihan:", ", ".join(ada) or "-")
+                    continue
+                kategori = cocok[0]
+            min_hari = input_int("Minimal hari tidak laku: ")
+            diskon = input_int("Diskon (%): ")
+            if not min_hari or min_hari <= 0 or diskon is None or not 0 <= diskon <= 90:
+                print("Input tidak valid (hari > 0, diskon 0-90).")
+                continue
+            try:
+                cur.execute("""
+                    UPDATE aturan_markdown SET diskon = %s
+                    WHERE lower(kategori) IS NOT DISTINCT FROM lower(%s) AND min_hari = %s
+                """, (diskon, kategori, min_hari))
+                if cur.rowcount == 0:
+                    cur.execute("INSERT INTO aturan_markdown (kategori, min_hari, diskon) VALUES (%s, %s, %s)",
+                                (kategori, min_hari, diskon))
+                conn.commit()
+                print("Aturan tersimpan.")
+            except Exception as e:
+                conn.rollback()
+                print("Gagal menyimpan aturan:", e)
+        elif pilih == "2":
+            aturan_id = input_int("ID aturan: ")
+            cur.execute("DELETE FROM aturan_markdown WHERE aturan_id = %s", (aturan_id,))
+            conn.commit()
+            print("Aturan dihapus." if cur.rowcount else "Aturan tidak ditemukan.")
+        elif pilih == "3":
+            hasil = jalankan_job(conn, "barang_tidak_laku", paksa=True)
+            if hasil is None:
+                print("Job sedang dijalankan proses lain.")
+            else:
+                print(f"Markdown diterapkan: {hasil[1]} produk berubah ({hasil[2]} ms).")
+        elif pilih == "4":
+            break
+        else:
+            print("Pilihan tidak valid.")
 
+def benchmark_markdown(jumlah_produk=10_000):
+    """
+    Waktu hitung ulang markdown untuk katalog sintetis berumur acak
+    (dalam transaksi yang di-rollback).
+    """
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(supplier_id) FROM supplier")
+    supplier_id = cur.fetchone()[0]
+    cur.execute("SET LOCAL farmtech.impor_massal = 'on'")
     cur.execute("""
-        SELECT b.produk_id, p.nama_produk, b.terakhir_terjual,
-               b.diskon_otomatis, p.harga
-        FROM barang_tidak_laku b
-        JOIN produk p ON p.produk_id = b.produk_id
-        ORDER BY b.terakhir_terjual ASC
-    """)
+        INSERT INTO produk (supplier_id, nama_produk, kategori, harga, harga_beli, stok, tanggal_input)
+        SELECT %s, 'Bench ' || g, 'Kategori ' || (g %% 20), 100000, 70000, 5,
+               CURRENT_DATE - (g %% 900)
+        FROM generate_series(1, %s) g
+    """, (supplier_id, jumlah_produk))
+    cur.execute("INSERT INTO aturan_markdown (kategori, min_hari, diskon) VALUES ('Kategori 3', 60, 10)")
+    cur.execute("ANALYZE produk")
+
+    # penerapan pertama menulis semua baris; berikutnya hanya yang berubah
+    t0 = time.perf_counter()
+    n = refresh_barang_tidak_laku(cur)
+    awal = (time.perf_counter() - t0) * 1000
+    terbaik, _ = _waktu_terbaik(lambda: refresh_barang_tidak_laku(cur))
+    cur.execute("SELECT COUNT(*) FROM produk")
+    total = cur.fetchone()[0]
+    _rollback_dan_analyze(conn, "produk")
+    conn.close()
+    print(f"{total:,} produk, {n:,} masuk markdown")
+    print(f"Penerapan pertama : {awal:.1f} ms")
+    print(f"Refresh berikutnya: {terbaik:.1f} ms ({terbaik * 1000 / total:.2f} ms per 1000 produk)")
 
-    rows = cur.fetchall()
+def laporan_barang_tidak_laku(cur):
+    print("\n=== LAPORAN BARANG TIDAK LAKU ===")
 
-    if not rows:
-        print("Tidak ada barang tidak laku.")
-        return
+    # Status dihitung job terjadwal; laporan cukup membaca hasilnya
+    terakhir = job_terakhir(cur, "barang_tidak_laku")
+    if terakhir is None:
+        print("Status barang tidak laku belum pernah dihitung, menghitung sekarang...")
+        jalankan_job(cur.connection, "barang_tidak_laku")
+        terakhir = job_terakhir(cur, "barang_tidak_laku")
+    if terakhir:
+        print(f"Diperbarui {terakhir[0].strftime('%d-%m-%Y %H:%M')} ({terakhir[1]} ms)")
 
-    tabel = []
-    for r in rows:
+    jumlah = {"potongan": 0}
+
+    def format_baris(r):
         harga_asli = r[4]
-        diskon = (r[3] / 100) * harga_asli
-        harga_setelah_diskon = harga_asli - diskon
+        harga_setelah_diskon = r[5]
+        jumlah["potongan"] += (harga_asli - harga_setelah_diskon) * (r[6] or 0)
 
         tanggal = r[2].strftime("%d-%m-%Y") if r[2] else "-"
 
-        tabel.append([
+        return [
             r[0],               # ID Produk
             r[1],               # Nama Produk
             tanggal,            # Terakhir Terjual / tanggal acuan
             f"{r[3]}%",
             format_rp(harga_asli),
             format_rp(harga_setelah_diskon)
-        ])
+        ]
+
+    with kursor_aliran(cur, "barang_tidak_laku") as aliran:
+        aliran.execute("""
+            SELECT b.produk_id, p.nama_produk, b.terakhir_terjual,
+                   h.diskon, h.harga_dasar, h.harga_akhir, p.stok
+            FROM barang_tidak_laku b
+            JOIN produk p ON p.produk_id = b.produk_id
+            JOIN v_harga_efektif h ON h.produk_id = b.produk_id
+            ORDER BY b.terakhir_terjual ASC
+        """)
+        n = cetak_aliran(
+            aliran,
+            [("ID Produk", 9, True), ("Nama Produk", 30, False), ("Terakhir Terjual", 16, False),
+             ("Diskon", 6, True), ("Harga Asli", 14, True), ("Harga Setelah Diskon", 20, True)],
+            format_baris
+        )
 
-    print(tabulate(
-        tabel,
-        headers=[
-            "ID Produk",
-            "Nama Produk",
-            "Terakhir Terjual",
-            "Diskon",
-            "Harga Asli",
-            "Harga Setelah Diskon"
-        ],
-        tablefmt="grid"
-    ))
+    if n == 0:
+        print("Tidak ada barang tidak laku.")
+        return
+    print(f"{n} produk, nilai potongan atas stok tersisa {format_rp(jumlah['potongan'])}")
 
 # -------------------------
 # Laporan analisis
 # -------------------------
+# Omzet (harga x qty, sebelum diskon member & PPN) dan HPP dari hpp_satuan yang
+# tersimpan di tiap baris penjualan. Satu query, tingkat: total / kategori / produk.
+SQL_MARGIN = """
+    SELECT CASE WHEN GROUPING(p.kategori) = 1 THEN NULL
+                WHEN GROUPING(p.produk_id) = 1 THEN 'kategori'
+                ELSE 'produk' END AS tingkat,
+           p.kategori, MAX(p.nama_produk),
+           COALESCE(SUM(dp.qty * dp.harga_saat_penjualan), 0) AS omzet,
+           COALESCE(ROUND(SUM(dp.qty * dp.hpp_satuan)), 0) AS hpp
+    FROM penjualan tp
+    JOIN detail_penjualan dp ON dp.penjualan_id = tp.penjualan_id
+    JOIN produk p ON p.produk_id = dp.produk_id
+    WHERE tp.tanggal_transaksi >= %s
+    AND tp.tanggal_transaksi < %s
+    GROUP BY GROUPING SETS ((), (p.kategori), (p.kategori, p.produk_id))
+    ORDER BY p.kategori
+"""
+
 def laporan_analisis(cur):
     print("\n=== LAPORAN ANALISIS ===")
-    tahun = input("Masukkan tahun (default tahun ini): ").strip()
-    bulan = input("Masukkan bulan (1-12, default bulan ini): ").strip()
-
-    tahun = int(tahun) if tahun else datetime.now().year
-    bulan = int(bulan) if bulan else datetime.now().month
-
-    start = date(tahun, bulan, 1)
-    end = date(tahun + 1, 1, 1) if bulan == 12 else date(tahun, bulan + 1, 1)
+    periode = input_periode()
+    if not periode:
+        print("Periode tidak valid.")
+        return
+    start, end, label = periode
 
-    # Query total penjualan
+    # Total penjualan dari ringkasan harian
     cur.execute("""
-        SELECT COALESCE(SUM(total_harga), 0)
-        FROM penjualan
-        WHERE DATE(tanggal_transaksi) >= %s
-        AND DATE(tanggal_transaksi) < %s
+        SELECT COALESCE(SUM(pendapatan), 0),
+               COALESCE(SUM(jumlah_transaksi), 0),
+               COALESCE(SUM(ppn), 0),
+               COALESCE(SUM(diskon), 0),
+               COALESCE(SUM(pendapatan) FILTER (WHERE is_member), 0)
+        FROM ringkasan_penjualan_harian
+        WHERE tanggal >= %s
+        AND tanggal < %s
     """, (start, end))
-    total_penjualan = cur.fetchone()[0]
+    total_penjualan, jumlah_tx, total_ppn, total_diskon, dari_member = cur.fetchone()
 
-    # Query total pembelian
+    # Total pembelian dari ringkasan harian
     cur.execute("""
         SELECT COALESCE(SUM(total_pembelian), 0)
-        FROM pembelian
-        WHERE DATE(tanggal_pembelian) >= %s
-        AND DATE(tanggal_pembelian) < %s
+        FROM ringkasan_pembelian_harian
+        WHERE tanggal >= %s
+        AND tanggal < %s
     """, (start, end))
     total_pembelian = cur.fetchone()[0]
 
-    laba = total_penjualan - total_pembelian
+    # Omzet & HPP per kategori / produk dalam satu pass
+    cur.execute(SQL_MARGIN, (start, end))
+    margin = cur.fetchall()
+    total_omzet = sum(r[3] for r in margin if r[0] is None)
+    total_hpp = sum(r[4] for r in margin if r[0] is None)
 
-    print(colored(f"\n=== LAPORAN ANALISIS PERIODE {bulan}-{tahun} ===", "cyan"))
+    # PPN titipan pajak, bukan pendapatan; diskon member mengurangi pendapatan
+    pendapatan_bersih = total_omzet - total_diskon
+    laba = pendapatan_bersih - total_hpp
+
+    print(colored(f"\n=== LAPORAN ANALISIS PERIODE {label} ===", "cyan"))
 
     rows = [
+        ["Jumlah Transaksi", jumlah_tx],
         ["Total Penjualan", format_rp(total_penjualan)],
-        ["Total Pembelian", format_rp(total_pembelian)],
-        ["Laba Kotor", colored(format_rp(laba), "green" if laba >= 0 else "red")]
+        ["- dari member", format_rp(dari_member)],
+        ["- non member", format_rp(total_penjualan - dari_member)],
+        ["PPN", format_rp(total_ppn)],
+        ["Diskon Member", format_rp(total_diskon)],
+        ["Pendapatan Bersih (tanpa PPN)", format_rp(pendapatan_bersih)],
+        ["HPP Barang Terjual", format_rp(total_hpp)],
+        ["Laba Kotor", colored(format_rp(laba), "green" if laba >= 0 else "red")],
+        ["Margin Kotor", f"{laba * 100 / pendapatan_bersih:.1f}%" if pendapatan_bersih else "-"],
+        ["Total Pembelian (restock)", format_rp(total_pembelian)],
     ]
 
     print(tabulate(rows, headers=["Item", "Nilai"], tablefmt="grid"))
 
-def laporan_stok_produk(cur):
-    print("\n=== LAPORAN STOK PRODUK ===")
+    kategori = [r for r in margin if r[0] == "kategori"]
+    if kategori:
+        print("\nMargin per kategori:")
+        print(tabulate(
+            [[r[1] or "-", format_rp(r[3]), format_rp(r[4]), format_rp(r[3] - r[4]),
+              f"{(r[3] - r[4]) * 100 / r[3]:.1f}%" if r[3] else "-"] for r in kategori],
+            headers=["Kategori", "Omzet", "HPP", "Margin", "%"], tablefmt="grid"
+        ))
+
+    produk = sorted((r for r in margin if r[0] == "produk"), key=lambda r: r[3] - r[4], reverse=True)
+    if produk:
+        print(f"\n{min(len(produk), 10)} produk dengan margin terbesar:")
+        print(tabulate(
+            [[r[2], r[1] or "-", format_rp(r[3]), format_rp(r[4]), format_rp(r[3] - r[4])]
+             for r in produk[:10]],
+            headers=["Produk", "Kategori", "Omzet", "HPP", "Margin"], tablefmt="grid"
+        ))
 
-    BATAS_MENIPIS = 5  # fixed
+# -------------------------
+# Peramalan permintaan & titik pesan ulang
+# -------------------------
+HARI_HISTORI = 364        # 52 minggu penjualan harian sebagai dasar ramalan
+MUSIM = 7                 # pola mingguan
+LEAD_TIME_HARI = 7        # perkiraan waktu tunggu barang dari supplier
+PERIODE_TINJAU_HARI = 14  # pesanan dihitung untuk menutup lead time + periode ini
+Z_LAYANAN = 1.65          # ~95% tingkat layanan untuk stok pengaman
+BATAS_MENIPIS = 5         # ROP produk tanpa riwayat penjualan (atau tanpa NumPy)
+# kombinasi (alpha, gamma) yang dicoba; dipilih per produk dengan galat terkecil
+GRID_HW = [(a, g) for a in (0.05, 0.2, 0.5) for g in (0.05, 0.2, 0.5)]
+BETA_HW = 0.01
+
+def matriks_penjualan_harian(cur, hari=HARI_HISTORI):
+    """
+    Unit terjual per produk per hari untuk `hari` hari terakhir (tanpa hari ini).
+    Return (produk_ids, Y) dengan Y berbentuk (jumlah_produk, hari).
+    """
+    akhir = date.today()
+    mulai = akhir - timedelta(days=hari)
+    cur.execute("SELECT produk_id FROM produk ORDER BY produk_id")
+    produk_ids = np.array([r[0] for r in cur.fetchall()], dtype=np.int64)
+    Y = np.zeros((len(produk_ids), hari))
 
     cur.execute("""
-        SELECT produk_id, nama_produk, kategori, harga, stok
-        FROM produk
-        ORDER BY stok ASC, produk_id ASC
+        SELECT produk_id, tanggal - %s AS hari, qty
+        FROM penjualan_produk_harian
+        WHERE tanggal >= %s AND tanggal < %s
+    """, (mulai, mulai, akhir))
+    rows = cur.fetchall()
+    if rows and len(produk_ids):
+        data = np.array(rows, dtype=np.int64)
+        baris = np.searchsorted(produk_ids, data[:, 0])
+        ada = (baris < len(produk_ids)) & (produk_ids[np.minimum(baris, len(produk_ids) - 1)] == data[:, 0])
+        np.add.at(Y, (baris[ada], data[ada, 1]), data[ada, 2])
+    return produk_ids, Y
+
+def _holt_winters(Y, alpha, beta, gamma, m=MUSIM):
+    """
+    Holt-Winters aditif untuk semua produk sekaligus: loop hanya di sumbu waktu,
+    tiap langkah operasi vektor atas seluruh produk.
+    Return (level, trend, musim, mse galat satu langkah).
+    """
+    n, T = Y.shape
+    level = Y[:, :m].mean(axis=1)
+    trend = (Y[:, m:2 * m].mean(axis=1) - level) / m if T >= 2 * m else np.zeros(n)
+    musim = Y[:, :m] - level[:, None]
+    sse = np.zeros(n)
+    for t in range(m, T):
+        j = t % m
+        s = musim[:, j]
+        e = Y[:, t] - (level + trend + s)
+        sse += e * e
+        level_baru = alpha * (Y[:, t] - s) + (1 - alpha) * (level + trend)
+        trend = beta * (level_baru - level) + (1 - beta) * trend
+        musim[:, j] = gamma * (Y[:, t] - level_baru) + (1 - gamma) * s
+        level = level_baru
+    return level, trend, musim, sse / max(T - m, 1)
+
+def ramal_permintaan(Y, h, m=MUSIM):
+    """
+    Pilih (alpha, gamma) terbaik per produk dari GRID_HW lalu ramal h hari ke depan.
+    Return (ramalan (n, h) >= 0, rmse galat satu langkah (n,)).
+    """
+    n, T = Y.shape
+    if n == 0 or T < m:
+        return np.zeros((n, h)), np.zeros(n)
+
+    hasil = [_holt_winters(Y, a, BETA_HW, g, m) for a, g in GRID_HW]
+    mse = np.stack([r[3] for r in hasil])                  # (grid, n)
+    terbaik = mse.argmin(axis=0)                           # (n,)
+    idx = np.arange(n)
+    level = np.stack([r[0] for r in hasil])[terbaik, idx]
+    trend = np.stack([r[1] for r in hasil])[terbaik, idx]
+    musim = np.stack([r[2] for r in hasil])[terbaik, idx]  # (n, m)
+
+    k = np.arange(1, h + 1)
+    ramalan = level[:, None] + trend[:, None] * k + musim[:, (T - 1 + k) % m]
+    return np.clip(ramalan, 0, None), np.sqrt(mse[terbaik, idx])
+
+def titik_pesan_ulang(cur):
+    """
+    Titik pesan ulang (ROP) dan stok target per produk (saran pesan = target - stok).
+    ROP = permintaan selama lead time + stok pengaman (z x rmse x sqrt(lead time)).
+    Produk tanpa penjualan dalam HARI_HISTORI memakai BATAS_MENIPIS.
+    Return dict produk_id -> {"rop", "target", "per_hari"}.
+    """
+    produk_ids, Y = matriks_penjualan_harian(cur)
+    h = LEAD_TIME_HARI + PERIODE_TINJAU_HARI
+    ramalan, rmse = ramal_permintaan(Y, h)
+
+    pengaman = Z_LAYANAN * rmse * np.sqrt(LEAD_TIME_HARI)
+    rop = np.ceil(ramalan[:, :LEAD_TIME_HARI].sum(axis=1) + pengaman).astype(int)
+    target = np.ceil(ramalan.sum(axis=1) + pengaman).astype(int)
+    per_hari = ramalan.mean(axis=1)
+
+    # tanpa riwayat ramalan selalu 0; jangan turunkan batas menipis lama
+    tanpa_histori = ~Y.any(axis=1)
+    rop[tanpa_histori] = BATAS_MENIPIS
+    target[tanpa_histori] = np.maximum(target[tanpa_histori], BATAS_MENIPIS)
+    return {
+        int(pid): {"rop": int(rop[i]), "target": int(target[i]), "per_hari": float(per_hari[i])}
+        for i, pid in enumerate(produk_ids)
+    }
+
+def saran_pemesanan(cur):
+    print("\n=== SARAN PEMESANAN PER SUPPLIER ===")
+    if np is None:
+        print("NumPy tidak terpasang; peramalan tidak tersedia.")
+        return
+    mulai = time.perf_counter()
+    rop = titik_pesan_ulang(cur)
+    durasi = time.perf_counter() - mulai
+
+    cur.execute("""
+        SELECT p.produk_id, p.nama_produk, p.stok, p.harga_beli, s.supplier_id, s.nama_supplier
+        FROM produk p
+        JOIN supplier s ON s.supplier_id = p.supplier_id
+        ORDER BY s.nama_supplier, p.nama_produk
     """)
+    per_supplier = {}
+    for pid, nama, stok, harga_beli, sid, nama_supplier in cur.fetchall():
+        r = rop.get(pid)
+        if not r or stok > r["rop"]:
+            continue
+        qty = max(r["target"] - stok, 0)
+        if qty == 0:
+            continue
+        per_supplier.setdefault((sid, nama_supplier), []).append(
+            [pid, nama, stok, r["rop"], f"{r['per_hari']:.1f}", qty, format_rp(qty * harga_beli)]
+        )
 
-    rows = cur.fetchall()
-    if not rows:
-        print("Tidak ada data produk.")
+    print(f"Ramalan {len(rop)} produk selesai dalam {durasi * 1000:.0f} ms "
+          f"(lead time {LEAD_TIME_HARI} hari, tinjau {PERIODE_TINJAU_HARI} hari).")
+    if not per_supplier:
+        print("Semua stok masih di atas titik pesan ulang.")
+        return
+    for (sid, nama_supplier), rows in per_supplier.items():
+        print(colored(f"\n{nama_supplier} (ID {sid})", "cyan"))
+        print(tabulate(rows, headers=["ID", "Produk", "Stok", "ROP", "Rata/hari", "Saran Pesan", "Perkiraan"],
+                       tablefmt="grid"))
+
+def benchmark_forecast(jumlah_produk=5000):
+    """Waktu peramalan untuk katalog sintetis (pola mingguan + noise Poisson)."""
+    if np is None:
+        print("NumPy tidak terpasang.")
         return
+    rng = np.random.default_rng(1)
+    dasar = rng.gamma(1.0, 2.0, size=(jumlah_produk, 1))
+    pola = 1 + 0.5 * np.sin(2 * np.pi * np.arange(HARI_HISTORI) / MUSIM)
+    Y = rng.poisson(dasar * pola).astype(float)
 
-    tabel = []
-    for r in rows:
-        status = "MENIPIS" if r[4] <= BATAS_MENIPIS else "-"
-        tabel.append([
+    mulai = time.perf_counter()
+    ramalan, rmse = ramal_permintaan(Y, LEAD_TIME_HARI + PERIODE_TINJAU_HARI)
+    durasi = time.perf_counter() - mulai
+    print(f"{jumlah_produk:,} produk x {HARI_HISTORI} hari x {len(GRID_HW)} parameter: "
+          f"{durasi * 1000:.0f} ms")
+
+def laporan_stok_produk(cur):
+    print("\n=== LAPORAN STOK PRODUK ===")
+
+    rop = titik_pesan_ulang(cur) if np is not None else {}
+
+    jumlah = {"unit": 0, "nilai": 0, "menipis": 0}
+
+    def format_baris(r):
+        batas = rop[r[0]]["rop"] if r[0] in rop else BATAS_MENIPIS
+        status = "MENIPIS" if r[4] <= batas else "-"
+        jumlah["unit"] += r[4]
+        jumlah["nilai"] += r[3] * r[4]
+        jumlah["menipis"] += status == "MENIPIS"
+        return [
             r[0],          # ID
             r[1],          # Nama Produk
             r[2],          # Kategori
             format_rp(r[3]),
             r[4],          # Stok
+            r[5],          # Terjual 30 hari terakhir
+            batas,         # Titik pesan ulang
             status
+        ]
+
+    with kursor_aliran(cur, "stok_produk") as aliran:
+        aliran.execute("""
+            SELECT p.produk_id, p.nama_produk, p.kategori, p.harga, p.stok,
+                   COALESCE(h.qty, 0) AS terjual_30
+            FROM produk p
+            LEFT JOIN (
+                SELECT produk_id, SUM(qty) AS qty
+                FROM penjualan_produk_harian
+                WHERE tanggal >= CURRENT_DATE - 30
+                GROUP BY produk_id
+            ) h ON h.produk_id = p.produk_id
+            ORDER BY p.stok ASC, p.produk_id ASC
+        """)
+        n = cetak_aliran(
+            aliran,
+            [("ID", 6, True), ("Produk", 30, False), ("Kategori", 15, False),
+             ("Harga", 14, True), ("Stok", 6, True), ("Terjual 30h", 11, True),
+             ("ROP", 6, True), ("Status", 7, False)],
+            format_baris
+        )
+
+    if n == 0:
+        print("Tidak ada data produk.")
+        return
+    print(f"{n} produk, {jumlah['unit']} unit, nilai stok {format_rp(jumlah['nilai'])}, "
+          f"{jumlah['menipis']} menipis")
+
+# -------------------------
+# Ekspor laporan (CSV / JSONL / Parquet)
+# -------------------------
+# nama -> (judul, query, pakai_periode). Query memakai %(mulai)s / %(akhir)s.
+EKSPOR_LAPORAN = {
+    "penjualan": ("Transaksi penjualan", """
+        SELECT tp.penjualan_id, tp.tanggal_transaksi, tp.kasir_id, tp.member_id,
+               m.nama AS nama_member, tp.subtotal, tp.ppn, tp.diskon, tp.total_harga
+        FROM penjualan tp
+        LEFT JOIN member m ON m.member_id = tp.member_id
+        WHERE tp.tanggal_transaksi >= %(mulai)s AND tp.tanggal_transaksi < %(akhir)s
+        ORDER BY tp.tanggal_transaksi, tp.penjualan_id
+    """, True),
+    "detail_penjualan": ("Rincian item penjualan", """
+        SELECT dp.penjualan_id, tp.tanggal_transaksi, dp.produk_id, p.nama_produk,
+               dp.qty, dp.harga_saat_penjualan,
+               dp.qty * dp.harga_saat_penjualan AS subtotal
+        FROM penjualan tp
+        JOIN detail_penjualan dp ON dp.penjualan_id = tp.penjualan_id
+        JOIN produk p ON p.produk_id = dp.produk_id
+        WHERE tp.tanggal_transaksi >= %(mulai)s AND tp.tanggal_transaksi < %(akhir)s
+        ORDER BY tp.tanggal_transaksi, dp.penjualan_id
+    """, True),
+    "ringkasan_harian": ("Ringkasan penjualan harian", """
+        SELECT tanggal, SUM(jumlah_transaksi) AS jumlah_transaksi, SUM(subtotal) AS subtotal,
+               SUM(ppn) AS ppn, SUM(diskon) AS diskon, SUM(pendapatan) AS pendapatan
+        FROM ringkasan_penjualan_harian
+        WHERE tanggal >= %(mulai)s AND tanggal < %(akhir)s
+        GROUP BY tanggal
+        ORDER BY tanggal
+    """, True),
+    # sama dengan Laporan Analisis: laba kotor = pendapatan bersih - HPP barang terjual;
+    # pembelian restock hanya informasi arus kas, bukan pengurang laba
+    "analisis": ("Analisis pendapatan, HPP dan laba kotor", """
+        SELECT j.penjualan, j.ppn, j.diskon,
+               m.omzet - j.diskon AS pendapatan_bersih,
+               m.hpp,
+               m.omzet - j.diskon - m.hpp AS laba_kotor,
+               b.pembelian
+        FROM (SELECT COALESCE(SUM(pendapatan), 0) AS penjualan,
+                     COALESCE(SUM(ppn), 0) AS ppn,
+                     COALESCE(SUM(diskon), 0) AS diskon
+              FROM ringkasan_penjualan_harian
+              WHERE tanggal >= %(mulai)s AND tanggal < %(akhir)s) j,
+             (SELECT COALESCE(SUM(dp.qty * dp.harga_saat_penjualan), 0) AS omzet,
+                     COALESCE(ROUND(SUM(dp.qty * dp.hpp_satuan)), 0) AS hpp
+              FROM penjualan tp
+              JOIN detail_penjualan dp ON dp.penjualan_id = tp.penjualan_id
+              WHERE tp.tanggal_transaksi >= %(mulai)s AND tp.tanggal_transaksi < %(akhir)s) m,
+             (SELECT COALESCE(SUM(total_pembelian), 0) AS pembelian
+              FROM ringkasan_pembelian_harian
+              WHERE tanggal >= %(mulai)s AND tanggal < %(akhir)s) b
+    """, True),
+    "margin_produk": ("Omzet, HPP dan margin per produk", """
+        SELECT p.produk_id, p.nama_produk, p.kategori,
+               SUM(dp.qty) AS qty,
+               SUM(dp.qty * dp.harga_saat_penjualan) AS omzet,
+               ROUND(SUM(dp.qty * dp.hpp_satuan)) AS hpp,
+               SUM(dp.qty * dp.harga_saat_penjualan) - ROUND(SUM(dp.qty * dp.hpp_satuan)) AS margin
+        FROM penjualan tp
+        JOIN detail_penjualan dp ON dp.penjualan_id = tp.penjualan_id
+        JOIN produk p ON p.produk_id = dp.produk_id
+        WHERE tp.tanggal_transaksi >= %(mulai)s AND tp.tanggal_transaksi < %(akhir)s
+        GROUP BY p.produk_id, p.nama_produk, p.kategori
+        ORDER BY margin DESC
+    """, True),
+    "servis": ("Servis per teknisi", """
+        SELECT t.teknisi_id, t.nama, COUNT(s.servis_id) AS jumlah_servis,
+               COALESCE(SUM(s.biaya_servis), 0) AS pendapatan
+        FROM teknisi t
+        LEFT JOIN servis s
+            ON s.teknisi_id = t.teknisi_id
+            AND s.status_servis IN ('Selesai', 'Diambil')
+            AND s.tanggal_selesai >= %(mulai)s
+            AND s.tanggal_selesai < %(akhir)s
+        GROUP BY t.teknisi_id, t.nama
+        ORDER BY t.teknisi_id
+    """, True),
+    "barang_tidak_laku": ("Barang tidak laku", """
+        SELECT b.produk_id, p.nama_produk, b.terakhir_terjual, h.diskon,
+               h.harga_dasar, h.harga_akhir, p.stok
+        FROM barang_tidak_laku b
+        JOIN produk p ON p.produk_id = b.produk_id
+        JOIN v_harga_efektif h ON h.produk_id = b.produk_id
+        ORDER BY b.terakhir_terjual
+    """, False),
+    "stok_produk": ("Stok produk", """
+        SELECT produk_id, nama_produk, kategori, harga, stok
+        FROM produk
+        ORDER BY stok, produk_id
+    """, False),
+}
+
+FORMAT_EKSPOR = ["csv", "jsonl", "parquet"]
+
+# OID tipe PostgreSQL -> tipe Arrow; selain ini disimpan sebagai string
+_TIPE_ARROW = {
+    16: "bool_", 20: "int64", 21: "int16", 23: "int32",
+    700: "float32", 701: "float64", 1700: "float64",
+    1082: "date32", 1114: "timestamp",
+}
+
+def _skema_arrow(description):
+    kolom, ubah = [], []
+    for d in description:
+        nama_tipe = _TIPE_ARROW.get(d.type_code)
+        if nama_tipe == "timestamp":
+            tipe = pa.timestamp("us")
+        elif nama_tipe:
+            tipe = getattr(pa, nama_tipe)()
+        else:
+            tipe = pa.string()
+        kolom.append(pa.field(d.name, tipe))
+        # numeric datang sebagai Decimal, tipe lain yang tak dikenal dijadikan str
+        if d.type_code == 1700:
+            ubah.append(lambda v: None if v is None else float(v))
+        elif nama_tipe is None:
+            ubah.append(lambda v: None if v is None else str(v))
+        else:
+            ubah.append(None)
+    return pa.schema(kolom), ubah
+
+def _tulis_parquet(cur, sql, berkas):
+    with kursor_aliran(cur, "ekspor_parquet") as aliran:
+        aliran.execute(sql)
+        writer, skema, ubah = None, None, None
+        n = 0
+        try:
+            while True:
+                batch = aliran.fetchmany(ITERSIZE)
+                if not batch:
+                    break
+                if writer is None:
+                    skema, ubah = _skema_arrow(aliran.description)
+                    writer = pq.ParquetWriter(berkas, skema)
+                kolom = []
+                for i, f in enumerate(ubah):
+                    nilai = [r[i] for r in batch]
+                    kolom.append(nilai if f is None else [f(v) for v in nilai])
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(k, type=skema.field(i).type) for i, k in enumerate(kolom)],
+                    schema=skema
+                ))
+                n += len(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+    return n
+
+def ekspor_query(cur, sql, params, fmt, berkas):
+    """
+    Alirkan hasil query langsung ke berkas.
+    CSV/JSONL memakai COPY ... TO STDOUT (tanpa membuat tuple Python per baris),
+    Parquet memakai server-side cursor per batch. Mengembalikan jumlah baris.
+    """
+    sql = cur.mogrify(sql, params).decode().strip()
+    if fmt == "parquet":
+        if pq is None:
+            raise RuntimeError("pyarrow tidak terpasang; ekspor Parquet tidak tersedia.")
+        return _tulis_parquet(cur, sql, berkas)
+
+    if fmt == "csv":
+        copy = f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    elif fmt == "jsonl":
+        # CSV dengan quote/delimiter yang tak mungkin muncul di JSON ter-escape,
+        # supaya baris JSON ditulis apa adanya (format text akan menggandakan backslash)
+        copy = (f"COPY (SELECT row_to_json(_baris) FROM ({sql}) _baris) TO STDOUT "
+                f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+    else:
+        raise ValueError(f"Format tidak dikenal: {fmt}")
+
+    with open(berkas, "w", encoding="utf-8", newline="") as f:
+        cur.copy_expert(copy, f)
+    return cur.rowcount
+
+def ekspor_laporan(cur):
+    print("\n=== EKSPOR LAPORAN ===")
+    nama_laporan = list(EKSPOR_LAPORAN)
+    for i, nama in enumerate(nama_laporan, 1):
+        print(f"{i}. {EKSPOR_LAPORAN[nama][0]}")
+    try:
+        nama = nama_laporan[int(input("Pilih laporan: ").strip()) - 1]
+    except (ValueError, IndexError):
+        print("Pilihan tidak valid.")
+        return
+    judul, sql, pakai_periode = EKSPOR_LAPORAN[nama]
+
+    tersedia = [f for f in FORMAT_EKSPOR if f != "parquet" or pq is not None]
+    fmt = input(f"Format ({'/'.join(tersedia)}, default csv): ").strip().lower() or "csv"
+    if fmt not in tersedia:
+        print("Format tidak tersedia.")
+        return
+
+    params = {}
+    akhiran = ""
+    if pakai_periode:
+        periode = input_periode()
+        if not periode:
+            print("Periode tidak valid.")
+            return
+        params = {"mulai": periode[0], "akhir": periode[1]}
+        akhiran = "_" + periode[0].strftime("%Y%m%d")
+
+    default = f"{nama}{akhiran}.{fmt}"
+    berkas = input(f"Nama berkas (default {default}): ").strip() or default
+
+    mulai = time.perf_counter()
+    try:
+        n = ekspor_query(cur, sql, params, fmt, berkas)
+    except Exception as e:
+        cur.connection.rollback()
+        print("Gagal ekspor:", e)
+        return
+    print(colored(f"{judul}: {n} baris ditulis ke {berkas} "
+                  f"({time.perf_counter() - mulai:.2f} detik)", "green"))
+
+def ekspor_cli():
+    """
+    python "Projek FarmTech.py" --ekspor <laporan> <format> <berkas> [yyyy-mm-dd yyyy-mm-dd]
+    Tanggal akhir bersifat inklusif.
+    """
+    argumen = sys.argv[2:]
+    if len(argumen) < 3 or argumen[0] not in EKSPOR_LAPORAN or argumen[1] not in FORMAT_EKSPOR:
+        print(ekspor_cli.__doc__.strip())
+        print("Laporan:", ", ".join(EKSPOR_LAPORAN), "| Format:", ", ".join(FORMAT_EKSPOR))
+        return
+    nama, fmt, berkas = argumen[:3]
+    judul, sql, pakai_periode = EKSPOR_LAPORAN[nama]
+    params = {}
+    if pakai_periode:
+        if len(argumen) < 5:
+            print("Laporan ini butuh tanggal mulai dan akhir.")
+            return
+        params = {"mulai": date.fromisoformat(argumen[3]),
+                  "akhir": date.fromisoformat(argumen[4]) + timedelta(days=1)}
+
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    mulai = time.perf_counter()
+    try:
+        n = ekspor_query(cur, sql, params, fmt, berkas)
+    finally:
+        conn.rollback()
+        conn.close()
+    print(f"{judul}: {n} baris ditulis ke {berkas} ({time.perf_counter() - mulai:.2f} detik)")
+
+def benchmark_ekspor(jumlah_baris=1_000_000):
+    """
+    Bandingkan ekspor CSV lewat loop Python (fetch per baris + csv.writer)
+    dengan COPY TO STDOUT, pada tabel sementara berisi rincian penjualan sintetis.
+    """
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    print(f"Menyiapkan {jumlah_baris:,} baris detail penjualan sintetis...")
+    cur.execute("""
+        CREATE TEMP TABLE bench_detail AS
+        SELECT g / 3 AS penjualan_id,
+               TIMESTAMP '2024-01-01' + (g * INTERVAL '1 second' * (31536000.0 / %s)) AS tanggal_transaksi,
+               (g %% 25) + 1 AS produk_id,
+               'Produk ' || ((g %% 25) + 1) AS nama_produk,
+               (g %% 4) + 1 AS jumlah,
+               ((g %% 50) + 1) * 5000 AS harga_satuan
+        FROM generate_series(1, %s) g
+    """, (jumlah_baris, jumlah_baris))
+    sql = "SELECT * FROM bench_detail ORDER BY tanggal_transaksi"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        with kursor_aliran(cur, "bench_ekspor") as aliran, \
+                open(os.path.join(tmp, "loop.csv"), "w", newline="", encoding="utf-8") as f:
+            aliran.execute(sql)
+            tulis = csv.writer(f)
+            for r in aliran:
+                tulis.writerow(r)
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ekspor_query(cur, sql, {}, "csv", os.path.join(tmp, "copy.csv"))
+        t_copy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ekspor_query(cur, sql, {}, "jsonl", os.path.join(tmp, "copy.jsonl"))
+        t_jsonl = time.perf_counter() - t0
+
+    conn.rollback()
+    conn.close()
+    print(tabulate([
+        ["Loop Python -> CSV", f"{t_loop:.2f}"],
+        ["COPY -> CSV", f"{t_copy:.2f}"],
+        ["COPY -> JSONL", f"{t_jsonl:.2f}"],
+    ], headers=["Metode", "Detik"], tablefmt="grid"))
+    print(f"COPY CSV {t_loop / max(t_copy, 0.001):.1f}x lebih cepat dari loop Python.")
+
+# -------------------------
+# Impor massal (COPY -> staging -> validasi -> gabung)
+# -------------------------
+def _angka(kolom):
+    """Ekspresi SQL: teks kolom staging -> int, NULL jika bukan bilangan bulat."""
+    return f"(CASE WHEN {kolom} ~ '^[0-9]{{1,9}}$' THEN {kolom}::int END)"
+
+def _ganda(kolom):
+    """Kondisi SQL: nilai kolom muncul lebih dari sekali di berkas."""
+    return f"""s.baris IN (
+        SELECT baris FROM (
+            SELECT baris, COUNT(*) OVER (PARTITION BY {kolom}) AS n
+            FROM impor_stg WHERE {kolom} IS NOT NULL
+        ) d WHERE d.n > 1)"""
+
+# kolom: (nama, tipe, wajib, batas) -- teks: batas = panjang maks, int: batas = nilai minimum
+# aturan: (alasan, kondisi SQL atas baris staging `s` yang DITOLAK)
+# persiapan: SQL opsional sebelum validasi; gabung: SQL atas baris valid `s`
+IMPOR_DATA = {
+    "produk": {
+        "judul": "Produk",
+        "kolom": [
+            ("nama_produk", "teks", True, 100),
+            ("kategori", "teks", False, 50),
+            ("supplier_id", "int", True, 1),
+            ("harga", "int", True, 1),
+            ("harga_beli", "int", True, 1),
+            ("stok", "int", False, 0),
+            ("kode_barang", "teks", False, 50),
+        ],
+        "aturan": [
+            ("supplier tidak ditemukan",
+             f"{_angka('s.supplier_id')} IS NOT NULL AND NOT EXISTS "
+             f"(SELECT 1 FROM supplier x WHERE x.supplier_id = {_angka('s.supplier_id')})"),
+            ("harga jual lebih rendah dari harga beli",
+             f"{_angka('s.harga')} < {_angka('s.harga_beli')}"),
+            ("kode barang sudah dipakai produk lain",
+             "EXISTS (SELECT 1 FROM produk x WHERE x.kode_barang = s.kode_barang)"),
+            ("kode barang ganda di berkas", _ganda("kode_barang")),
+        ],
+        "gabung": """
+            INSERT INTO produk (supplier_id, nama_produk, kategori, harga, harga_beli,
+                                stok, tanggal_input, kode_barang)
+            SELECT s.supplier_id::int, s.nama_produk, s.kategori, s.harga::int,
+                   s.harga_beli::int, COALESCE(s.stok::int, 0), CURRENT_DATE, s.kode_barang
+            FROM impor_stg s
+            WHERE NOT EXISTS (SELECT 1 FROM impor_tolak t WHERE t.baris = s.baris)
+            ORDER BY s.baris
+        """,
+    },
+    "supplier": {
+        "judul": "Supplier",
+        "kolom": [
+            ("nama_supplier", "teks", True, 100),
+            ("alamat", "teks", False, 255),
+            ("no_hp", "teks", False, 20),
+        ],
+        "aturan": [],
+        "gabung": """
+            INSERT INTO supplier (nama_supplier, alamat, no_hp)
+            SELECT s.nama_supplier, s.alamat, s.no_hp
+            FROM impor_stg s
+            WHERE NOT EXISTS (SELECT 1 FROM impor_tolak t WHERE t.baris = s.baris)
+            ORDER BY s.baris
+        """,
+    },
+    "member": {
+        "judul": "Member",
+        "kolom": [
+            ("nama", "teks", True, 100),
+            ("no_hp", "teks", False, 20),
+            ("alamat", "teks", False, 255),
+        ],
+        "aturan": [
+            ("no HP sudah terdaftar",
+             "EXISTS (SELECT 1 FROM member x WHERE x.no_hp = s.no_hp)"),
+            ("no HP ganda di berkas", _ganda("no_hp")),
+        ],
+        "gabung": """
+            INSERT INTO member (nama, no_hp, alamat, total_transaksi)
+            SELECT s.nama, s.no_hp, s.alamat, 0
+            FROM impor_stg s
+            WHERE NOT EXISTS (SELECT 1 FROM impor_tolak t WHERE t.baris = s.baris)
+            ORDER BY s.baris
+        """,
+    },
+    "stok_awal": {
+        "judul": "Stok awal",
+        "kolom": [
+            ("produk_id", "int", False, 1),
+            ("kode_barang", "teks", False, 50),
+            ("stok", "int", True, 0),
+        ],
+        # kode barang -> produk_id sekali di awal, supaya aturan & gabung cukup join per id
+        "persiapan": """
+            UPDATE impor_stg s SET produk_id = p.produk_id::text
+            FROM produk p
+            WHERE s.produk_id IS NULL AND p.kode_barang = s.kode_barang
+        """,
+        "aturan": [
+            ("produk_id atau kode_barang wajib diisi",
+             "s.produk_id IS NULL AND s.kode_barang IS NULL"),
+            ("produk tidak ditemukan",
+             f"(s.produk_id IS NULL AND s.kode_barang IS NOT NULL) OR "
+             f"({_angka('s.produk_id')} IS NOT NULL AND NOT EXISTS "
+             f"(SELECT 1 FROM produk x WHERE x.produk_id = {_angka('s.produk_id')}))"),
+            ("produk ganda di berkas", _ganda("produk_id")),
+        ],
+        # kunci join lewat _angka: planner bisa mengevaluasi join sebelum filter impor_tolak
+        "gabung": f"""
+            UPDATE produk p SET stok = {_angka('s.stok')}
+            FROM impor_stg s
+            WHERE p.produk_id = {_angka('s.produk_id')}
+            AND NOT EXISTS (SELECT 1 FROM impor_tolak t WHERE t.baris = s.baris)
+        """,
+    },
+    # faktur supplier untuk restock; digabung lewat simpan_pembelian, bukan menu impor
+    "faktur": {
+        "judul": "Faktur restock",
+        "menu": False,
+        "kolom": [
+            ("produk_id", "int", False, 1),
+            ("kode_barang", "teks", False, 50),
+            ("nama_produk", "teks", False, 100),
+            ("qty", "int", True, 1),
+            ("harga_beli", "int", True, 1),
+        ],
+        # cocokkan baris ke produk: SKU dulu, lalu nama persis (hanya jika namanya unik)
+        "persiapan": """
+            UPDATE impor_stg s SET produk_id = p.produk_id::text
+            FROM produk p
+            WHERE s.produk_id IS NULL AND p.kode_barang = s.kode_barang;
+
+            UPDATE impor_stg s SET produk_id = p.produk_id::text
+            FROM (SELECT lower(nama_produk) AS nama, MIN(produk_id) AS produk_id
+                  FROM produk GROUP BY lower(nama_produk) HAVING COUNT(*) = 1) p
+            WHERE s.produk_id IS NULL AND lower(s.nama_produk) = p.nama;
+        """,
+        "aturan": [
+            ("produk tidak dikenali dari kode/nama",
+             "s.produk_id IS NULL"),
+            ("produk tidak ditemukan",
+             f"{_angka('s.produk_id')} IS NOT NULL AND NOT EXISTS "
+             f"(SELECT 1 FROM produk x WHERE x.produk_id = {_angka('s.produk_id')})"),
+        ],
+        "gabung": None,
+    },
+    "biaya_servis": {
+        "judul": "Biaya servis",
+        "menu": False,
+        "kolom": [
+            ("servis_id", "int", True, 1),
+            ("biaya_servis", "int", True, 0),
+        ],
+        "aturan": [
+            ("servis tidak ditemukan",
+             f"NOT EXISTS (SELECT 1 FROM servis x WHERE x.servis_id = {_angka('s.servis_id')})"),
+            ("servis_id ganda dalam berkas",
+             f"s.baris > (SELECT MIN(d.baris) FROM impor_stg d "
+             f"WHERE {_angka('d.servis_id')} = {_angka('s.servis_id')})"),
+        ],
+        "gabung": None,
+    },
+}
+
+def _baca_header(berkas):
+    """Header CSV dan delimiternya (',' atau ';' seperti ekspor Excel lokal)."""
+    with open(berkas, encoding="utf-8-sig", newline="") as f:
+        baris = f.readline()
+    delim = ";" if baris.count(";") > baris.count(",") else ","
+    header = next(csv.reader([baris], delimiter=delim), [])
+    return [h.strip().lower() for h in header], delim
+
+def _xlsx_ke_csv(berkas, tujuan):
+    """Salin sheet pertama XLSX ke CSV secara streaming (read_only)."""
+    wb = openpyxl.load_workbook(berkas, read_only=True, data_only=True)
+    try:
+        with open(tujuan, "w", encoding="utf-8", newline="") as f:
+            tulis = csv.writer(f)
+            for row in wb.worksheets[0].iter_rows(values_only=True):
+                if all(v is None for v in row):
+                    continue
+                tulis.writerow(["" if v is None else v for v in row])
+    finally:
+        wb.close()
+
+def muat_impor(cur, jenis, berkas):
+    """
+    COPY berkas ke tabel staging lalu validasi set-wise.
+    Tidak commit: pemanggil memutuskan gabung_impor + commit atau rollback.
+    Mengembalikan (jumlah_baris, jumlah_ditolak).
+    """
+    spec = IMPOR_DATA[jenis]
+    kolom = {k[0]: k for k in spec["kolom"]}
+
+    if berkas.lower().endswith(".xlsx"):
+        if openpyxl is None:
+            raise RuntimeError("openpyxl tidak terpasang; simpan berkas sebagai CSV.")
+        tmp = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+        tmp.close()
+        try:
+            _xlsx_ke_csv(berkas, tmp.name)
+            return muat_impor(cur, jenis, tmp.name)
+        finally:
+            os.unlink(tmp.name)
+
+    header, delim = _baca_header(berkas)
+    asing = [h for h in header if h not in kolom]
+    if asing:
+        raise ValueError(f"Kolom tidak dikenal: {', '.join(asing)}")
+    kurang = [k for k, (_, _, wajib, _) in kolom.items() if wajib and k not in header]
+    if kurang:
+        raise ValueError(f"Kolom wajib tidak ada: {', '.join(kurang)}")
+
+    # semua kolom staging TEXT supaya baris rusak tetap masuk dan bisa dilaporkan;
+    # nomor baris mulai 2 = nomor baris di berkas (baris 1 header)
+    cur.execute("DROP TABLE IF EXISTS impor_stg, impor_tolak")
+    cur.execute(
+        "CREATE TEMP TABLE impor_stg ("
+        "baris BIGINT GENERATED BY DEFAULT AS IDENTITY (START WITH 2) PRIMARY KEY, "
+        + ", ".join(f"{k} TEXT" for k in kolom)
+        + ") ON COMMIT DROP"
+    )
+    cur.execute("CREATE TEMP TABLE impor_tolak (baris BIGINT, alasan TEXT) ON COMMIT DROP")
+
+    with open(berkas, encoding="utf-8-sig", newline="") as f:
+        cur.copy_expert(
+            f"COPY impor_stg ({', '.join(header)}) FROM STDIN "
+            f"WITH (FORMAT csv, HEADER, DELIMITER '{delim}')", f
+        )
+    cur.execute("UPDATE impor_stg SET " + ", ".join(f"{k} = NULLIF(btrim({k}), '')" for k in kolom))
+    cur.execute("SELECT COUNT(*) FROM impor_stg")
+    total = cur.fetchone()[0]
+
+    if spec.get("persiapan"):
+        cur.execute(spec["persiapan"])
+
+    aturan = []
+    for nama, tipe, wajib, batas in spec["kolom"]:
+        if wajib:
+            aturan.append((f"{nama} wajib diisi", f"s.{nama} IS NULL"))
+        if tipe == "teks":
+            aturan.append((f"{nama} lebih dari {batas} karakter", f"length(s.{nama}) > {batas}"))
+        else:
+            aturan.append((f"{nama} bukan bilangan bulat",
+                           f"s.{nama} IS NOT NULL AND {_angka('s.' + nama)} IS NULL"))
+            aturan.append((f"{nama} minimal {batas}", f"{_angka('s.' + nama)} < {batas}"))
+    aturan += spec["aturan"]
+
+    for alasan, kondisi in aturan:
+        cur.execute(f"INSERT INTO impor_tolak SELECT s.baris, %s FROM impor_stg s WHERE {kondisi}",
+                    (alasan,))
+    cur.execute("CREATE INDEX ON impor_tolak (baris)")
+    cur.execute("ANALYZE impor_tolak")
+    cur.execute("SELECT COUNT(DISTINCT baris) FROM impor_tolak")
+    return total, cur.fetchone()[0]
+
+def gabung_impor(cur, jenis):
+    """Masukkan baris valid ke tabel tujuan dalam transaksi yang sedang berjalan."""
+    tandai_mutasi(cur, "opname", f"impor {jenis}")
+    cur.execute("SET LOCAL farmtech.impor_massal = 'on'")
+    cur.execute(IMPOR_DATA[jenis]["gabung"])
+    n = cur.rowcount
+    cur.execute("SET LOCAL farmtech.impor_massal = 'off'")
+    cur.execute("SELECT pg_notify('katalog_produk', '*')")
+    return n
+
+SQL_TOLAK = """
+    SELECT s.*, t.alasan
+    FROM (SELECT baris, string_agg(alasan, '; ') AS alasan
+          FROM impor_tolak GROUP BY baris) t
+    JOIN impor_stg s ON s.baris = t.baris
+    ORDER BY s.baris
+"""
+
+def tampilkan_tolak(cur, batas=10):
+    cur.execute(SQL_TOLAK + " LIMIT %s", (batas,))
+    rows = cur.fetchall()
+    headers = [d.name for d in cur.description]
+    print(tabulate([[("-" if v is None else v) for v in r] for r in rows],
+                   headers=headers, tablefmt="grid"))
+
+def simpan_tolak(cur, berkas):
+    """Tulis semua baris yang ditolak (beserta alasan) ke CSV untuk diperbaiki."""
+    with open(berkas, "w", encoding="utf-8", newline="") as f:
+        cur.copy_expert(f"COPY ({SQL_TOLAK}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+
+def _berkas_tolak(berkas):
+    return os.path.splitext(berkas)[0] + "_ditolak.csv"
+
+def impor_massal(conn, cur):
+    print("\n=== IMPOR MASSAL ===")
+    jenis_list = [j for j in IMPOR_DATA if IMPOR_DATA[j].get("menu", True)]
+    for i, jenis in enumerate(jenis_list, 1):
+        kolom = ", ".join(k[0] + ("*" if k[2] else "") for k in IMPOR_DATA[jenis]["kolom"])
+        print(f"{i}. {IMPOR_DATA[jenis]['judul']:<10} kolom: {kolom}")
+    print("(* = wajib; baris pertama berkas adalah nama kolom)")
+    try:
+        jenis = jenis_list[int(input("Pilih data: ").strip()) - 1]
+    except (ValueError, IndexError):
+        print("Pilihan tidak valid.")
+        return
+
+    berkas = input("Path berkas CSV/XLSX: ").strip().strip('"')
+    if not os.path.isfile(berkas):
+        print("Berkas tidak ditemukan.")
+        return
+
+    try:
+        mulai = time.perf_counter()
+        total, ditolak = muat_impor(cur, jenis, berkas)
+        print(f"\n{total} baris dibaca, {total - ditolak} valid, {ditolak} ditolak "
+              f"({time.perf_counter() - mulai:.2f} detik).")
+        if ditolak:
+            tampilkan_tolak(cur)
+            keluar = _berkas_tolak(berkas)
+            simpan_tolak(cur, keluar)
+            print(f"Semua baris yang ditolak disimpan di {keluar}")
+        if total == ditolak:
+            conn.rollback()
+            print("Tidak ada baris valid untuk disimpan.")
+            return
+        if input(f"Simpan {total - ditolak} baris valid? (y/n): ").lower() != "y":
+            conn.rollback()
+            print("Impor dibatalkan.")
+            return
+        n = gabung_impor(cur, jenis)
+        conn.commit()
+        print(colored(f"{n} baris {IMPOR_DATA[jenis]['judul'].lower()} berhasil diimpor.", "green"))
+    except Exception as e:
+        conn.rollback()
+        print("Gagal impor:", e)
+
+def impor_cli():
+    """
+    python "Projek FarmTech.py" --impor <produk|supplier|member|stok_awal> <berkas.csv|.xlsx>
+    Baris valid langsung disimpan; baris ditolak ditulis ke <berkas>_ditolak.csv.
+    """
+    argumen = sys.argv[2:]
+    if (len(argumen) < 2 or argumen[0] not in IMPOR_DATA
+            or not IMPOR_DATA[argumen[0]].get("menu", True)):
+        print(impor_cli.__doc__.strip())
+        return
+    jenis, berkas = argumen[:2]
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    try:
+        mulai = time.perf_counter()
+        total, ditolak = muat_impor(cur, jenis, berkas)
+        if ditolak:
+            simpan_tolak(cur, _berkas_tolak(berkas))
+        n = gabung_impor(cur, jenis)
+        conn.commit()
+        print(f"{total} baris dibaca, {n} diimpor, {ditolak} ditolak "
+              f"({time.perf_counter() - mulai:.2f} detik).")
+        if ditolak:
+            print(f"Rincian penolakan: {_berkas_tolak(berkas)}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def benchmark_impor(jumlah_baris=100_000):
+    """
+    Impor produk sintetis (1% sengaja salah) lewat COPY + validasi set-wise,
+    lalu rollback supaya data asli tidak berubah.
+    """
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(supplier_id) FROM supplier")
+    supplier_id = cur.fetchone()[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        berkas = os.path.join(tmp, "produk.csv")
+        with open(berkas, "w", encoding="utf-8", newline="") as f:
+            tulis = csv.writer(f)
+            tulis.writerow(["nama_produk", "kategori", "supplier_id", "harga", "harga_beli", "stok", "kode_barang"])
+            for i in range(jumlah_baris):
+                harga_beli = 10000 + i % 500 * 100
+                harga = harga_beli - 1 if i % 100 == 0 else harga_beli * 5 // 4
+                tulis.writerow([f"Produk Impor {i}", "Impor", supplier_id, harga, harga_beli,
+                                i % 50, f"IMP{i:08d}"])
+
+        t0 = time.perf_counter()
+        total, ditolak = muat_impor(cur, "produk", berkas)
+        t_muat = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        n = gabung_impor(cur, "produk")
+        t_gabung = time.perf_counter() - t0
+
+    conn.rollback()
+    conn.close()
+    print(tabulate([
+        ["COPY + validasi", f"{total:,} baris, {ditolak:,} ditolak", f"{t_muat:.2f}"],
+        ["Gabung ke produk", f"{n:,} baris", f"{t_gabung:.2f}"],
+    ], headers=["Tahap", "Hasil", "Detik"], tablefmt="grid"))
+
+# -------------------------
+# Job terjadwal
+# -------------------------
+# Tiap job dijalankan per `interval` detik ATAU sekali sehari setelah `jam` (HH:MM).
+# Jadwal dicek terhadap log_job, jadi beberapa terminal FarmTech yang berjalan
+# bersamaan tidak menjalankan job yang sama dua kali (ditambah advisory lock).
+JADWAL_JOB = {
+    "barang_tidak_laku": {"fungsi": refresh_barang_tidak_laku, "interval": None, "jam": "01:00"},
+    "snapshot_stok": {"fungsi": buat_snapshot_stok, "interval": None, "jam": "00:10"},
+}
+KUNCI_JOB = 20252
+CEK_JOB_SETIAP = 30   # detik
+PENJADWAL = None
+
+def job_terakhir(cur, nama):
+    """(mulai, durasi_ms) eksekusi sukses terakhir job, atau None."""
+    cur.execute("""
+        SELECT mulai, durasi_ms FROM log_job
+        WHERE nama_job = %s AND status = 'sukses'
+        ORDER BY mulai DESC
+        LIMIT 1
+    """, (nama,))
+    return cur.fetchone()
+
+def job_jatuh_tempo(cur, nama, sekarang=None):
+    jadwal = JADWAL_JOB[nama]
+    sekarang = sekarang or datetime.now()
+    terakhir = job_terakhir(cur, nama)
+    if terakhir is None:
+        return True
+    if jadwal.get("interval"):
+        return (sekarang - terakhir[0]).total_seconds() >= jadwal["interval"]
+    jam, menit = map(int, jadwal["jam"].split(":"))
+    batas = sekarang.replace(hour=jam, minute=menit, second=0, microsecond=0)
+    if batas > sekarang:
+        batas -= timedelta(days=1)
+    return terakhir[0] < batas
+
+def jalankan_job(conn, nama, paksa=False):
+    """
+    Jalankan satu job dan catat durasinya di log_job.
+    Tanpa `paksa`, jatuh tempo dicek ulang setelah kunci didapat: terminal lain
+    bisa saja baru selesai menjalankannya.
+    Return (status, baris, durasi_ms), atau None jika job sedang dijalankan
+    proses lain atau belum jatuh tempo.
+    """
+    fungsi = JADWAL_JOB[nama]["fungsi"]
+    kunci = list(JADWAL_JOB).index(nama)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (KUNCI_JOB, kunci))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+        tempo = paksa or job_jatuh_tempo(cur, nama)
+        conn.commit()
+        if not tempo:
+            return None
+
+        mulai = datetime.now()
+        t0 = time.perf_counter()
+        try:
+            baris = fungsi(cur)
+            conn.commit()
+            status, pesan = "sukses", None
+        except Exception as e:
+            conn.rollback()
+            status, baris, pesan = "gagal", None, str(e)
+        durasi = int((time.perf_counter() - t0) * 1000)
+
+        cur.execute("""
+            INSERT INTO log_job (nama_job, mulai, selesai, durasi_ms, status, baris, pesan)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (nama, mulai, datetime.now(), durasi, status, baris, pesan))
+        conn.commit()
+        return status, baris, durasi
+    finally:
+        try:
+            cur.execute("SELECT pg_advisory_unlock(%s, %s)", (KUNCI_JOB, kunci))
+            conn.commit()
+        except KONEKSI_PUTUS:
+            pass
+        cur.close()
+
+class PenjadwalJob:
+    """
+    Thread latar yang menjalankan JADWAL_JOB dengan koneksi sendiri.
+    Tidak mencetak apa pun (menu sedang dipakai); hasil dan galat ada di log_job.
+    """
+    def __init__(self, cek_setiap=CEK_JOB_SETIAP):
+        self.cek_setiap = cek_setiap
+        self._henti = threading.Event()
+        self._thread = None
+
+    def mulai(self):
+        self._thread = threading.Thread(target=self._loop, name="penjadwal-job", daemon=True)
+        self._thread.start()
+
+    def hentikan(self):
+        self._henti.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self):
+        conn = None
+        while not self._henti.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = buka_koneksi()
+                for nama in JADWAL_JOB:
+                    if self._henti.is_set():
+                        break
+                    cur = conn.cursor()
+                    tempo = job_jatuh_tempo(cur, nama)
+                    conn.rollback()
+                    cur.close()
+                    if tempo:
+                        # dicek ulang di dalam kunci oleh jalankan_job
+                        jalankan_job(conn, nama)
+            except Exception:
+                # jangan sampai thread mati; koneksi yang putus dibuka ulang di
+                # putaran berikutnya, selain itu cukup rollback
+                if not koneksi_putus(conn):
+                    conn.rollback()
+            self._henti.wait(self.cek_setiap)
+        if conn is not None and not conn.closed:
+            conn.close()
+
+def status_job(conn, cur):
+    print("\n=== STATUS JOB TERJADWAL ===")
+    cur.execute("""
+        SELECT DISTINCT ON (nama_job) nama_job, mulai, durasi_ms, status, baris, pesan
+        FROM log_job
+        ORDER BY nama_job, mulai DESC
+    """)
+    terakhir = {r[0]: r for r in cur.fetchall()}
+    rows = []
+    for i, (nama, jadwal) in enumerate(JADWAL_JOB.items(), 1):
+        r = terakhir.get(nama)
+        rows.append([
+            i, nama,
+            f"tiap {jadwal['interval']} dtk" if jadwal.get("interval") else f"harian {jadwal['jam']}",
+            r[1].strftime("%d-%m-%Y %H:%M") if r else "-",
+            f"{r[2]} ms" if r else "-",
+            (r[3] + (f": {r[5][:40]}" if r[5] else "")) if r else "-",
+            r[4] if r and r[4] is not None else "-",
         ])
+    print(tabulate(rows, headers=["No", "Job", "Jadwal", "Terakhir", "Durasi", "Status", "Baris"],
+                   tablefmt="grid"))
+    print("Penjadwal latar:", "aktif" if PENJADWAL and PENJADWAL._thread and PENJADWAL._thread.is_alive()
+          else "tidak aktif")
 
-    print(tabulate(
-        tabel,
-        headers=["ID","Produk","Kategori","Harga","Stok","Status"],
-        tablefmt="grid"
-    ))
+    pilih = input("\nNomor job untuk dijalankan sekarang (Enter = kembali): ").strip()
+    if not pilih:
+        return
+    try:
+        nama = list(JADWAL_JOB)[int(pilih) - 1]
+    except (ValueError, IndexError):
+        print("Pilihan tidak valid.")
+        return
+    hasil = jalankan_job(conn, nama, paksa=True)
+    if hasil is None:
+        print("Job sedang dijalankan proses lain.")
+    else:
+        print(f"{nama}: {hasil[0]}, {hasil[1]} baris, {hasil[2]} ms")
+
+def jalankan_job_cli():
+    """
+    python "Projek FarmTech.py" --jalankan-job [nama]   sekali jalan (mis. dari cron)
+    python "Projek FarmTech.py" --penjadwal             penjadwal saja, tanpa menu
+    """
+    conn = buka_koneksi()
+    try:
+        nama_list = sys.argv[2:] or list(JADWAL_JOB)
+        for nama in nama_list:
+            if nama not in JADWAL_JOB:
+                print(f"Job tidak dikenal: {nama}. Pilihan: {', '.join(JADWAL_JOB)}")
+                continue
+            hasil = jalankan_job(conn, nama, paksa=True)
+            print(f"{nama}: " + ("sedang berjalan di proses lain" if hasil is None
+                                 else f"{hasil[0]}, {hasil[1]} baris, {hasil[2]} ms"))
+    finally:
+        conn.close()
+
+def penjadwal_cli():
+    penjadwal = PenjadwalJob()
+    penjadwal.mulai()
+    print(f"Penjadwal berjalan (cek tiap {penjadwal.cek_setiap} detik). Ctrl+C untuk berhenti.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        penjadwal.hentikan()
 
 # -------------------------
 # Menus per role
@@ -2254,7 +6238,8 @@ def menu_kasir(conn, cur, user):
         print("1. Daftarkan Member")
         print("2. Transaksi Penjualan")
         print("3. Transaksi Servis")
-        print("4. Logout")
+        print("4. Cek Harga")
+        print("5. Logout")
         c = input("Pilih: ").strip()
         clear_screen()
         if c == "1":
@@ -2270,6 +6255,9 @@ def menu_kasir(conn, cur, user):
             pause()
             clear_screen()
         elif c == "4":
+            cek_harga(cur)
+            clear_screen()
+        elif c == "5":
             clear_screen()
             break
         else:
@@ -2292,7 +6280,9 @@ def menu_admin(conn, cur, user):
         print("5. Kelola Supplier")
         print("6. Laporan Stok Produk")
         print("7. Restock / Pembelian")
-        print("8. Logout")
+        print("8. Impor Massal (CSV/XLSX)")
+        print("9. Saran Pemesanan (ramalan)")
+        print("10. Logout")
 
         c = input("Pilih: ").strip()
         clear_screen()
@@ -2321,6 +6311,14 @@ def menu_admin(conn, cur, user):
             pause()
 
         elif c == "8":
+            impor_massal(conn, cur)
+            pause()
+
+        elif c == "9":
+            saran_pemesanan(cur)
+            pause()
+
+        elif c == "10":
             break
 
         else:
@@ -2338,7 +6336,12 @@ def menu_owner(conn, cur, user):
         print("4. Laporan Analisis (periode)")
         print("5. Laporan Servis (Periode)")
         print("6. Laporan Barang Tidak Laku")
-        print("7. Logout")
+        print("7. Status Pool Koneksi")
+        print("8. Ekspor Laporan (CSV/JSONL/Parquet)")
+        print("9. Status Job Terjadwal")
+        print("10. Aturan Markdown Barang Tidak Laku")
+        print("11. Istilah Keluhan Servis per Jenis Alat")
+        print("12. Logout")
         c = input("Pilih: ").strip()
         clear_screen()
 
@@ -2359,6 +6362,20 @@ def menu_owner(conn, cur, user):
             laporan_barang_tidak_laku(cur)
             pause()
         elif c == "7":
+            tampilkan_status_pool()
+            pause()
+        elif c == "8":
+            ekspor_laporan(cur)
+            pause()
+        elif c == "9":
+            status_job(conn, cur)
+            pause()
+        elif c == "10":
+            kelola_aturan_markdown(conn, cur)
+        elif c == "11":
+            laporan_istilah_keluhan(cur)
+            pause()
+        elif c == "12":
             break
         else:
             print("Pilihan tidak valid.")
@@ -2367,14 +6384,47 @@ def menu_owner(conn, cur, user):
 # -------------------------
 # Main
 # -------------------------
+def jalankan_sesi(user):
+    """
+    Jalankan menu sesuai role dengan koneksi pinjaman dari pool.
+    Jika koneksi putus, koneksi diganti dan menu dibuka lagi tanpa login ulang.
+    """
+    role = user["role"].lower()
+    while True:
+        conn = None
+        try:
+            with POOL.pinjam() as (conn, cur):
+                if role == "kasir":
+                    menu_kasir(conn, cur, user)
+                elif role == "admin":
+                    menu_admin(conn, cur, user)
+                elif role == "owner":
+                    menu_owner(conn, cur, user)
+                else:
+                    print("Role tidak dikenali. Hubungi admin.")
+            return
+        except KONEKSI_PUTUS as e:
+            if koneksi_putus(conn):
+                print("Koneksi database terputus, menyambung ulang...", e)
+            else:
+                # deadlock, query dibatalkan, dll.: koneksi masih dipakai lagi
+                print("Kesalahan database:", e)
+            pause()
+
 def main():
+    global POOL, PENJADWAL
     try:
-        conn = connect_db()
-        cur = conn.cursor()
+        POOL = PoolKoneksi()
+        print("Berhasil koneksi ke database.")
+        with POOL.pinjam() as (conn, cur):
+            jalankan_migrasi(conn)
     except Exception as e:
         print("Gagal koneksi DB:", e)
         sys.exit(1)
 
+    PENJADWAL = PenjadwalJob()
+    PENJADWAL.mulai()
+
     clear_screen()
     print("Selamat datang di FarmTech")
 
@@ -2383,8 +6433,17 @@ def main():
         print("\n=== LOGIN ===")
         username = input("\nUsername: ").strip()
         password = getpass("Password: ").strip()
-        
-        user = fetch_user_with_role(cur, username, password)
+
+        conn = None
+        try:
+            with POOL.pinjam() as (conn, cur):
+                user = fetch_user_with_role(cur, username, password)
+        except KONEKSI_PUTUS as e:
+            if koneksi_putus(conn):
+                print("Koneksi database terputus, silakan coba lagi.", e)
+            else:
+                print("Kesalahan database:", e)
+            continue
         if not user:
             print("Login gagal. Periksa kredensial.")
             if input("Coba lagi? (y/n): ").lower() != "y":
@@ -2396,22 +6455,147 @@ def main():
         clear_screen()
         print(f"Sukses login sebagai '{user['role']}' (user: {user['username']})")
 
-        if user["role"].lower() == "kasir":
-            menu_kasir(conn, cur, user)
-        elif user["role"].lower() == "admin":
-            menu_admin(conn, cur, user)
-        elif user["role"].lower() == "owner":
-            menu_owner(conn, cur, user)
-        else:
-            print("Role tidak dikenali. Hubungi admin.")
+        jalankan_sesi(user)
         if input("\nLogin lagi? (y/n): ").lower() != "y":
             clear_screen()
             break
 
-    cur.close()
-    conn.close()
+    PENJADWAL.hentikan()
+    POOL.tutup_semua()
     show_banner()
     print("Keluar. Sampai jumpa.")
 
+def _stres_stok_worker(args):
+    kasir_id, produk, jumlah_tx, seed = args
+    import random
+    rnd = random.Random(seed)
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    berhasil, ditolak, ids = 0, 0, []
+    for _ in range(jumlah_tx):
+        pilihan = rnd.sample(produk, rnd.randint(1, len(produk)))
+        cart = [{"produk_id": pid, "qty": rnd.randint(1, 3), "harga": harga}
+                for pid, harga in pilihan]
+        subtotal = sum(it["harga"] * it["qty"] for it in cart)
+        penjualan_id, _ = simpan_penjualan(conn, cur, kasir_id, None, cart,
+                                           subtotal, 0, 0, subtotal)
+        if penjualan_id:
+            berhasil += 1
+            ids.append(penjualan_id)
+        else:
+            ditolak += 1
+    conn.close()
+    return berhasil, ditolak, ids
+
+def uji_stres_stok(proses=8, transaksi=40, stok_awal=50, jumlah_produk=3):
+    """
+    Uji stres: banyak proses checkout bersamaan memperebutkan beberapa produk
+    dengan stok terbatas. Lulus jika stok tidak pernah negatif dan
+    stok_awal - stok_akhir == jumlah unit yang tercatat terjual.
+    Penjualan uji dihapus lagi setelah selesai; produk uji (kategori 'Uji') tidak
+    bisa dihapus karena punya riwayat mutasi, jadi dipakai ulang dan stoknya dinolkan.
+    """
+    import multiprocessing
+
+    conn = buka_koneksi()
+    cur = conn.cursor()
+    cur.execute("SELECT pegawai_id FROM pegawai ORDER BY pegawai_id LIMIT 1")
+    kasir = cur.fetchone()
+    cur.execute("SELECT supplier_id FROM supplier ORDER BY supplier_id LIMIT 1")
+    supplier = cur.fetchone()
+    if not kasir or not supplier:
+        print("Butuh minimal satu pegawai dan satu supplier untuk uji stres.")
+        conn.close()
+        return False
+
+    produk = []
+    tandai_mutasi(cur, "penyesuaian", "persiapan uji stres")
+    for i in range(jumlah_produk):
+        nama = f"UJI STRES {i + 1}"
+        cur.execute("""
+            UPDATE produk SET stok = %s, harga = 1000, harga_beli = 500
+            WHERE kategori = 'Uji' AND nama_produk = %s
+            RETURNING produk_id, harga
+        """, (stok_awal, nama))
+        baris = cur.fetchone()
+        if baris is None:
+            cur.execute("""
+                INSERT INTO produk (supplier_id, nama_produk, kategori, harga, harga_beli, stok, tanggal_input)
+                VALUES (%s, %s, 'Uji', 1000, 500, %s, CURRENT_DATE)
+                RETURNING produk_id, harga
+            """, (supplier[0], nama, stok_awal))
+            baris = cur.fetchone()
+        produk.append(baris)
+    conn.commit()
+    ids_produk = [p[0] for p in produk]
+
+    mulai = time.perf_counter()
+    with multiprocessing.Pool(proses) as pool:
+        hasil = pool.map(_stres_stok_worker,
+                         [(kasir[0], produk, transaksi, i) for i in range(proses)])
+    durasi = time.perf_counter() - mulai
+
+    berhasil = sum(h[0] for h in hasil)
+    ditolak = sum(h[1] for h in hasil)
+    penjualan_ids = [pid for h in hasil for pid in h[2]]
+
+    cur.execute("""
+        SELECT p.produk_id, p.stok, COALESCE(SUM(dp.qty), 0)
+        FROM produk p
+        LEFT JOIN detail_penjualan dp ON dp.produk_id = p.produk_id
+        WHERE p.produk_id = ANY(%s)
+        GROUP BY p.produk_id, p.stok
+        ORDER BY p.produk_id
+    """, (ids_produk,))
+    rows = cur.fetchall()
+    lulus = all(stok >= 0 and stok_awal - stok == terjual for _, stok, terjual in rows)
+
+    print(tabulate([[r[0], stok_awal, r[1], r[2]] for r in rows],
+                   headers=["Produk", "Stok Awal", "Stok Akhir", "Terjual"], tablefmt="grid"))
+    print(f"{proses} proses x {transaksi} transaksi dalam {durasi:.2f} detik "
+          f"({(berhasil + ditolak) / durasi:.0f} tx/detik)")
+    print(f"Berhasil: {berhasil}, ditolak karena stok: {ditolak}")
+    print("LULUS: stok tidak pernah negatif." if lulus else "GAGAL: stok tidak konsisten!")
+
+    # bersihkan data uji
+    cur.execute("DELETE FROM detail_penjualan WHERE produk_id = ANY(%s)", (ids_produk,))
+    cur.execute("DELETE FROM penjualan WHERE penjualan_id = ANY(%s)", (penjualan_ids,))
+    cur.execute("DELETE FROM penjualan_produk_harian WHERE produk_id = ANY(%s)", (ids_produk,))
+    tandai_mutasi(cur, "penyesuaian", "akhir uji stres")
+    cur.execute("""
+        UPDATE produk SET stok = 0, terakhir_terjual = NULL, total_terjual = 0
+        WHERE produk_id = ANY(%s)
+    """, (ids_produk,))
+    conn.commit()
+    conn.close()
+    return lulus
+
+# perintah tambahan: python "Projek FarmTech.py" --bench-checkout
+PERINTAH_CLI = {
+    "--bench-checkout": benchmark_checkout,
+    "--stres-stok": uji_stres_stok,
+    "--migrasi": migrasi_cli,
+    "--cek-indeks": cek_indeks_cli,
+    "--bench-periode": benchmark_periode,
+    "--rekap-ringkasan": rekap_ringkasan_cli,
+    "--ekspor": ekspor_cli,
+    "--bench-ekspor": benchmark_ekspor,
+    "--impor": impor_cli,
+    "--bench-impor": benchmark_impor,
+    "--snapshot-stok": snapshot_stok_cli,
+    "--cek-stok": cek_stok_cli,
+    "--cek-terjual": cek_terjual_cli,
+    "--bench-forecast": benchmark_forecast,
+    "--jalankan-job": jalankan_job_cli,
+    "--penjadwal": penjadwal_cli,
+    "--bench-markdown": benchmark_markdown,
+    "--bench-teknisi": benchmark_antrian_teknisi,
+    "--bench-servis": benchmark_laporan_servis,
+    "--bench-cari-servis": benchmark_cari_keluhan,
+}
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] in PERINTAH_CLI:
+        PERINTAH_CLI[sys.argv[1]]()
+    else:
+        main()